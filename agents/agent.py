@@ -149,13 +149,13 @@
 # agents/agent_enhanced_metrics.py - Better metrics integration
 
 import asyncio
+import dataclasses
 import logging
 import os
 from dotenv import load_dotenv
 from time import perf_counter
 import redis.asyncio as aioredis
 import json
-import os
 from datetime import datetime
 
 from livekit import rtc, api
@@ -170,13 +170,18 @@ from livekit.agents import (
 from livekit.plugins import deepgram, openai, silero
 
 from tools.llm_functions import CallAgent
-from guardrails.guardrails import GuardrailsLLM
+from tools.sip_utils import wait_for_call_answer
+from tools.http_client import tool_http, ToolCallMetric, TurnLatencyBudget, current_call_scope, current_turn_budget
+from providers.provider_pool import ProviderPool
+from guardrails.guardrails import GuardrailsLLM, GuardrailsMetrics
+from guardrails.engine import GuardrailsEngine
+from guardrails.verdict_cache import VerdictCache
 from tts.tts import __get_tts
 from prompts import get_prompt
 from agent_assist.utils import *
 
 # Agent-Assist-changes
-from agent_assist.redis_functions import r, publish_transcript
+from agent_assist.redis_functions import r, publish_transcript, publish_partial_transcript, end_room_history, read_room_history
 
 # Enhanced metrics integration
 import sys
@@ -185,6 +190,8 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 try:
     from config.enhanced_metrics_config import EnhancedMetricsConfig
     from metrics.enhanced_recorder import EnhancedMetricsRecorder
+    from metrics.flusher import MetricsFlusher
+    from metrics.turn_tracer import TurnTracer
     ENHANCED_METRICS_AVAILABLE = True
 except ImportError:
     ENHANCED_METRICS_AVAILABLE = False
@@ -200,8 +207,17 @@ client_name = os.getenv("CLIENT_NAME", "default_client")
 logger = logging.getLogger("enhanced-agent-metrics")
 logger.setLevel(logging.INFO)
 
+# Tuned VAD settings, loaded once per worker process in prewarm_fnc
+VAD_OPTIONS = {
+    "min_silence_duration": 0.1,
+    "min_speech_duration": 0.1,
+    "max_buffered_speech": 5.0,
+}
+
 # Global variables for metrics
 enhanced_recorder = None
+metrics_flusher = None
+turn_tracer = None
 current_call_id = None
 
 
@@ -243,7 +259,7 @@ async def publish_post_call_event(call_id: str, status: str = "completed", metad
         return False
 
 async def entrypoint(ctx: JobContext):
-    global enhanced_recorder, current_call_id
+    global enhanced_recorder, metrics_flusher, turn_tracer, current_call_id
     
     if not outbound_trunk_id or not outbound_trunk_id.startswith("ST_"):
         raise ValueError("SIP_OUTBOUND_TRUNK_ID is not set properly")
@@ -266,138 +282,293 @@ async def entrypoint(ctx: JobContext):
                     client_name=client_name
                 )
                 logger.info(f"📊 Enhanced metrics tracking started: {current_call_id}")
+                
+                metrics_flusher = MetricsFlusher(
+                    enhanced_recorder,
+                    store_metrics_from_event,
+                    flush_interval_ms=config.flush_interval_ms,
+                    max_batch_events=config.flush_max_events,
+                    max_queue_size=config.flush_queue_size,
+                )
+                metrics_flusher.start()
+                turn_tracer = TurnTracer()
+                tool_http.add_listener(on_tool_metric)
+                ctx.add_shutdown_callback(remove_tool_metric_listener)
                 logger.info(f"📈 Dashboard: http://localhost:{config.monitoring_port}")
         except Exception as e:
             logger.warning(f"⚠️ Enhanced metrics setup failed: {e}")
 
+    # Open provider connections while the call is being set up
+    providers = get_providers(ctx.proc)
+    providers.warm()
+    # a job process exits once its job ends, so this is the pool's teardown
+    ctx.add_shutdown_callback(providers.aclose)
+
     await ctx.connect()
 
-    # SIP participant setup (existing code)
+    # Dial in the background and set up and start the session while the phone rings
+    answer_task = None
+    session_start = None
+    dial_start = perf_counter()
     if phone_number is not None:
         participant_name = f"phone_user-{phone_number}"
-        await ctx.api.sip.create_sip_participant(
-            api.CreateSIPParticipantRequest(
-                room_name=ctx.room.name,
-                sip_trunk_id=outbound_trunk_id,
-                sip_call_to=phone_number,
-                participant_identity=participant_name,
-            )
+        answer_task = asyncio.create_task(
+            dial_and_wait_for_answer(ctx, phone_number, participant_name)
         )
+        await asyncio.sleep(0)  # let the dial request go out before the synchronous setup below
 
-        participant = await ctx.wait_for_participant(identity=participant_name)
+    call_outcome = {"status": "completed"}
+    answered_at = None
 
-        start_time = perf_counter()
-        while perf_counter() - start_time < 30:
-            call_status = participant.attributes.get("sip.callStatus")
-            if call_status == "active":
-                logger.info("📞 Call answered by user")
-                break
-            elif participant.disconnect_reason == rtc.DisconnectReason.USER_REJECTED:
-                logger.info("❌ User rejected the call")
-                if enhanced_recorder and current_call_id:
-                    await enhanced_recorder.end_call(current_call_id, "rejected")
-                await ctx.shutdown()
-                return
-            elif participant.disconnect_reason == rtc.DisconnectReason.USER_UNAVAILABLE:
-                logger.info("❌ User unavailable")
-                if enhanced_recorder and current_call_id:
-                    await enhanced_recorder.end_call(current_call_id, "unavailable")
-                await ctx.shutdown()
+    try:
+        setup_start = perf_counter()
+        agent = CallAgent(instructions=get_prompt(), ctx=ctx)
+        session, guardrails_llm = create_session(ctx.proc, providers)
+        setup_ms = (perf_counter() - setup_start) * 1000
+        logger.info(
+            f"⏱️ Session setup took {setup_ms:.0f} ms "
+            f"(prewarmed VAD saved {ctx.proc.userdata.get('vad_load_ms', 0):.0f} ms per call)"
+        )
+        await record_setup_timing("session_setup_ms", setup_ms)
+
+        # Guardrails + tool HTTP calls share one latency budget per user turn,
+        # and tool responses are cached per call; the session's tasks inherit
+        # both from this context
+        turn_budget = TurnLatencyBudget()
+        current_turn_budget.set(turn_budget)
+        current_call_scope.set(ctx.room.name)
+
+        # Interim user transcripts go to agent-assist on a separate low-priority
+        # channel so it can start on a suggestion before the final transcript
+        partial = {"text": "", "seq": 0}
+        partial_tasks = set()
+
+        async def publish_partial(text: str, seq: int):
+            try:
+                await publish_partial_transcript(ctx.room.name, text, seq)
+            except Exception as e:
+                logger.debug(f"Failed to publish partial transcript: {e}")
+
+        def on_user_input_transcribed(event):
+            text = event.transcript.strip()
+            if event.is_final or not text or text == partial["text"]:
                 return
-            await asyncio.sleep(0.1)
-
-    agent = CallAgent(instructions=get_prompt(), ctx=ctx)
-    base_llm = openai.LLM()
-    guardrails_llm = GuardrailsLLM(llm=base_llm)
-
-    session = AgentSession(
-        stt=deepgram.STT(model="nova-3"),
-        llm=base_llm,
-        tts=deepgram.TTS(),
-        vad=silero.VAD.load(
-            min_silence_duration=0.1,
-            min_speech_duration=0.1,
-            max_buffered_speech=5.0,
-        ),
-    )
-
-    # 🆕 ENHANCED EVENT HANDLERS with detailed metrics
-    def on_conversation_item_added(event):
-        async def handle_conversation_item():
-            item = event.item
-
-            if item.role == "user":
-                logger.info(f"[ASR] User: {item.text_content}")
-                await publish_transcript(ctx.room.name, "user", item.text_content)
+            partial["seq"] += 1
+            partial["text"] = text
+            task = asyncio.create_task(publish_partial(text, partial["seq"]))
+            partial_tasks.add(task)
+            task.add_done_callback(partial_tasks.discard)
+
+        session.on("user_input_transcribed")(on_user_input_transcribed)
+
+        # 🆕 ENHANCED EVENT HANDLERS with detailed metrics
+        def on_conversation_item_added(event):
+            if event.item.role == "user":
+                turn_budget.reset()
+                partial["text"] = ""
+
+            async def handle_conversation_item():
+                item = event.item
+
+                if item.role == "user":
+                    logger.info(f"[ASR] User: {item.text_content}")
+                    await publish_transcript(ctx.room.name, "user", item.text_content)
                         
-            elif item.role == "assistant":
-                logger.info(f"[LLM] Agent: {item.text_content}")
-                await publish_transcript(ctx.room.name, "agent", item.text_content)
+                elif item.role == "assistant":
+                    logger.info(f"[LLM] Agent: {item.text_content}")
+                    await publish_transcript(ctx.room.name, "agent", item.text_content)
         
-        asyncio.create_task(handle_conversation_item())
+            asyncio.create_task(handle_conversation_item())
     
-    session.on("conversation_item_added")(on_conversation_item_added)
+        session.on("conversation_item_added")(on_conversation_item_added)
     
-    # 🆕 ENHANCED METRICS HANDLER - This captures the logged metrics
-    def on_metrics_collected(event: MetricsCollectedEvent):
-        from livekit.agents.metrics import log_metrics
-        log_metrics(event.metrics)
+        # 🆕 ENHANCED METRICS HANDLER - This captures the logged metrics
+        def on_metrics_collected(event: MetricsCollectedEvent):
+            from livekit.agents.metrics import log_metrics
+            log_metrics(event.metrics)
         
-        # Store enhanced metrics
-        if enhanced_recorder and current_call_id:
-            asyncio.create_task(
-                store_metrics_from_event(event.metrics, current_call_id)
-            )
+            # Store enhanced metrics (batched by the flusher, never blocks this callback)
+            if metrics_flusher and current_call_id:
+                metrics_flusher.submit(current_call_id, event.metrics)
     
-    session.on("metrics_collected")(on_metrics_collected)
+        session.on("metrics_collected")(on_metrics_collected)
+
+        # Ring-to-first-word: time from the callee answering until the agent starts speaking
+        first_word_logged = False
 
-    # 🆕 ENHANCED SHUTDOWN CALLBACK
-    # async def enhanced_shutdown():
-    #     try:
-    #         logger.info("🏁 Enhanced agent shutdown initiated")
+        def on_agent_state_changed(event):
+            nonlocal first_word_logged
+            if first_word_logged or answered_at is None or getattr(event, "new_state", None) != "speaking":
+                return
+            first_word_logged = True
+            ring_to_first_word_ms = (perf_counter() - answered_at) * 1000
+            logger.info(f"🗣️ Ring-to-first-word: {ring_to_first_word_ms:.0f} ms")
+            asyncio.create_task(record_setup_timing("ring_to_first_word_ms", ring_to_first_word_ms))
+
+        session.on("agent_state_changed")(on_agent_state_changed)
+
+        # 🆕 ENHANCED SHUTDOWN CALLBACK
+        # async def enhanced_shutdown():
+        #     try:
+        #         logger.info("🏁 Enhanced agent shutdown initiated")
             
-    #         if enhanced_recorder and current_call_id:
-    #             await enhanced_recorder.end_call(current_call_id, "completed")
-    #             logger.info(f"📊 Enhanced metrics tracking ended: {current_call_id}")
-    #             await enhanced_recorder.cleanup()
+        #         if enhanced_recorder and current_call_id:
+        #             await enhanced_recorder.end_call(current_call_id, "completed")
+        #             logger.info(f"📊 Enhanced metrics tracking ended: {current_call_id}")
+        #             await enhanced_recorder.cleanup()
         
-    #     except Exception as e:
-    #         logger.error(f"❌ Enhanced shutdown error: {e}")
+        #     except Exception as e:
+        #         logger.error(f"❌ Enhanced shutdown error: {e}")
     
-    async def enhanced_shutdown():
-        try:
-            logger.info("🏁 Enhanced agent shutdown initiated")
+        async def enhanced_shutdown():
+            try:
+                logger.info("🏁 Enhanced agent shutdown initiated")
+                logger.info(f"🔌 Provider pool: {providers.stats()}")
             
-            if enhanced_recorder and current_call_id:
-                await enhanced_recorder.end_call(current_call_id, "completed")
-                logger.info(f"📊 Enhanced metrics tracking ended: {current_call_id}")
-                
-                # 🆕 ADD THIS: Publish post-call event
+                logger.info(f"🔧 Tool HTTP: {tool_http.stats}")
+                tool_http.end_call(ctx.room.name)
+                if guardrails_llm.verdict_cache is not None:
+                    logger.info(f"🛡️ Guardrails verdict cache: {guardrails_llm.verdict_cache.stats()}")
+                logger.info(
+                    f"⚡ Circuit breakers: {({name: b.stats() for name, b in tool_http.breakers.items()})}, "
+                    f"turns over latency budget: {turn_budget.exhausted_turns}"
+                )
                 try:
-                    await publish_post_call_event(
-                        call_id=current_call_id,
-                        status="completed",
-                        metadata={
-                            "agent_name": "enhanced-agent-1",
-                            "end_reason": "normal_completion",
-                            "client_id": os.getenv("CLIENT_ID", "default")
-                        }
-                    )
+                    await end_room_history(ctx.room.name)
                 except Exception as e:
-                    logger.error(f"❌ Failed to publish post-call event: {e}")
+                    logger.warning(f"⚠️ Failed to set transcript retention: {e}")
+            
+                if metrics_flusher:
+                    await metrics_flusher.stop()
+            
+                if enhanced_recorder and current_call_id:
+                    try:
+                        await record_assist_speculation(current_call_id, ctx.room.name)
+                    except Exception as e:
+                        logger.warning(f"⚠️ Failed to read agent-assist speculation outcomes: {e}")
+                    await enhanced_recorder.end_call(current_call_id, call_outcome["status"])
+                    logger.info(f"📊 Enhanced metrics tracking ended: {current_call_id}")
+                
+                    # 🆕 ADD THIS: Publish post-call event
+                    try:
+                        await publish_post_call_event(
+                            call_id=current_call_id,
+                            status=call_outcome["status"],
+                            metadata={
+                                "agent_name": "enhanced-agent-1",
+                                "end_reason": "normal_completion" if call_outcome["status"] == "completed" else call_outcome["status"],
+                                "client_id": os.getenv("CLIENT_ID", "default")
+                            }
+                        )
+                    except Exception as e:
+                        logger.error(f"❌ Failed to publish post-call event: {e}")
                 
-                await enhanced_recorder.cleanup()
+                    await enhanced_recorder.cleanup()
             
-        except Exception as e:
-            logger.error(f"❌ Enhanced shutdown error: {e}")
+            except Exception as e:
+                logger.error(f"❌ Enhanced shutdown error: {e}")
+
+        ctx.add_shutdown_callback(enhanced_shutdown)
+
+        # Join the room and open the STT/TTS streams while the phone is still
+        # ringing, so the agent can talk as soon as the callee picks up
+        session_start = asyncio.create_task(session.start(agent=agent, room=ctx.room))
+
+        if answer_task is not None:
+            call_status = await answer_task
+            ring_ms = (perf_counter() - dial_start) * 1000
+            await record_setup_timing("ring_ms", ring_ms)
+            if call_status == "active":
+                logger.info(f"📞 Call answered by user after {ring_ms:.0f} ms")
+            elif call_status in ("rejected", "unavailable"):
+                logger.info("❌ User rejected the call" if call_status == "rejected" else "❌ User unavailable")
+                # enhanced_shutdown ends the call with this status
+                call_outcome["status"] = call_status
+                ctx.shutdown(reason=f"call {call_status}")
+                return
+            else:
+                logger.warning("⚠️ No answer within the dial timeout, starting session anyway")
+        answered_at = perf_counter()
+
+        await session_start
+    finally:
+        # Setup failed or the call was rejected: don't leave the dial or session start running
+        for task in (answer_task, session_start):
+            if task is not None and not task.done():
+                task.cancel()
+
+def create_session(proc: JobProcess, providers: ProviderPool):
+    """Call pipeline on the process' shared providers, with every LLM turn going through the guardrails
+    
+    Returns (session, guardrails_llm).
+    """
+    guardrails_llm = GuardrailsLLM(
+        llm=providers.llm(),
+        engine=proc.userdata.get("guardrails_engine"),
+        verdict_cache=proc.userdata.get("verdict_cache"),
+    )
+    guardrails_llm.on("guardrails_metrics", on_guardrails_metrics)
+
+    session = AgentSession(
+        stt=providers.stt(model="nova-3"),
+        llm=guardrails_llm,
+        tts=providers.tts(),
+        vad=get_vad(proc),
+    )
+    return session, guardrails_llm
 
-    ctx.add_shutdown_callback(enhanced_shutdown)
+async def record_setup_timing(name: str, value_ms: float):
+    """Record a call setup timing on the current call, if metrics are enabled"""
+    if enhanced_recorder and current_call_id:
+        await enhanced_recorder.record_setup_timing(current_call_id, name, value_ms)
 
-    await session.start(
-        agent=agent,
-        room=ctx.room,
+async def dial_and_wait_for_answer(ctx: JobContext, phone_number: str, participant_name: str, timeout: float = 30) -> str:
+    """Dial the callee over SIP and wait for the outcome.
+    
+    Returns "active", "rejected", "unavailable" or "timeout".
+    """
+    await ctx.api.sip.create_sip_participant(
+        api.CreateSIPParticipantRequest(
+            room_name=ctx.room.name,
+            sip_trunk_id=outbound_trunk_id,
+            sip_call_to=phone_number,
+            participant_identity=participant_name,
+        )
     )
 
+    participant = await ctx.wait_for_participant(identity=participant_name)
+    return await wait_for_call_answer(ctx.room, participant, timeout)
+
+def on_tool_metric(metric: ToolCallMetric):
+    """Forward per-tool HTTP latency/cache counters to the metrics flusher"""
+    if metrics_flusher and current_call_id:
+        metrics_flusher.submit(current_call_id, metric)
+
+async def remove_tool_metric_listener():
+    """Shutdown callback, registered with the listener so every exit path removes it"""
+    tool_http.remove_listener(on_tool_metric)
+
+async def record_assist_speculation(call_id: str, room_id: str):
+    """Copy agent-assist's speculation outcomes from the room's suggestions into the call metrics
+
+    The assist worker marks the suggestions it publishes: `speculative` with
+    `speculation_head_start_ms` when the suggestion requested for an interim
+    transcript held, `speculation_discarded` when it had to be dropped.
+    """
+    for message in await read_room_history(room_id):
+        if message.get("speaker") != "llm":
+            continue
+        if message.get("speculative"):
+            lead_ms = float(message.get("speculation_head_start_ms") or 0)
+            await enhanced_recorder.record_speculation_metric(call_id, True, lead_ms)
+        elif message.get("speculation_discarded"):
+            await enhanced_recorder.record_speculation_metric(call_id, False)
+
+def on_guardrails_metrics(metrics: GuardrailsMetrics):
+    """Forward per-turn guardrails timing (TTFT recovered) to the metrics flusher"""
+    if metrics_flusher and current_call_id:
+        metrics_flusher.submit(current_call_id, metrics)
+
 async def store_metrics_from_event(metrics, call_id):
     """Store metrics from MetricsCollectedEvent into enhanced recorder"""
     if not enhanced_recorder or not call_id:
@@ -405,7 +576,24 @@ async def store_metrics_from_event(metrics, call_id):
     
     try:
         # Extract different types of metrics
-        for metric in metrics:
+        for metric in metrics if isinstance(metrics, (list, tuple)) else [metrics]:
+            if isinstance(metric, ToolCallMetric):
+                await enhanced_recorder.record_tool_metric(
+                    call_id, metric.tool, metric.latency, metric.cache_hit, metric.success,
+                    metric.skipped, metric.breaker_state, metric.breaker_trips
+                )
+                continue
+            
+            if isinstance(metric, GuardrailsMetrics):
+                await enhanced_recorder.record_guardrails_metric(call_id, metric.to_dict())
+                continue
+            
+            # Correlate pipeline stages of the same user turn by speech_id
+            if turn_tracer:
+                turn = turn_tracer.observe(metric)
+                if turn:
+                    await enhanced_recorder.record_detailed_turn(call_id, turn.to_dict())
+            
             metric_type = getattr(metric, 'type', None) or type(metric).__name__
             
             if 'llm' in metric_type.lower() or hasattr(metric, 'ttft'):
@@ -453,7 +641,44 @@ async def store_metrics_from_event(metrics, call_id):
         logger.error(f"❌ Error storing metrics: {e}")
 
 def prewarm_fnc(proc: JobProcess):
-    proc.userdata["vad"] = silero.VAD.load()
+    # load silero weights once per worker process with the tuned settings
+    load_start = perf_counter()
+    proc.userdata["vad"] = silero.VAD.load(**VAD_OPTIONS)
+    proc.userdata["vad_load_ms"] = (perf_counter() - load_start) * 1000
+    logger.info(f"🎙️ VAD prewarmed in {proc.userdata['vad_load_ms']:.0f} ms")
+
+    # shared keep-alive sessions for STT/LLM/TTS, connected on the job's event loop
+    proc.userdata["providers"] = ProviderPool()
+
+    # compiled guardrails validated in-process, unless the remote service is requested
+    if os.getenv("GUARDRAILS_MODE", "local") != "remote":
+        proc.userdata["guardrails_engine"] = GuardrailsEngine()
+        # in-process tier only: a Redis round trip costs more than the engine itself
+        proc.userdata["verdict_cache"] = VerdictCache()
+    else:
+        # remote verdicts are shared by all calls of this worker and, via Redis, all workers
+        proc.userdata["verdict_cache"] = VerdictCache(redis_client=r)
+
+def get_providers(proc: JobProcess) -> ProviderPool:
+    """Return the process-wide provider pool created in prewarm"""
+    providers = proc.userdata.get("providers")
+    if providers is None:
+        providers = ProviderPool()
+        proc.userdata["providers"] = providers
+    return providers
+
+def get_vad(proc: JobProcess, **overrides):
+    """Return the prewarmed VAD, applying per-call settings without reloading weights"""
+    vad = proc.userdata.get("vad")
+    if vad is None:
+        logger.warning("⚠️ VAD was not prewarmed, loading on the call path")
+        vad = silero.VAD.load(**VAD_OPTIONS)
+        proc.userdata["vad"] = vad
+    if overrides:
+        # the prewarmed VAD is shared by every call of this process, so per-call
+        # settings get their own VAD on the same ONNX session
+        vad = silero.VAD(session=vad._onnx_session, opts=dataclasses.replace(vad._opts, **overrides))
+    return vad
 
 if __name__ == "__main__":
     agent_list = ['enhanced-agent-metrics-1', 'enhanced-agent-metrics-2', 'enhanced-agent-metrics-3']
@@ -0,0 +1,261 @@
+"""
+Availability registry for human, transcriber and main agents, shared by every worker through Redis.
+
+  agents:info:{agent_id}          HASH   kind, priority, skills (comma separated), payload (JSON)
+  agents:free:{kind}:{skill}      ZSET   free agents with that skill, scored by priority (lowest first)
+  agents:leases:{kind}            ZSET   leased agents, scored by lease expiry (ms)
+  agents:lease:{agent_id}         STRING lease token ("<holder>:<random>"), expires with the lease
+
+Claiming takes the best free agent off all of its skill pools and leases it in
+one Lua script, so two workers can never get the same agent and a pick is
+O(log n). Each claim gets its own token, so only that lease object can renew
+or release it. A lease is kept alive while its holder runs and released on hangup;
+if the holder dies, the lease expires and the next claim returns the agent to
+its pools.
+
+The scripts build agents:free:* and agents:info:* key names from the data
+they read instead of receiving every key in KEYS, which Redis Cluster does not
+allow: the registry assumes a single Redis node.
+
+Register agents with:
+    python agent_registry.py register <agent_id> <human|transcriber|main> <skill,skill> <priority> '<payload json>'
+"""
+
+import asyncio
+import json
+import sys
+import uuid
+from typing import Dict, List, Optional
+
+try:
+    from redis_functions import r
+except ImportError:  # imported as agent_assist.agent_registry
+    from agent_assist.redis_functions import r
+
+HUMAN = "human"
+TRANSCRIBER = "transcriber"
+MAIN = "main"
+DEFAULT_SKILL = "default"
+DEFAULT_LEASE_SECONDS = 120  # renewed every third of this while the holder is alive
+EXPIRED_LEASES_PER_CLAIM = 10  # expired leases returned to their pools by each claim
+
+_CLAIM_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local kind = ARGV[1]
+
+local function pools(agent_id)
+    local info = redis.call('HMGET', 'agents:info:' .. agent_id, 'kind', 'skills')
+    local keys = {}
+    if info[2] then
+        for skill in string.gmatch(info[2], '[^,]+') do
+            table.insert(keys, 'agents:free:' .. (info[1] or kind) .. ':' .. skill)
+        end
+    end
+    return keys
+end
+
+-- Return agents whose holder stopped renewing to their pools
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now, 'LIMIT', 0, ARGV[4])
+for _, agent_id in ipairs(expired) do
+    redis.call('ZREM', KEYS[2], agent_id)
+    redis.call('DEL', 'agents:lease:' .. agent_id)
+    local priority = redis.call('HGET', 'agents:info:' .. agent_id, 'priority')
+    if priority then
+        for _, pool in ipairs(pools(agent_id)) do
+            redis.call('ZADD', pool, priority, agent_id)
+        end
+    end
+end
+
+local picked = redis.call('ZRANGE', KEYS[1], 0, 0)
+if #picked == 0 then
+    return false
+end
+local agent_id = picked[1]
+for _, pool in ipairs(pools(agent_id)) do
+    redis.call('ZREM', pool, agent_id)
+end
+redis.call('ZREM', KEYS[1], agent_id)
+redis.call('ZADD', KEYS[2], now + tonumber(ARGV[3]), agent_id)
+redis.call('SET', 'agents:lease:' .. agent_id, ARGV[2], 'PX', ARGV[3])
+return {agent_id, redis.call('HGET', 'agents:info:' .. agent_id, 'payload') or '{}'}
+"""
+
+_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+local now = redis.call('TIME')
+now = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+redis.call('PEXPIRE', KEYS[1], ARGV[2])
+redis.call('ZADD', KEYS[2], 'XX', now + tonumber(ARGV[2]), ARGV[3])
+return 1
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[2], ARGV[2])
+local info = redis.call('HMGET', KEYS[3], 'kind', 'priority', 'skills')
+if info[2] and info[3] then
+    for skill in string.gmatch(info[3], '[^,]+') do
+        redis.call('ZADD', 'agents:free:' .. (info[1] or ARGV[3]) .. ':' .. skill, info[2], ARGV[2])
+    end
+end
+return 1
+"""
+
+# Registration reads the agent's current kind/skills and whether it is leased
+# in the same script that rewrites it, so a concurrent claim cannot slip in
+# between; the old pools are those of the old kind.
+_REGISTER_SCRIPT = """
+local info = redis.call('HMGET', KEYS[1], 'kind', 'skills')
+if info[1] and info[2] then
+    for skill in string.gmatch(info[2], '[^,]+') do
+        redis.call('ZREM', 'agents:free:' .. info[1] .. ':' .. skill, ARGV[1])
+    end
+end
+redis.call('HSET', KEYS[1], 'kind', ARGV[2], 'priority', ARGV[3], 'skills', ARGV[4], 'payload', ARGV[5])
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    for skill in string.gmatch(ARGV[4], '[^,]+') do
+        redis.call('ZADD', 'agents:free:' .. ARGV[2] .. ':' .. skill, ARGV[3], ARGV[1])
+    end
+end
+return 1
+"""
+
+_UNREGISTER_SCRIPT = """
+local info = redis.call('HMGET', KEYS[1], 'kind', 'skills')
+if info[1] and info[2] then
+    for skill in string.gmatch(info[2], '[^,]+') do
+        redis.call('ZREM', 'agents:free:' .. info[1] .. ':' .. skill, ARGV[1])
+    end
+end
+return redis.call('DEL', KEYS[1])
+"""
+
+
+def _info_key(agent_id: str) -> str:
+    return f"agents:info:{agent_id}"
+
+
+def _pool_key(kind: str, skill: str) -> str:
+    return f"agents:free:{kind}:{skill}"
+
+
+def _leases_key(kind: str) -> str:
+    return f"agents:leases:{kind}"
+
+
+def _lease_key(agent_id: str) -> str:
+    return f"agents:lease:{agent_id}"
+
+
+class AgentLease:
+    """An agent claimed for one holder until released (or until renewals stop)"""
+
+    def __init__(self, registry: "AgentRegistry", kind: str, agent_id: str, holder: str, payload: dict, ttl_ms: int,
+                 token: str):
+        self.registry = registry
+        self.kind = kind
+        self.agent_id = agent_id
+        self.holder = holder
+        self.token = token  # Stored in the lease key, a stale lease of the same holder cannot touch a newer one
+        self.payload = payload
+        self.ttl_ms = ttl_ms
+        self._keepalive_task: Optional[asyncio.Task] = None
+
+    def keep_alive(self):
+        """Renew the lease in the background until release()"""
+        if self._keepalive_task is None:
+            self._keepalive_task = asyncio.create_task(self._renew_loop())
+
+    async def _renew_loop(self):
+        while True:
+            await asyncio.sleep(self.ttl_ms / 3000)
+            try:
+                if not await self.registry.renew(self):
+                    print(f"Lease on agent {self.agent_id} was lost")
+                    return
+            except Exception as e:
+                print(f"Failed to renew lease on agent {self.agent_id}: {e}")
+
+    async def release(self) -> bool:
+        if self._keepalive_task:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
+        return await self.registry.release(self)
+
+
+class AgentRegistry:
+    def __init__(self, redis_client=None):
+        self.redis = redis_client or r
+        self._claim = self.redis.register_script(_CLAIM_SCRIPT)
+        self._renew = self.redis.register_script(_RENEW_SCRIPT)
+        self._release = self.redis.register_script(_RELEASE_SCRIPT)
+        self._register = self.redis.register_script(_REGISTER_SCRIPT)
+        self._unregister = self.redis.register_script(_UNREGISTER_SCRIPT)
+
+    async def register(self, agent_id: str, kind: str, skills: List[str], priority: float, payload: Dict):
+        """Add or update an agent and make it available (unless it is currently leased)"""
+        skills = [skill.strip() for skill in skills if skill.strip()] or [DEFAULT_SKILL]
+        await self._register(
+            keys=[_info_key(agent_id), _lease_key(agent_id)],
+            args=[agent_id, kind, priority, ",".join(skills), json.dumps(dict(payload, agent_id=agent_id))],
+        )
+
+    async def unregister(self, agent_id: str):
+        """Take an agent out of the registry (a running lease just expires)"""
+        await self._unregister(keys=[_info_key(agent_id)], args=[agent_id])
+
+    async def claim(self, kind: str, skill: Optional[str], holder: str,
+                    lease_seconds: float = DEFAULT_LEASE_SECONDS) -> Optional[AgentLease]:
+        """Lease the highest-priority free agent of `kind` with `skill`, None if nobody is free"""
+        ttl_ms = int(lease_seconds * 1000)
+        token = f"{holder}:{uuid.uuid4().hex}"
+        result = await self._claim(
+            keys=[_pool_key(kind, skill or DEFAULT_SKILL), _leases_key(kind)],
+            args=[kind, token, ttl_ms, EXPIRED_LEASES_PER_CLAIM],
+        )
+        if not result:
+            return None
+        agent_id, payload = result
+        return AgentLease(self, kind, agent_id, holder, json.loads(payload), ttl_ms, token)
+
+    async def renew(self, lease: AgentLease) -> bool:
+        return bool(await self._renew(
+            keys=[_lease_key(lease.agent_id), _leases_key(lease.kind)],
+            args=[lease.token, lease.ttl_ms, lease.agent_id],
+        ))
+
+    async def release(self, lease: AgentLease) -> bool:
+        """Put the agent back in its pools; False if the lease had already expired or moved on"""
+        return bool(await self._release(
+            keys=[_lease_key(lease.agent_id), _leases_key(lease.kind), _info_key(lease.agent_id)],
+            args=[lease.token, lease.agent_id, lease.kind],
+        ))
+
+    async def free_count(self, kind: str, skill: Optional[str] = None) -> int:
+        return await self.redis.zcard(_pool_key(kind, skill or DEFAULT_SKILL))
+
+
+agent_registry = AgentRegistry()
+
+
+async def _main(argv: List[str]):
+    if len(argv) == 6 and argv[0] == "register":
+        _, agent_id, kind, skills, priority, payload = argv
+        await agent_registry.register(agent_id, kind, skills.split(","), float(priority), json.loads(payload))
+        print(f"Registered {kind} agent {agent_id} for {skills}")
+    elif len(argv) == 2 and argv[0] == "unregister":
+        await agent_registry.unregister(argv[1])
+        print(f"Unregistered agent {argv[1]}")
+    else:
+        print(__doc__)
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
@@ -1,12 +1,13 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Query, WebSocket, WebSocketDisconnect
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
-import aioredis
 import asyncio
 import json
 import os
+from typing import Optional
 from dotenv import load_dotenv
-from redis_functions import publish_transcript, r
+from fanout_hub import FanoutHub, stream_offset
+from redis_functions import ROOM_STREAM_MAXLEN, publish_transcript, r, read_room_history
 from utils import *
 from worker_management import *
 
@@ -16,6 +17,7 @@ load_dotenv(dotenv_path="/app/.env.local")
 redis_host = os.getenv("REDIS_HOST")
 
 app = FastAPI()
+fanout_hub = FanoutHub(r)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 HTML_DIR = os.path.join(BASE_DIR, "test_pub_sub/html")
@@ -53,34 +55,78 @@ async def get_html():
 #         await pubsub.close()
 
 
+@app.on_event("startup")
+async def startup_event():
+    await assist_worker.start()
+    await fanout_hub.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await fanout_hub.stop()
+    await assist_worker.stop()
+
+@app.get("/worker_stats")
+async def get_worker_stats():
+    """Rooms served by this process and memory per room"""
+    return {**worker_stats(), "fanout": fanout_hub.stats()}
+
+
 @app.websocket("/ws/{room_id}")
 async def websocket_endpoint(websocket: WebSocket, room_id: str):
     await websocket.accept()
     
-    # Start the worker for this room
-    start_worker(room_id)
+    # Start serving this room in the shared worker
+    await start_worker(room_id)
     
-    redis = aioredis.from_url(f"redis://{redis_host}:6379")
-    pubsub = redis.pubsub()
-    await pubsub.subscribe(room_id)
-
+    # One shared Redis subscription per room, pushed to every viewer
+    subscriber = await fanout_hub.join(room_id, websocket)
+    sender = None
     try:
+        # A reconnecting client passes the last stream_id it got and is sent
+        # what it missed; live messages it would get twice are skipped
+        since = websocket.query_params.get("since")
+        if since:
+            try:
+                missed = await read_room_history(room_id, since=since)
+            except Exception as e:
+                print(f"Could not replay {room_id} since {since}: {e}")
+                missed = []
+            for message in missed:
+                await websocket.send_text(json.dumps(message))
+            if missed:
+                subscriber.replayed_through = stream_offset(missed[-1]["stream_id"])
+        sender = asyncio.create_task(subscriber.run())
+
+        # Viewers only listen; a receive returns when the client goes away
         while True:
-            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
-            if message:
-                data = json.loads(message['data'])
-                await websocket.send_json(data)
-            await asyncio.sleep(0.1)
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
     except WebSocketDisconnect:
+        pass
+    finally:
+        if sender:
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+        await fanout_hub.leave(room_id, subscriber)
         print(f"WebSocket disconnected for room {room_id}")
-    # finally:
-    #     # Cleanup
-    #     print("Going here for cleanup")
-    #     await pubsub.unsubscribe(room_id)
-    #     await pubsub.close()
-    #     await redis.close()
-    #     disconnect_worker(room_id)
-    #     print("Cleaned up!")
+
+
+@app.get("/api/room_history/{room_id}")
+async def get_room_history(room_id: str, since: Optional[str] = None, limit: int = Query(500, ge=1, le=ROOM_STREAM_MAXLEN)):
+    """
+    Transcript messages of the room after the `since` cursor (a stream_id or a history_id).
+    Pass back `next_cursor` to fetch only what was published since.
+    """
+    try:
+        messages = await read_room_history(room_id, since=since, count=limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="since must be a stream_id or a history_id")
+    return {
+        "room_id": room_id,
+        "messages": messages,
+        "next_cursor": messages[-1]["stream_id"] if messages else since,
+    }
 
 
 @app.post("/publish/{room_id}")
@@ -1,11 +1,12 @@
 #Use this to add a free agent to the call.
-import subprocess
+import asyncio
+import json
 from dotenv import load_dotenv
 import os
 import yaml
+from livekit import api
 
 from identify_free_agent import free_human_agent, free_transcriber_agent, free_main_agent
-from call_utils import get_room_name_from_result
 
 
 
@@ -21,17 +22,43 @@ else:
     LIVEKIT_API_KEY = os.getenv("LIVEKIT_API_KEY_LOCAL")
     LIVEKIT_API_SECRET = os.getenv("LIVEKIT_API_SECRET_LOCAL")
 
-def add_human_agent_to_room(room_name, main_outbound_agent, use_case=None):
+HANGUP_POLL_SECONDS = 10  # how often a transferred call is checked for having ended
+_lease_holders = set()  # hold_lease_until_room_ends tasks, referenced until they finish
+
+
+async def hold_lease_until_room_ends(lease, room_name, poll_seconds=HANGUP_POLL_SECONDS):
+    """
+    Keep the human agent leased while the room exists and release them once the call has ended.
+    """
+    lease.keep_alive()
+    try:
+        async with api.LiveKitAPI(LIVEKIT_URL, LIVEKIT_API_KEY, LIVEKIT_API_SECRET) as lkapi:
+            while True:
+                await asyncio.sleep(poll_seconds)
+                try:
+                    rooms = await lkapi.room.list_rooms(api.ListRoomsRequest(names=[room_name]))
+                except Exception as e:
+                    # Keep holding the agent, a failed check says nothing about the call
+                    print(f"Could not check room {room_name}: {e}")
+                    continue
+                if not rooms.rooms:
+                    break
+    finally:
+        await lease.release()
+        print(f"Call in {room_name} ended, human agent {lease.agent_id} is free again")
+
+async def add_human_agent_to_room(room_name, main_outbound_agent, use_case=None):
     """
     We will look for a free agent, and then add that agent to the room.
+    The agent stays leased until the room is gone (see hold_lease_until_room_ends).
     Positive result: {status: True, msg: "Call getting transferred to agent"}
     Negative result: {status: False, msg: "No free agent"}
     Negative result msgs: ["No free agent", "Agent didn't pick", "Agent busy", "Number not reachable", "Telephony issue on agent side"]
     """
     result = {}
-    free_agent = free_human_agent(use_case)
+    free_agent = await free_human_agent(use_case, holder=room_name)
 
-    if not free_agent.status:
+    if not free_agent['status']:
         result['status'] = False
         result['msg'] = "No free agent"
         return result
@@ -44,23 +71,27 @@ def add_human_agent_to_room(room_name, main_outbound_agent, use_case=None):
             "phone": human_agent_number
         }
 
-    command = ["lk", "dispatch", "create", "--room", room_name, "--agent-name", main_outbound_agent,"--metadata", metadata,
-    "--api-key", LIVEKIT_API_KEY, "--api-secret", LIVEKIT_API_SECRET,"--url", LIVEKIT_URL]
-
     try:
-        result = subprocess.run(command, capture_output=True, text=True, check=True)
-        curr_room_name = get_room_name_from_result(result)
-        #This is just the dispatch request, not the actual confirmation that the human has been added
-        #We want the confirmation for the human agent to be added.
-        #Once the human agent is added, I want the main agent to brief the human agent about the call and also
-        #send a msg to the frontend pub-sub
-        if curr_room_name['status'] and curr_room_name['payload']['room_num'] == room_name:
-            pass
-
-
-    except:
-        pass
-
-
+        # Async API request, a CLI round trip would block the event loop of live calls
+        async with api.LiveKitAPI(LIVEKIT_URL, LIVEKIT_API_KEY, LIVEKIT_API_SECRET) as lkapi:
+            await lkapi.agent_dispatch.create_dispatch(api.CreateAgentDispatchRequest(
+                agent_name=main_outbound_agent, room=room_name, metadata=json.dumps(metadata)
+            ))
+    except Exception:
+        # Dispatch failed, the human agent is free again
+        await free_agent['lease'].release()
+        result['status'] = False
+        result['msg'] = "Telephony issue on agent side"
+        return result
 
+    #This is just the dispatch request, not the actual confirmation that the human has been added
+    #We want the confirmation for the human agent to be added.
+    #Once the human agent is added, I want the main agent to brief the human agent about the call and also
+    #send a msg to the frontend pub-sub
+    task = asyncio.create_task(hold_lease_until_room_ends(free_agent['lease'], room_name))
+    _lease_holders.add(task)
+    task.add_done_callback(_lease_holders.discard)
 
+    result['status'] = True
+    result['msg'] = "Call getting transferred to agent"
+    return result
@@ -0,0 +1,175 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Set, Tuple
+
+from redis_functions import r
+
+DEFAULT_MAX_QUEUE = 100  # messages buffered per websocket before the oldest are dropped
+_STREAM_ID_PREFIX = '{"stream_id": "'  # how publish_transcript starts every live payload
+
+
+def stream_offset(stream_id: str) -> Tuple[int, int]:
+    milliseconds, _, sequence = stream_id.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+def payload_stream_id(payload: str) -> Optional[str]:
+    """Stream id of a live payload, read without decoding the JSON"""
+    if not payload.startswith(_STREAM_ID_PREFIX):
+        return None
+    end = payload.find('"', len(_STREAM_ID_PREFIX))
+    return payload[len(_STREAM_ID_PREFIX):end] if end > 0 else None
+
+
+class Subscriber:
+    """One websocket viewer of a room, fed through its own bounded queue
+
+    A slow client never holds up the room: once `max_queue` messages are
+    pending, the oldest ones are coalesced away (counted in `dropped`).
+    """
+
+    def __init__(self, websocket, max_queue: int = DEFAULT_MAX_QUEUE):
+        self.websocket = websocket
+        self.queue: Deque[Tuple[str, float]] = deque(maxlen=max_queue)
+        self.wakeup = asyncio.Event()
+        self.dropped = 0
+        self.sent = 0
+        self.delivery_seconds = 0.0
+        # Set after replaying history: live messages up to this offset were already sent
+        self.replayed_through: Optional[Tuple[int, int]] = None
+
+    def push(self, payload: str, received_at: float):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append((payload, received_at))
+        self.wakeup.set()
+
+    async def run(self):
+        """Send queued payloads as they arrive (returns only by cancellation or send error)"""
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            while self.queue:
+                payload, received_at = self.queue.popleft()
+                if self.replayed_through and not self._after_replay(payload):
+                    continue
+                # Redis payload is already JSON, pass it through as-is
+                await self.websocket.send_text(payload)
+                self.sent += 1
+                self.delivery_seconds += time.perf_counter() - received_at
+
+    def _after_replay(self, payload: str) -> bool:
+        stream_id = payload_stream_id(payload)
+        if stream_id is None:
+            return True
+        if stream_offset(stream_id) <= self.replayed_through:
+            return False
+        self.replayed_through = None  # past the overlap, stop checking
+        return True
+
+
+class FanoutHub:
+    """Pushes Redis room messages to every websocket viewer of the room
+
+    One pubsub connection for the whole app, one channel subscription per
+    room no matter how many viewers it has: subscribed with the first viewer,
+    unsubscribed when the last one leaves.
+    """
+
+    def __init__(self, redis_client=None, max_queue: int = DEFAULT_MAX_QUEUE):
+        self.redis = redis_client or r
+        self.max_queue = max_queue
+        self.rooms: Dict[str, Set[Subscriber]] = {}
+        self._pubsub = None
+        self._ready = asyncio.Event()
+        self._task = None
+        self._stopping = False
+        self._lock = asyncio.Lock()
+
+        self.messages = 0
+        self.dropped = 0
+        self.sent = 0
+        self.delivery_seconds = 0.0
+
+    async def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            self._task = asyncio.create_task(self._read())
+
+    async def stop(self):
+        if self._task:
+            # redis-py can swallow a cancellation that lands inside get_message,
+            # so the reader also checks the flag on its next iteration
+            self._stopping = True
+            self._ready.set()
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._pubsub:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        self.rooms.clear()
+
+    async def join(self, room_id: str, websocket) -> Subscriber:
+        subscriber = Subscriber(websocket, self.max_queue)
+        async with self._lock:
+            viewers = self.rooms.setdefault(room_id, set())
+            viewers.add(subscriber)
+            if len(viewers) == 1:
+                await self._pubsub.subscribe(room_id)
+                self._ready.set()
+        return subscriber
+
+    async def leave(self, room_id: str, subscriber: Subscriber):
+        self.dropped += subscriber.dropped
+        self.sent += subscriber.sent
+        self.delivery_seconds += subscriber.delivery_seconds
+        async with self._lock:
+            viewers = self.rooms.get(room_id)
+            if viewers is None:
+                return
+            viewers.discard(subscriber)
+            if not viewers:
+                del self.rooms[room_id]
+                await self._pubsub.unsubscribe(room_id)
+
+    async def _read(self):
+        while not self._stopping:
+            # get_message returns immediately while nothing is subscribed
+            await self._ready.wait()
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error reading room messages: {e}")
+                await asyncio.sleep(1)
+                continue
+            if not message:
+                if not self.rooms:
+                    self._ready.clear()
+                continue
+
+            received_at = time.perf_counter()
+            channel = message["channel"]
+            data = message["data"]
+            viewers = self.rooms.get(channel.decode() if isinstance(channel, bytes) else channel, ())
+            payload = data.decode() if isinstance(data, bytes) else data
+            self.messages += 1
+            for subscriber in viewers:
+                subscriber.push(payload, received_at)
+
+    def stats(self) -> dict:
+        viewers = [subscriber for room in self.rooms.values() for subscriber in room]
+        sent = self.sent + sum(s.sent for s in viewers)
+        delivery = self.delivery_seconds + sum(s.delivery_seconds for s in viewers)
+        return {
+            "rooms": len(self.rooms),
+            "viewers": len(viewers),
+            "messages": self.messages,
+            "sent": sent,
+            "dropped": self.dropped + sum(s.dropped for s in viewers),
+            "avg_delivery_ms": round(delivery / sent * 1000, 2) if sent else 0,
+        }
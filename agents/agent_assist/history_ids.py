@@ -0,0 +1,111 @@
+import os
+import socket
+import threading
+import time
+import zlib
+
+# Snowflake-style transcript history ids, generated locally instead of
+# `INCR global:history_id`:
+#
+#   | 41 bits ms since EPOCH_MS | 4 bits worker | 3 bits process | 5 bits sequence |
+#
+# 53 bits in total, so ids stay exact as Lua numbers in Redis scripts and as
+# JavaScript numbers in the websocket clients. Ids are time ordered. The
+# worker/process components only make collisions between generators rare:
+# the process part is the pid mod 8 and the worker part a 4-bit hostname
+# hash, so two processes can still produce the same id in the same
+# millisecond. Ids are therefore not globally unique. Uniqueness and order
+# hold per room only: publish_transcript bumps an id that would not be
+# greater than the room's last one, atomically in Redis, so ids are unique
+# and increasing within a room even across processes with skewed clocks.
+# That is what the readers rely on (the backend dedupes segments per call).
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+WORKER_BITS = 4
+PROCESS_BITS = 3
+SEQUENCE_BITS = 5
+HISTORY_CURSOR_SKEW_MS = 5000  # history ids carry the publisher's clock, stream offsets Redis' clock
+
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_PROCESS_ID = (1 << PROCESS_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+NODE_SHIFT = SEQUENCE_BITS
+TIMESTAMP_SHIFT = WORKER_BITS + PROCESS_BITS + SEQUENCE_BITS
+
+
+def default_worker_id() -> int:
+    """HISTORY_ID_WORKER if set (distinct per host), else derived from the hostname"""
+    configured = os.getenv("HISTORY_ID_WORKER")
+    if configured is not None:
+        return int(configured) & MAX_WORKER_ID
+    return zlib.crc32(socket.gethostname().encode()) & MAX_WORKER_ID
+
+
+class HistoryIdGenerator:
+    """Time-ordered 53-bit ids, strictly increasing per generator
+
+    When the clock goes backwards or more than 32 ids are needed within one
+    millisecond, the generator keeps counting on its last timestamp (running
+    slightly ahead of the wall clock) instead of blocking.
+    """
+
+    def __init__(self, worker_id: int = None, process_id: int = None):
+        self.worker_id = default_worker_id() if worker_id is None else worker_id
+        if not 0 <= self.worker_id <= MAX_WORKER_ID:
+            raise ValueError(f"worker_id must be 0-{MAX_WORKER_ID}")
+        if process_id is not None and not 0 <= process_id <= MAX_PROCESS_ID:
+            raise ValueError(f"process_id must be 0-{MAX_PROCESS_ID}")
+        self._fixed_process_id = process_id
+        self._pid = None
+        self.node = 0
+        self._last_ms = 0
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def _refresh_node(self):
+        # The module-level generator is created before job processes fork
+        self._pid = os.getpid()
+        process_id = self._pid & MAX_PROCESS_ID if self._fixed_process_id is None else self._fixed_process_id
+        self.node = (self.worker_id << PROCESS_BITS) | process_id
+
+    def next_id(self) -> int:
+        with self._lock:
+            if self._pid != os.getpid():
+                self._refresh_node()
+            now_ms = int(time.time() * 1000) - EPOCH_MS
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            elif self._sequence < MAX_SEQUENCE:
+                self._sequence += 1
+            else:
+                self._last_ms += 1
+                self._sequence = 0
+            return (self._last_ms << TIMESTAMP_SHIFT) | (self.node << NODE_SHIFT) | self._sequence
+
+
+def history_id_timestamp_ms(history_id: int) -> int:
+    """Unix time in ms at which an id was generated"""
+    return (history_id >> TIMESTAMP_SHIFT) + EPOCH_MS
+
+
+def history_range_start(since):
+    """XRANGE start and history id filter for a `since` cursor
+
+    The cursor is either a stream offset ("<ms>-<seq>", exclusive) or a
+    history id. A history id is turned into a stream offset a little before
+    the time it was generated, and entries up to that id are filtered out.
+    History ids carry the publisher's clock, so that is only best effort
+    (entries from a publisher more than HISTORY_CURSOR_SKEW_MS ahead can be
+    missed) and kept for clients that only have an id; the worker's own
+    catch-up and the backend sync resume from stream ids.
+    """
+    if since is None or since == "":
+        return "-", None
+    since = str(since)
+    if "-" in since:
+        return f"({since}", None
+    history_id = int(since)
+    return str(max(0, history_id_timestamp_ms(history_id) - HISTORY_CURSOR_SKEW_MS)), history_id
+
+
+history_ids = HistoryIdGenerator()
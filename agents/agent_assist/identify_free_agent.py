@@ -1,37 +1,57 @@
 #Identify free human agent, transcriber agent, and main agent for the context.
+#Backed by the Redis availability registry in agent_registry.py: the pick is atomic across
+#all workers and the agent stays leased to `holder` (the room) until lease.release().
 
-def free_human_agent(use_case=None):
+try:
+    from agent_registry import HUMAN, MAIN, TRANSCRIBER, DEFAULT_LEASE_SECONDS, agent_registry
+except ImportError:  # imported as agent_assist.identify_free_agent
+    from agent_assist.agent_registry import HUMAN, MAIN, TRANSCRIBER, DEFAULT_LEASE_SECONDS, agent_registry
+
+
+async def _claim_free_agent(kind, use_case, holder, lease_seconds, no_agent_msg):
+    lease = await agent_registry.claim(kind, use_case, holder, lease_seconds)
+    if lease is None:
+        return {"status": False, "payload": {}, "msg": no_agent_msg}
+    return {"status": True, "payload": lease.payload, "msg": "Success", "lease": lease}
+
+
+async def free_human_agent(use_case=None, holder="", lease_seconds=DEFAULT_LEASE_SECONDS):
     """"
-    Check the db/memory for free human agents for use_case (marketing, sales, post purchase, etc.).
-    If there are free human agents, return the first one based on the priority.
-    Positive output: {"status": True, "payload": {"name": "Nitish", "phone": "+917055888820"}, "msg": "Success"}
+    Check the registry for free human agents for use_case (marketing, sales, post purchase, etc.).
+    If there are free human agents, lease the first one based on the priority.
+    Positive output: {"status": True, "payload": {"name": "Nitish", "phone": "+917055888820", "agent_id": "..."}, "msg": "Success", "lease": AgentLease}
     Negative Output: {"status": False, "payload": {}, "msg": "No free human agent"}
     """
-    return '+919404434272'
+    return await _claim_free_agent(HUMAN, use_case, holder, lease_seconds, "No free human agent")
 
-def free_transcriber_agent():
+async def free_transcriber_agent(holder="", lease_seconds=DEFAULT_LEASE_SECONDS):
     """"
-    Check the db/memory for free transcriber agents.
-    If there are free transcriber agents, return the first one based on the priority.
-    Positive output: {"status": True, "payload": {"name": "transcriber-1", "agent_id": "agent_axy1276bn_123"}, "msg": "Success"}
+    Check the registry for free transcriber agents.
+    If there are free transcriber agents, lease the first one based on the priority.
+    Positive output: {"status": True, "payload": {"name": "transcriber-1", "agent_id": "agent_axy1276bn_123"}, "msg": "Success", "lease": AgentLease}
     Negative Output: {"status": False, "payload": {}, "msg": "No free transcriber agent"}
     """
-    #Maintain a counter.
-    pass
+    return await _claim_free_agent(TRANSCRIBER, None, holder, lease_seconds, "No free transcriber agent")
 
-def free_main_agent():
+async def free_main_agent(holder="", lease_seconds=DEFAULT_LEASE_SECONDS):
     """"
-    Check the db/memory for free main agents.
-    If there are free main agents, return the first one based on the priority.
-    Positive output: {"status": True, "payload": {"name": "outbound-caller-1", "agent_id": "agent_nmp1086bn_3b8"}, "msg": "Success"}
+    Check the registry for free main agents.
+    If there are free main agents, lease the first one based on the priority.
+    Positive output: {"status": True, "payload": {"name": "outbound-caller-1", "agent_id": "agent_nmp1086bn_3b8"}, "msg": "Success", "lease": AgentLease}
     Negative Output: {"status": False, "payload": {}, "msg": "No free main agent"}
     """
-    pass
+    return await _claim_free_agent(MAIN, None, holder, lease_seconds, "No free main agent")
 
 
 if __name__ == "__main__":
-    human_agent = free_human_agent()
-    if human_agent:
-        print(f"Free human agent found: {human_agent}")
-    else:
-        print("No free human agent found")
\ No newline at end of file
+    import asyncio
+
+    async def main():
+        human_agent = await free_human_agent(holder="identify_free_agent-cli")
+        if human_agent["status"]:
+            print(f"Free human agent found: {human_agent['payload']}")
+            await human_agent["lease"].release()
+        else:
+            print("No free human agent found")
+
+    asyncio.run(main())
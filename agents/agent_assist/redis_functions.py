@@ -4,26 +4,154 @@ import os
 import time
 from dotenv import load_dotenv
 
+try:
+    from history_ids import history_ids, history_range_start
+except ImportError:  # imported as agent_assist.redis_functions
+    from agent_assist.history_ids import history_ids, history_range_start
+
 load_dotenv(dotenv_path="/app/.env.local")
 redis_host = os.getenv("REDIS_HOST")
 
 r = redis.Redis(host=redis_host, port=6379, decode_responses=True)
 
+PARTIAL_CHANNEL_SUFFIX = ":partial"  # Interim STT results, published only (never stored in history)
+
+def partial_channel(room_id):
+    return f"{room_id}{PARTIAL_CHANNEL_SUFFIX}"
+
+ROOM_STREAM_PREFIX = "room_stream:"  # STREAM of transcript messages per room (replaces the room_history:{room} list)
+ROOM_STREAM_MAXLEN = 2000  # entries kept per room, trimmed approximately on every write
+ROOM_STREAM_LIVE_TTL_SECONDS = 2 * 24 * 3600  # refreshed on every write, covers rooms that never end cleanly
+ROOM_STREAM_ENDED_TTL_SECONDS = 24 * 3600  # retention once the call has ended
+ROOM_LAST_ID_PREFIX = "room_last_history_id:"  # Last history id used in the room
+ROOM_ENDED_PREFIX = "room_ended:"  # Set when the call ends, expires with the room's history
+
+def room_stream(room_id):
+    return f"{ROOM_STREAM_PREFIX}{room_id}"
+
+def room_last_id_key(room_id):
+    return f"{ROOM_LAST_ID_PREFIX}{room_id}"
+
+def room_ended_key(room_id):
+    return f"{ROOM_ENDED_PREFIX}{room_id}"
+
+# Append to the room stream (trimmed, with TTL) and publish to live
+# subscribers in one round trip. The locally generated history id is bumped
+# past the room's last one if needed (another process with a skewed clock),
+# so ids only ever increase within a room. The JSON body comes without its
+# opening brace so the id can be prepended without decoding it here. Once
+# the call has ended (end_room_history), late writes such as an agent-assist
+# suggestion keep the ended retention instead of extending it again.
+PUBLISH_TRANSCRIPT_SCRIPT = r.register_script("""
+local ttl = ARGV[4]
+local ended_ttl = redis.call('TTL', KEYS[3])
+if ended_ttl > 0 then
+    ttl = ended_ttl
+end
+local history_id = tonumber(ARGV[1])
+local last_id = tonumber(redis.call('GET', KEYS[1]) or '0')
+if history_id <= last_id then
+    history_id = last_id + 1
+end
+history_id = string.format('%.0f', history_id)
+redis.call('SET', KEYS[1], history_id, 'EX', ttl)
+local payload = '{"history_id": ' .. history_id .. ', ' .. ARGV[2]
+local stream_id = redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[3], '*', 'data', payload)
+redis.call('EXPIRE', KEYS[2], ttl)
+redis.call('PUBLISH', ARGV[5], '{"stream_id": "' .. stream_id .. '", ' .. string.sub(payload, 2))
+return {history_id, stream_id}
+""")
+
 async def get_history_id():
-    return await r.incr("global:history_id")
+    return history_ids.next_id()
 
-async def publish_transcript(room_id, speaker, message):
-    history_id = await get_history_id()
+async def publish_transcript(room_id, speaker, message, metadata=None):
+    """Store and publish one transcript message, returns (history_id, stream_id)"""
     data = {
-        "history_id": history_id,
         "timestamp": int(time.time() * 1000),
         "room_id": room_id,
         "speaker": speaker,
         "message": message
     }
-    await r.publish(room_id, json.dumps(data))
-    history_key = f"room_history:{room_id}"
-    await r.lpush(history_key, json.dumps(data))
+    if metadata:
+        data.update(metadata)
+    history_id, stream_id = await PUBLISH_TRANSCRIPT_SCRIPT(
+        keys=[room_last_id_key(room_id), room_stream(room_id), room_ended_key(room_id)],
+        args=[history_ids.next_id(), json.dumps(data)[1:], ROOM_STREAM_MAXLEN, ROOM_STREAM_LIVE_TTL_SECONDS, room_id],
+    )
+    return int(history_id), stream_id
+
+async def end_room_history(room_id, ttl=ROOM_STREAM_ENDED_TTL_SECONDS):
+    """The call is over: keep its transcript stream only for `ttl` more seconds"""
+    async with r.pipeline(transaction=False) as pipe:
+        pipe.set(room_ended_key(room_id), 1, ex=ttl)
+        pipe.expire(room_stream(room_id), ttl)
+        pipe.expire(room_last_id_key(room_id), ttl)
+        await pipe.execute()
+
+def _parse_entries(entries):
+    messages = []
+    for stream_id, fields in entries:
+        try:
+            data = json.loads(fields["data"])
+        except (KeyError, TypeError, json.JSONDecodeError):
+            continue
+        data["stream_id"] = stream_id
+        messages.append(data)
+    return messages
+
+async def read_room_history(room_id, since=None, count=None):
+    """Messages of the room oldest first, only those after the `since` cursor if given
+
+    Costs O(new messages): the stream is read from the cursor on, never whole.
+    """
+    start, after_history_id = history_range_start(since)
+    key = room_stream(room_id)
+    while True:
+        entries = await r.xrange(key, min=start, max="+", count=count)
+        messages = _parse_entries(entries)
+        if after_history_id is not None:
+            messages = [msg for msg in messages if msg.get("history_id", 0) > after_history_id]
+        # Only entries inside the clock skew margin were read, keep going
+        if messages or not count or len(entries) < count:
+            return messages
+        start = f"({entries[-1][0]}"
+
+async def read_room_history_tail(room_id, count):
+    """The last `count` messages of the room, oldest first"""
+    entries = await r.xrevrange(room_stream(room_id), max="+", min="-", count=count)
+    return _parse_entries(entries[::-1])
+
+async def read_room_group(room_id, group, consumer, count=100):
+    """Messages not yet delivered to consumer `group`; acknowledge them with ack_room_group"""
+    key = room_stream(room_id)
+    try:
+        await r.xgroup_create(key, group, id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+    # Entries delivered earlier but never acknowledged (consumer crashed) come first
+    pending = await r.xreadgroup(group, consumer, {key: "0"}, count=count)
+    entries = pending[0][1] if pending else []
+    if not entries:
+        fresh = await r.xreadgroup(group, consumer, {key: ">"}, count=count)
+        entries = fresh[0][1] if fresh else []
+    return _parse_entries(entries)
+
+async def ack_room_group(room_id, group, stream_ids):
+    if stream_ids:
+        await r.xack(room_stream(room_id), group, *stream_ids)
+
+async def publish_partial_transcript(room_id, message, seq):
+    """Publish an interim user transcript; cheap and fire-and-forget, no history id"""
+    data = {
+        "seq": seq,
+        "timestamp": int(time.time() * 1000),
+        "room_id": room_id,
+        "speaker": "user",
+        "message": message
+    }
+    await r.publish(partial_channel(room_id), json.dumps(data))
 
 if __name__ == "__main__":
     # Example usage
@@ -1,127 +1,466 @@
 """
-Subscribes to the pub-sub channel and keeps waiting for msgs.
-If msg from a particular speaker is received, it will send a post api request to /publish/{room_id}
-with the transcript dictionary.
+Subscribes to the pub-sub channels of all live rooms and keeps waiting for msgs.
+If msg from the user is received, it will send a post api request to the response generation API
+with the transcript dictionary and publish the suggestion back to the room.
 The whole chat can be accessed by using the api: http://sbi.vaaniresearch.com:8002/api/room_history/{room_id}
+(stored in the room_stream:{room_id} Redis stream, see redis_functions.py)
 """
 
 #Imports
 import asyncio
-import redis
 import json
-import requests
-import aiohttp
+import os
+import sys
 import time
-import aioredis
+import zlib
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import aiohttp
+import psutil
 from redis_functions import *
+from rolling_context import RollingContext
+from speculation import PARTIAL_STABLE_SECONDS, normalize_transcript, transcripts_match
 
 
 filter_list = []
 disconnection_timeout = 60  # seconds
+HISTORY_LOAD_LIMIT = 200  # messages read back when a room starts being served
+CONTEXT_TOKEN_BUDGET = 1500  # tokens of conversation sent with each suggestion request
 
-async def publish_transcription(room_id: str, transcription: str):
-    # url = f"http://sbi.vaaniresearch.com:1248/publish/{room_id}"
-    url = f"http://sbi.vaaniresearch.com:1247/agent_assist/response_generation"
-    headers = {
-        "accept": "application/json",
-        "Content-Type": "application/json"
-    }
+RESPONSE_GENERATION_URL = "http://sbi.vaaniresearch.com:1247/agent_assist/response_generation"
+SUGGESTION_DEBOUNCE = 0.3  # seconds a user utterance waits for a follow-up before a suggestion is requested
+SUGGESTION_TIMEOUT = 30  # seconds
+LATENCY_SAMPLES = 500
+# Published with a suggestion whose utterance had a speculation that did not hold (see speculation.py)
+DISCARDED_SPECULATION = {"speculative": False, "speculation_discarded": True}
+
+_http_session: Optional[aiohttp.ClientSession] = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Keep-alive session shared by every suggestion request of the process"""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=SUGGESTION_TIMEOUT),
+            headers={"accept": "application/json", "Content-Type": "application/json"},
+        )
+    return _http_session
+
+
+async def close_http_session():
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+
+async def request_suggestion(transcription: dict):
+    """
+    Ask response generation for a suggestion. Returns (status, message).
+    """
     payload = {
             "transcription": transcription
     }
+    async with get_http_session().post(RESPONSE_GENERATION_URL, json=payload) as response:
+        status = response.status
+        resp_text = await response.text()
+    print(f"Response [{status}]: {resp_text}")
+    try:
+        message = json.loads(resp_text).get("message", "")
+    except (json.JSONDecodeError, AttributeError):
+        message = resp_text
+    return status, message
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, json=payload) as response:
-            status = response.status
-            resp_text = await response.text()
-            print(f"Response [{status}]: {resp_text}")
-            try:
-                resp_json = json.loads(resp_text)
-                message = resp_json.get("message", "")
-            except json.JSONDecodeError:
-                message = resp_text
-            # print(f"Response: {response['message']}")
-            await publish_transcript(room_id, "llm", message)
-            return status, resp_text
-
-async def get_chat_history(room_id: str):
+
+async def publish_transcription(room_id: str, transcription: dict):
+    status, message = await request_suggestion(transcription)
+    await publish_transcript(room_id, "llm", message)
+    return status, message
+
+async def get_chat_history(room_id: str, limit: int = HISTORY_LOAD_LIMIT) -> List[dict]:
     """
-    Get the chat history from Redis for the given room_id.
+    Get the last `limit` messages of the room from its transcript stream, oldest first.
     """
+    messages = await read_room_history_tail(room_id, limit)
+    return [msg for msg in messages if msg.get('speaker') not in filter_list]
 
-    redis = aioredis.from_url(f"redis://sbi.vaaniresearch.com:6379", decode_responses=True)
-    history_key = f"room_history:{room_id}"
-    messages = await redis.lrange(history_key, 0, -1)
-    try:
-        parsed = [json.loads(msg) for msg in messages]
-        final_msg = ""
-        for msg in parsed[::-1]:  # Reverse the order to get the latest messages first
-            if msg['speaker'] in filter_list:
-                continue
-            final_msg += f"{msg['speaker']}: {msg['message']}\n"
+@dataclass
+class Speculation:
+    """A suggestion requested for an interim transcript before the final one landed"""
+    text: str
+    task: asyncio.Task
+    started_at: float = field(default_factory=time.perf_counter)
 
-    except Exception:
-        parsed = []
 
-    # print(f"get_chat_history function called")
-    return final_msg
+@dataclass
+class RoomState:
+    """Everything the worker keeps for one live room"""
+    room_id: str
+    context: RollingContext = field(default_factory=lambda: RollingContext(CONTEXT_TOKEN_BUDGET))
+    created_at: float = field(default_factory=time.time)
+    last_activity: float = field(default_factory=time.time)
+    messages: int = 0
+    suggestion_task: Optional[asyncio.Task] = None
+    suggestion_seq: int = 0
+    # Live messages arriving while the stored history is still being loaded
+    pending: Optional[List[dict]] = field(default_factory=list)
+    last_history_id: int = 0
+    last_stream_id: Optional[str] = None  # cursor to catch up from after a pubsub outage
+    # Interim user transcript and the speculative suggestion made for it
+    partial_text: str = ""
+    stabilize_task: Optional[asyncio.Task] = None
+    speculation: Optional[Speculation] = None
 
-async def subscribe_to_channel(room_id: str):
-    """
-    Subscribe to the Redis channel and listen for messages.
-    If no message is received for 60 seconds, disconnect.
+    def add_message(self, data: dict):
+        self.last_activity = time.time()
+        if self.pending is not None:
+            self.pending.append(data)
+            return
+        history_id = data.get("history_id")
+        if isinstance(history_id, int):
+            if history_id <= self.last_history_id:
+                return  # already part of the loaded history
+            self.last_history_id = history_id
+        if data.get("stream_id"):
+            self.last_stream_id = data["stream_id"]
+        self.messages += 1
+        self.context.add(data['speaker'], data['message'])
+
+    def load_history(self, history: List[dict]):
+        """Seed the context with stored history, then replay what arrived meanwhile"""
+        pending, self.pending = self.pending, None
+        for data in history + pending:
+            self.add_message(data)
+
+    def transcript(self) -> str:
+        return self.context.render()
+
+    def take_speculation(self) -> Optional[Speculation]:
+        """Stop speculating on partials and hand over the current speculation, if any"""
+        if self.stabilize_task:
+            self.stabilize_task.cancel()
+            self.stabilize_task = None
+        speculation, self.speculation = self.speculation, None
+        self.partial_text = ""
+        return speculation
+
+    def cancel_tasks(self):
+        speculation = self.take_speculation()
+        if speculation:
+            speculation.task.cancel()
+        if self.suggestion_task:
+            self.suggestion_task.cancel()
+
+    def size_bytes(self) -> int:
+        return sys.getsizeof(self) + self.context.size_bytes()
+
+
+class AgentAssistWorker:
+    """One asyncio worker serving agent-assist for every live room of the process
+
+    Rooms are spread over `shards` pubsub connections (crc32 of the room id),
+    each read by a single task, so the process needs a handful of Redis
+    connections instead of one interpreter per room. Per-room state lives in
+    an in-memory registry; rooms without messages for `idle_timeout`
+    seconds are unsubscribed and dropped.
     """
-    r = redis.Redis(host='sbi.vaaniresearch.com', port=6379, decode_responses=True)
-    pubsub = r.pubsub()
-    await pubsub.subscribe(room_id)
 
-    history_subscribed = await get_chat_history(room_id)
+    def __init__(self, redis_client=None, shards: int = 4, idle_timeout: float = disconnection_timeout):
+        self.redis = redis_client or r
+        self.shards = shards
+        self.idle_timeout = idle_timeout
+        self.rooms: Dict[str, RoomState] = {}
+        self._pubsubs = []
+        self._shard_ready: List[asyncio.Event] = []
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+        self.rooms_started = 0
+        self.rooms_evicted = 0
+        self.suggestions_requested = 0
+        self.suggestions_superseded = 0
+        self.suggestions_published = 0
+        self.suggestions_failed = 0
+        self.suggestion_latencies = deque(maxlen=LATENCY_SAMPLES)  # utterance -> suggestion, seconds
+        self.speculations_started = 0
+        self.speculations_confirmed = 0
+        self.speculations_discarded = 0
 
-    inactivity_timeout = disconnection_timeout 
-    last_message_time = time.time()
+    async def start(self):
+        if self._tasks:
+            return
+        self._stopping = False
+        for shard in range(self.shards):
+            self._pubsubs.append(self.redis.pubsub(ignore_subscribe_messages=True))
+            self._shard_ready.append(asyncio.Event())
+            self._tasks.append(asyncio.create_task(self._read_shard(shard)))
+        self._tasks.append(asyncio.create_task(self._evict_idle_rooms()))
 
-    try:
+    async def stop(self):
+        # redis-py can swallow a cancellation that lands inside get_message,
+        # so the shard readers also check the flag on their next iteration
+        self._stopping = True
+        for ready in self._shard_ready:
+            ready.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for room in self.rooms.values():
+            room.cancel_tasks()
+        for pubsub in self._pubsubs:
+            await pubsub.aclose()
+        await close_http_session()
+        self._tasks, self._pubsubs, self._shard_ready = [], [], []
+        self.rooms.clear()
+
+    def _shard_of(self, room_id: str) -> int:
+        return zlib.crc32(room_id.encode()) % self.shards
+
+    def is_room_active(self, room_id: str) -> bool:
+        return room_id in self.rooms
+
+    async def add_room(self, room_id: str) -> RoomState:
+        """Start serving a room (no-op if it is already served)"""
+        room = self.rooms.get(room_id)
+        if room:
+            room.last_activity = time.time()
+            return room
+
+        room = RoomState(room_id=room_id)
+        self.rooms[room_id] = room
+        self.rooms_started += 1
+        shard = self._shard_of(room_id)
+        await self._pubsubs[shard].subscribe(room_id, partial_channel(room_id))
+        self._shard_ready[shard].set()
+
+        try:
+            history = await get_chat_history(room_id)
+        except Exception as e:
+            print(f"Could not load history for {room_id}: {e}")
+            history = []
+        room.load_history(history)
+        print(f"Serving agent-assist for {room_id} (shard {shard}, {len(self.rooms)} rooms)")
+        return room
+
+    async def remove_room(self, room_id: str) -> bool:
+        room = self.rooms.pop(room_id, None)
+        if not room:
+            return False
+        room.cancel_tasks()
+        await self._pubsubs[self._shard_of(room_id)].unsubscribe(room_id, partial_channel(room_id))
+        return True
+
+    async def _read_shard(self, shard: int):
+        pubsub = self._pubsubs[shard]
+        ready = self._shard_ready[shard]
+        while not self._stopping:
+            # get_message returns immediately while nothing is subscribed
+            await ready.wait()
+            try:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error reading shard {shard}: {e}")
+                await asyncio.sleep(1)
+                await self._catch_up(shard)
+                continue
+            if not message:
+                if not any(self._shard_of(room_id) == shard for room_id in self.rooms):
+                    ready.clear()
+                continue
+            self._handle_message(message)
+
+    async def _catch_up(self, shard: int):
+        """Read what the shard's rooms missed while pubsub was down (only the new entries)"""
+        for room in [room for room_id, room in self.rooms.items() if self._shard_of(room_id) == shard]:
+            if room.pending is not None or not room.last_stream_id:
+                continue
+            try:
+                missed = await read_room_history(room.room_id, since=room.last_stream_id)
+            except Exception as e:
+                print(f"Could not catch up {room.room_id}: {e}")
+                continue
+            for data in missed:
+                room.add_message(data)
+
+    def _handle_message(self, message: dict):
+        channel = message["channel"]
+        channel = channel.decode() if isinstance(channel, bytes) else channel
+        is_partial = channel.endswith(PARTIAL_CHANNEL_SUFFIX)
+        room = self.rooms.get(channel[:-len(PARTIAL_CHANNEL_SUFFIX)] if is_partial else channel)
+        if not room:
+            return
+        try:
+            data = json.loads(message["data"])
+            if is_partial:
+                self._handle_partial(room, data)
+                return
+            room.add_message(data)
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            print(f"Skipping malformed message in {room.room_id}: {e}")
+            return
+
+        if str(data.get("speaker", "")).lower() == "user":
+            utterance_at = time.perf_counter()
+            speculation = room.take_speculation()
+            # A newer utterance supersedes whatever is still debouncing or in flight
+            if room.suggestion_task and not room.suggestion_task.done():
+                room.suggestion_task.cancel()
+                self.suggestions_superseded += 1
+            room.suggestion_seq += 1
+
+            if speculation and transcripts_match(speculation.text, data["message"]):
+                self.speculations_confirmed += 1
+                suggestion = self._confirm_speculation(room, room.suggestion_seq, utterance_at, speculation)
+            else:
+                outcome = None
+                if speculation:
+                    speculation.task.cancel()
+                    self.speculations_discarded += 1
+                    outcome = DISCARDED_SPECULATION
+                suggestion = self._generate_suggestion(room, room.suggestion_seq, utterance_at, outcome)
+            # Never block the shard reader on the suggestion round trip
+            room.suggestion_task = asyncio.create_task(suggestion)
+
+    def _handle_partial(self, room: RoomState, data: dict):
+        """Interim user transcript: speculate once it stops changing"""
+        if room.pending is not None:
+            return  # history still loading, the context is not ready yet
+        text = data["message"]
+        if normalize_transcript(text) == normalize_transcript(room.partial_text):
+            return
+        room.last_activity = time.time()
+        room.partial_text = text
+        if room.stabilize_task:
+            room.stabilize_task.cancel()
+        room.stabilize_task = asyncio.create_task(self._speculate(room, text))
+
+    async def _speculate(self, room: RoomState, text: str):
+        await asyncio.sleep(PARTIAL_STABLE_SECONDS)
+        if room.speculation:
+            if transcripts_match(room.speculation.text, text):
+                return  # the running speculation already covers this partial
+            room.speculation.task.cancel()
+            self.speculations_discarded += 1
+        # The final transcript will be appended as the latest user turn, do the same now
+        transcript = room.transcript() + f"user: {text}\n"
+        room.speculation = Speculation(text, asyncio.create_task(request_suggestion({"transcript": transcript})))
+        self.speculations_started += 1
+        self.suggestions_requested += 1
+
+    async def _confirm_speculation(self, room: RoomState, seq: int, utterance_at: float, speculation: Speculation):
+        """The final transcript matches the partial: publish the suggestion requested for it"""
+        try:
+            _, message = await speculation.task
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.suggestions_failed += 1
+            print(f"Speculative suggestion failed for {room.room_id}, requesting again: {e}")
+            # The utterance is final already, debouncing would only add to the delay
+            await self._request_suggestion(room, seq, utterance_at, DISCARDED_SPECULATION)
+            return
+        if seq != room.suggestion_seq:
+            return
+
+        latency = time.perf_counter() - utterance_at
+        head_start = utterance_at - speculation.started_at
+        await publish_transcript(room.room_id, "llm", message, {
+            "suggestion_latency_ms": round(latency * 1000),
+            "speculative": True,
+            "speculation_head_start_ms": round(head_start * 1000),
+        })
+        self.suggestion_latencies.append(latency)
+        self.suggestions_published += 1
+        print(f"Speculative suggestion for {room.room_id} published {latency:.2f} seconds after the utterance "
+              f"(requested {head_start:.2f} seconds before it)")
+
+    async def _generate_suggestion(self, room: RoomState, seq: int, utterance_at: float, metadata: Optional[dict] = None):
+        # Debounce: a burst of utterances ends up as a single request
+        await asyncio.sleep(SUGGESTION_DEBOUNCE)
+        await self._request_suggestion(room, seq, utterance_at, metadata)
+
+    async def _request_suggestion(self, room: RoomState, seq: int, utterance_at: float, metadata: Optional[dict] = None):
+        self.suggestions_requested += 1
+        try:
+            _, message = await request_suggestion({"transcript": room.transcript()})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.suggestions_failed += 1
+            print(f"Error generating suggestion for {room.room_id}: {e}")
+            return
+        if seq != room.suggestion_seq:
+            return  # superseded while the response was being read
+
+        latency = time.perf_counter() - utterance_at
+        await publish_transcript(room.room_id, "llm", message, {"suggestion_latency_ms": round(latency * 1000), **(metadata or {})})
+        self.suggestion_latencies.append(latency)
+        self.suggestions_published += 1
+        print(f"Suggestion for {room.room_id} published {latency:.2f} seconds after the utterance")
+
+    async def _evict_idle_rooms(self):
         while True:
-            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
-
-            if message:
-                last_message_time = time.time()  # Reset the timer
-
-                data = json.loads(message['data'])
-                history_subscribed += f"{data['speaker']}: {data['message']}\n"
-
-                if data.get('speaker') in ["User"]:
-                    print("################################################")
-                    start_time = time.perf_counter()
-                    print(f"history: {history_subscribed}")
-                    content = {
-                        "transcript": history_subscribed
-                    }
-                    await publish_transcription(room_id, content)
-                    time_taken = time.perf_counter() - start_time
-                    print(f"Time taken to process and publish transcription: {time_taken:.2f} seconds")
-                    print("################################################")
-
-            # Check for inactivity timeout
-            if time.time() - last_message_time > inactivity_timeout:
-                print(f"No messages received for {inactivity_timeout} seconds. Disconnecting.")
-                break
-
-            await asyncio.sleep(0.1)
-
-    except Exception as e:
-        print(f"Error: {e}")
+            await asyncio.sleep(min(10, self.idle_timeout))
+            now = time.time()
+            for room_id in [room_id for room_id, room in self.rooms.items() if now - room.last_activity > self.idle_timeout]:
+                print(f"No messages received for {self.idle_timeout} seconds in {room_id}. Disconnecting.")
+                await self.remove_room(room_id)
+                self.rooms_evicted += 1
+
+    def stats(self) -> dict:
+        rooms = len(self.rooms)
+        rss = psutil.Process().memory_info().rss
+        state_bytes = sum(room.size_bytes() for room in self.rooms.values())
+        return {
+            "pid": os.getpid(),
+            "rooms": rooms,
+            "shards": self.shards,
+            "rooms_started": self.rooms_started,
+            "rooms_evicted": self.rooms_evicted,
+            "rss_mb": round(rss / 2**20, 1),
+            "rss_per_room_kb": round(rss / rooms / 1024, 1) if rooms else None,
+            "state_per_room_kb": round(state_bytes / rooms / 1024, 2) if rooms else None,
+            "suggestions": self.suggestion_stats(),
+        }
+
+    def suggestion_stats(self) -> dict:
+        latencies = sorted(self.suggestion_latencies)
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1000) if latencies else None
+
+        return {
+            "requested": self.suggestions_requested,
+            "superseded": self.suggestions_superseded,
+            "published": self.suggestions_published,
+            "failed": self.suggestions_failed,
+            "latency_p50_ms": percentile(50),
+            "latency_p95_ms": percentile(95),
+            "speculations_started": self.speculations_started,
+            "speculations_confirmed": self.speculations_confirmed,
+            "speculations_discarded": self.speculations_discarded,
+        }
+
+
+async def subscribe_to_channel(*room_ids: str):
+    """
+    Serve the given rooms from one worker until all of them went idle.
+    """
+    worker = AgentAssistWorker()
+    await worker.start()
+    for room_id in room_ids:
+        await worker.add_room(room_id)
+    try:
+        while worker.rooms:
+            await asyncio.sleep(1)
     finally:
-        await pubsub.unsubscribe(room_id)
-        await pubsub.aclose()
+        await worker.stop()
 
 
 if __name__ == "__main__":
-    #Take the room_id from the user
-    import sys
-    room_id = sys.argv[1]
-    asyncio.run(subscribe_to_channel(room_id))
-    # room_id = "room1"
-    # print(f"Starting subscription to channel: {room_id}")
-    # asyncio.run(subscribe_to_channel(room_id))
-    # # asyncio.run(get_chat_history(room_id))
\ No newline at end of file
+    #Take the room_ids from the user
+    asyncio.run(subscribe_to_channel(*sys.argv[1:]))
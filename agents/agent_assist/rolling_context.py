@@ -0,0 +1,79 @@
+from collections import deque
+from typing import Deque, Tuple
+
+CHARS_PER_TOKEN = 4  # rough estimate, good enough for budgeting prompt size
+SUMMARY_WORDS_PER_TURN = 12  # words kept from a turn once it leaves the recent window
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class RollingContext:
+    """Bounded conversation context for one room, updated one turn at a time
+
+    The last `recent_turns` turns are kept verbatim. A turn pushed out of that
+    window is compacted to its first few words and appended to a summary of
+    older turns; once the summary exceeds its share of `token_budget` its
+    oldest lines are dropped and only counted. Adding a turn is O(1) and
+    `render()` never returns more than about `token_budget` tokens, however
+    long the call gets.
+    """
+
+    def __init__(self, token_budget: int = 1500, recent_turns: int = 12, summary_share: float = 0.25):
+        self.token_budget = token_budget
+        self.recent_turns = recent_turns
+        self.summary_budget = int(token_budget * summary_share)
+        self._recent: Deque[Tuple[str, int]] = deque()  # (line, tokens)
+        self._recent_tokens = 0
+        self._summary: Deque[Tuple[str, int]] = deque()
+        self._summary_tokens = 0
+        self.omitted_turns = 0
+        self.turns = 0
+
+    def add(self, speaker: str, message: str):
+        line = f"{speaker}: {message}\n"
+        tokens = estimate_tokens(line)
+        self._recent.append((line, tokens))
+        self._recent_tokens += tokens
+        self.turns += 1
+
+        # Keep the verbatim window within its turn count and its share of the budget
+        recent_budget = self.token_budget - self.summary_budget
+        while len(self._recent) > 1 and (len(self._recent) > self.recent_turns or self._recent_tokens > recent_budget):
+            old_line, old_tokens = self._recent.popleft()
+            self._recent_tokens -= old_tokens
+            self._compact(old_line)
+
+    def _compact(self, line: str):
+        speaker, _, message = line.partition(": ")
+        words = message.split()
+        short = " ".join(words[:SUMMARY_WORDS_PER_TURN])
+        if len(words) > SUMMARY_WORDS_PER_TURN:
+            short += " ..."
+        summary_line = f"- {speaker}: {short}\n"
+        tokens = estimate_tokens(summary_line)
+        self._summary.append((summary_line, tokens))
+        self._summary_tokens += tokens
+        while self._summary and self._summary_tokens > self.summary_budget:
+            _, dropped_tokens = self._summary.popleft()
+            self._summary_tokens -= dropped_tokens
+            self.omitted_turns += 1
+
+    def render(self) -> str:
+        parts = []
+        if self.omitted_turns or self._summary:
+            parts.append("Earlier in the conversation")
+            if self.omitted_turns:
+                parts.append(f" ({self.omitted_turns} older turns omitted)")
+            parts.append(":\n")
+            parts.extend(line for line, _ in self._summary)
+            parts.append("Recent turns:\n")
+        parts.extend(line for line, _ in self._recent)
+        return "".join(parts)
+
+    def tokens(self) -> int:
+        return self._recent_tokens + self._summary_tokens
+
+    def size_bytes(self) -> int:
+        return sum(len(line) for line, _ in self._recent) + sum(len(line) for line, _ in self._summary)
@@ -0,0 +1,23 @@
+import re
+from difflib import SequenceMatcher
+
+PARTIAL_STABLE_SECONDS = 0.35  # an interim transcript unchanged this long is worth speculating on
+MATCH_THRESHOLD = 0.85  # similarity a final transcript needs to confirm a speculation
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_transcript(text: str) -> str:
+    """Interim and final STT results differ mostly in casing and punctuation"""
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub("", text.lower())).strip()
+
+
+def transcripts_match(partial: str, final: str, threshold: float = MATCH_THRESHOLD) -> bool:
+    """Whether a suggestion made for `partial` still holds for the `final` transcript"""
+    partial, final = normalize_transcript(partial), normalize_transcript(final)
+    if not partial or not final:
+        return False
+    if partial == final:
+        return True
+    return SequenceMatcher(None, partial, final).ratio() >= threshold
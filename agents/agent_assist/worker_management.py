@@ -1,32 +1,24 @@
-import subprocess
-import psutil
+from redis_worker import AgentAssistWorker
 
-active_processes = {}
+# All rooms of this process are served by one multiplexed worker
+assist_worker = AgentAssistWorker()
 
 def is_worker_running(room_id):
-    for proc in psutil.process_iter(['pid', 'cmdline']):
-        if proc.info['cmdline'] and "redis_worker.py" in proc.info['cmdline']:
-            if room_id in proc.info['cmdline']:
-                return True
-    return False
+    return assist_worker.is_room_active(room_id)
 
-def start_worker(room_id):
+async def start_worker(room_id):
     if not is_worker_running(room_id):
         print(f"Starting worker for {room_id}")
-        subprocess.Popen(["python3", "redis_worker.py", room_id])
+        await assist_worker.add_room(room_id)
     else:
         print(f"Worker for {room_id} is already running.")
 
-def disconnect_worker(room_id):
-    for proc in psutil.process_iter(['pid', 'cmdline']):
-        try:
-            if proc.info['cmdline'] and "redis_worker.py" in proc.info['cmdline']:
-                if room_id in proc.info['cmdline']:
-                    print(f"Terminating worker for {room_id} (PID {proc.pid})")
-                    proc.terminate()  # or proc.kill() if terminate is not reliable
-                    proc.wait(timeout=5)
-                    return True
-        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-            pass
+async def disconnect_worker(room_id):
+    if await assist_worker.remove_room(room_id):
+        print(f"Stopped serving {room_id}")
+        return True
     print(f"No running worker found for {room_id}")
     return False
+
+def worker_stats():
+    return assist_worker.stats()
@@ -57,6 +57,15 @@ class EnhancedMetricsConfig:
     client_name: str = os.getenv("CLIENT_NAME", "default_client")
     store_detailed_metrics: bool = True
     
+    # Compact per-call storage: latency histograms plus a ring of recent raw events
+    compact_metrics: bool = False
+    recent_events_limit: int = 50
+    
+    # Batched metric flushes from the agent hot path
+    flush_interval_ms: int = 250
+    flush_max_events: int = 50
+    flush_queue_size: int = 1000
+    
     # Dashboard settings
     monitoring_port: int = 1234
     
@@ -94,6 +103,11 @@ class EnhancedMetricsConfig:
             'redis_port': self.redis_port,
             'redis_db': self.redis_db,
             'client_name': self.client_name,
+            'compact_metrics': self.compact_metrics,
+            'recent_events_limit': self.recent_events_limit,
+            'flush_interval_ms': self.flush_interval_ms,
+            'flush_max_events': self.flush_max_events,
+            'flush_queue_size': self.flush_queue_size,
             'monitoring_port': self.monitoring_port,
             'load_test': {
                 'initial_concurrent_calls': self.load_test.initial_concurrent_calls,
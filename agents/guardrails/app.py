@@ -1,11 +1,11 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-import yaml
-import re
 import logging
 import os
 from typing import Dict, Any, List
 
+from engine import GuardrailsEngine
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -25,145 +25,12 @@ class ValidationResponse(BaseModel):
     metadata: Dict[str, Any] = {}
     error: str = ""
 
-class GuardrailsEngine:
-    """Custom guardrails engine that processes your YAML configuration format"""
-    
-    def __init__(self, config_path: str = "./rails"):
-        self.config_path = config_path
-        self.validators = {}
-        self.flows = {}
-        self.rails_config = {}
-        self.load_configuration()
-    
-    def load_configuration(self):
-        """Load all YAML configuration files"""
-        try:
-            # Load guardrails.yaml
-            guardrails_file = os.path.join(self.config_path, "guardrails.yaml")
-            if os.path.exists(guardrails_file):
-                with open(guardrails_file, 'r') as f:
-                    guardrails_config = yaml.safe_load(f)
-                    if 'validators' in guardrails_config:
-                        for validator in guardrails_config['validators']:
-                            self.validators[validator['name']] = validator
-                    logger.info(f"Loaded {len(self.validators)} validators from guardrails.yaml")
-            
-            # Load flows.yaml
-            flows_file = os.path.join(self.config_path, "flows.yaml")
-            if os.path.exists(flows_file):
-                with open(flows_file, 'r') as f:
-                    flows_config = yaml.safe_load(f)
-                    if 'flows' in flows_config:
-                        for flow in flows_config['flows']:
-                            self.flows[flow['name']] = flow
-                    logger.info(f"Loaded {len(self.flows)} flows from flows.yaml")
-            
-            # Load prompt.yaml (rails configuration)
-            prompt_file = os.path.join(self.config_path, "prompt.yaml")
-            if os.path.exists(prompt_file):
-                with open(prompt_file, 'r') as f:
-                    self.rails_config = yaml.safe_load(f)
-                    logger.info("Loaded rails configuration from prompt.yaml")
-                    
-        except Exception as e:
-            logger.error(f"Error loading configuration: {e}")
-            raise
-    
-    def validate_input(self, text: str) -> Dict[str, Any]:
-        """Validate input text using the loaded configuration"""
-        try:
-            # Get input rails from prompt.yaml
-            input_rails = self.rails_config.get('rails', {}).get('input', [])
-            
-            # Run each validator specified in input rails
-            violations = []
-            blocked_by = []
-            
-            for validator_name in input_rails:
-                if validator_name in self.validators:
-                    validator = self.validators[validator_name]
-                    is_valid, violation_msg = self._run_validator(validator, text)
-                    
-                    if not is_valid:
-                        violations.append(violation_msg)
-                        blocked_by.append(validator_name)
-            
-            # Check if input failed any validators
-            is_safe = len(violations) == 0
-            
-            # If not safe, check for flows that handle the failure
-            response_message = ""
-            if not is_safe:
-                response_message = self._get_failure_response(blocked_by[0] if blocked_by else None)
-            
-            return {
-                "is_safe": is_safe,
-                "response": response_message,
-                "violations": violations,
-                "blocked_by": blocked_by,
-                "input_length": len(text)
-            }
-            
-        except Exception as e:
-            logger.error(f"Error during validation: {e}")
-            return {
-                "is_safe": False,
-                "response": "Validation error occurred",
-                "violations": [str(e)],
-                "blocked_by": [],
-                "input_length": len(text)
-            }
-    
-    def _run_validator(self, validator: Dict[str, Any], text: str) -> tuple[bool, str]:
-        """Run a specific validator against the input text"""
-        validator_type = validator.get('type', '')
-        
-        if validator_type == 'regex':
-            return self._run_regex_validator(validator, text)
-        else:
-            logger.warning(f"Unknown validator type: {validator_type}")
-            return True, ""
-    
-    def _run_regex_validator(self, validator: Dict[str, Any], text: str) -> tuple[bool, str]:
-        """Run regex pattern validation"""
-        parameters = validator.get('parameters', {})
-        patterns = parameters.get('patterns', [])
-        ignore_case = parameters.get('ignore_case', False)
-        
-        flags = re.IGNORECASE if ignore_case else 0
-        
-        for pattern in patterns:
-            if re.search(pattern, text, flags):
-                fail_message = validator.get('on_fail', {}).get('message', 
-                                           f"Content blocked by {validator['name']}")
-                return False, fail_message
-        
-        return True, ""
-    
-    def _get_failure_response(self, validator_name: str) -> str:
-        """Get the appropriate failure response based on flows"""
-        # Check flows for handling this validator failure
-        for flow_name, flow_config in self.flows.items():
-            steps = flow_config.get('steps', [])
-            for step in steps:
-                condition = step.get('condition', '')
-                
-                # Simple condition parsing - you can extend this
-                if validator_name and f"validate('{validator_name}')" in condition:
-                    then_actions = step.get('then', [])
-                    for action in then_actions:
-                        if 'say' in action:
-                            message = action['say']
-                            # Handle template substitution
-                            if 'fail_message(' in message:
-                                # Extract validator name and get fail message
-                                if validator_name in self.validators:
-                                    return self.validators[validator_name].get('on_fail', {}).get('message', 
-                                                                                               'Content not allowed')
-                            return message
-        
-        # Default failure message
-        return "I'm sorry, but that message isn't allowed."
+class BatchInputRequest(BaseModel):
+    texts: List[str]
+
+class BatchValidationResponse(BaseModel):
+    results: List[ValidationResponse]
+    error: str = ""
 
 # Global guardrails engine instance
 guardrails_engine = None
@@ -184,6 +51,12 @@ def initialize_guardrails():
         logger.error(f"Failed to initialize guardrails engine: {e}")
         return False
 
+def current_engine() -> GuardrailsEngine:
+    """The engine to validate with, swapped for a new one when the rails files change"""
+    global guardrails_engine
+    guardrails_engine = guardrails_engine.reload_if_changed()
+    return guardrails_engine
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize guardrails on application startup"""
@@ -191,6 +64,18 @@ async def startup_event():
     if not success:
         logger.warning("Guardrails initialization failed, continuing without guardrails")
 
+def _to_response(result: Dict[str, Any], engine: GuardrailsEngine) -> ValidationResponse:
+    return ValidationResponse(
+        is_safe=result["is_safe"],
+        response=result["response"],
+        metadata={
+            "violations": result.get("violations", []),
+            "blocked_by": result.get("blocked_by", []),
+            "input_length": result.get("input_length", 0),
+            "rules_version": engine.rules_version
+        }
+    )
+
 @app.post("/validate_input", response_model=ValidationResponse)
 async def validate_input(request: InputRequest):
     """
@@ -210,17 +95,9 @@ async def validate_input(request: InputRequest):
         )
     
     try:
-        result = guardrails_engine.validate_input(request.text)
-        
-        return ValidationResponse(
-            is_safe=result["is_safe"],
-            response=result["response"],
-            metadata={
-                "violations": result.get("violations", []),
-                "blocked_by": result.get("blocked_by", []),
-                "input_length": result.get("input_length", 0)
-            }
-        )
+        engine = current_engine()
+        result = engine.validate_input(request.text)
+        return _to_response(result, engine)
         
     except Exception as e:
         logger.error(f"Error during validation: {e}")
@@ -229,6 +106,36 @@ async def validate_input(request: InputRequest):
             error=f"Validation error: {str(e)}"
         )
 
+@app.post("/validate_batch", response_model=BatchValidationResponse)
+async def validate_batch(request: BatchInputRequest):
+    """
+    Validate several texts in one request (results in request order)
+    
+    Args:
+        request: BatchInputRequest containing the texts to validate
+        
+    Returns:
+        BatchValidationResponse with one ValidationResponse per text
+    """
+    if guardrails_engine is None:
+        logger.warning("Guardrails not initialized, rejecting request")
+        return BatchValidationResponse(
+            results=[ValidationResponse(is_safe=False, error="Guardrails system not available") for _ in request.texts],
+            error="Guardrails system not available"
+        )
+    
+    try:
+        engine = current_engine()
+        results = engine.validate_batch(request.texts)
+        return BatchValidationResponse(results=[_to_response(result, engine) for result in results])
+        
+    except Exception as e:
+        logger.error(f"Error during batch validation: {e}")
+        return BatchValidationResponse(
+            results=[ValidationResponse(is_safe=False, error=f"Validation error: {str(e)}") for _ in request.texts],
+            error=f"Validation error: {str(e)}"
+        )
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -245,11 +152,13 @@ async def get_config():
         raise HTTPException(status_code=503, detail="Guardrails not initialized")
     
     try:
+        engine = current_engine()
         config_info = {
             "config_path": "./rails",
-            "validators": list(guardrails_engine.validators.keys()),
-            "flows": list(guardrails_engine.flows.keys()),
-            "rails_config": guardrails_engine.rails_config,
+            "validators": list(engine.validators.keys()),
+            "flows": list(engine.flows.keys()),
+            "rails_config": engine.rails_config,
+            "rules_version": engine.rules_version,
             "guardrails_available": True
         }
         return config_info
@@ -262,9 +171,10 @@ async def get_validators():
     if guardrails_engine is None:
         raise HTTPException(status_code=503, detail="Guardrails not initialized")
     
+    engine = current_engine()
     return {
-        "validators": guardrails_engine.validators,
-        "count": len(guardrails_engine.validators)
+        "validators": engine.validators,
+        "count": len(engine.validators)
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,398 @@
+import yaml
+import hashlib
+import re
+import logging
+import os
+import time
+from typing import Dict, Any, List
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rails")
+
+# Characters of already-scanned output kept in front of the next chunk, so
+# matches up to this length + 1 that span a chunk boundary are still found
+OUTPUT_CARRY_WINDOW = 64
+
+CONFIG_FILES = ("guardrails.yaml", "flows.yaml", "prompt.yaml")
+
+DEFAULT_FAILURE_RESPONSE = "I'm sorry, but that message isn't allowed."
+
+
+# Numbered (\1) or named ((?P=name)) backreference, not preceded by an escaped backslash
+_BACKREFERENCE = re.compile(r"(?<!\\)(?:\\\\)*(?:\\[1-9]|\(\?P=)")
+
+
+def _has_backreference(pattern: str) -> bool:
+    return _BACKREFERENCE.search(pattern) is not None
+
+
+def _search_pattern(pattern: str) -> str:
+    """Drop leading/trailing greedy `.*`, which never change whether re.search matches
+
+    Keeps the combined matcher from rescanning the rest of the text for every
+    candidate start position. Lazy/possessive/counted forms (`.*?`, `.*+`,
+    `.*{n}`) and patterns with backreferences are left alone.
+    """
+    if _has_backreference(pattern):
+        return pattern
+    while pattern.startswith(".*") and pattern[2:3] not in ("?", "+", "*", "{"):
+        pattern = pattern[2:]
+    while pattern.endswith(".*"):
+        # An odd number of backslashes in front means the dot is escaped
+        backslashes = len(pattern[:-2]) - len(pattern[:-2].rstrip("\\"))
+        if backslashes % 2:
+            break
+        pattern = pattern[:-2]
+    return pattern
+
+
+class OutputRailScanner:
+    """Incremental output-rail check over streamed LLM text
+
+    Each chunk is searched together with the tail of the text seen before
+    it (the carry-over window), so the cost per chunk stays proportional to
+    the chunk size and never waits for the full response.
+    """
+
+    def __init__(self, matcher: re.Pattern | None, groups: Dict[str, str], window: int = OUTPUT_CARRY_WINDOW,
+                 standalone: Dict[str, List[re.Pattern]] | None = None):
+        self._matcher = matcher
+        self._groups = groups
+        self._standalone = standalone or {}
+        self._window = window
+        self._carry = ""
+        self.blocked_by: str | None = None
+
+    def feed(self, text: str) -> str | None:
+        """Scan the next chunk; returns the violated validator name, or None"""
+        if self.blocked_by or not text:
+            return self.blocked_by
+        scan = self._carry + text
+        match = self._matcher.search(scan) if self._matcher is not None else None
+        if match:
+            self.blocked_by = self._groups[match.lastgroup]
+            return self.blocked_by
+        for validator_name, patterns in self._standalone.items():
+            if any(pattern.search(scan) for pattern in patterns):
+                self.blocked_by = validator_name
+                return self.blocked_by
+        self._carry = scan[-self._window:]
+        return None
+
+
+class GuardrailsEngine:
+    """Custom guardrails engine that processes your YAML configuration format
+
+    Usable embedded in the agent worker or behind the FastAPI service in
+    app.py. At load time every regex validator of the input rails is
+    compiled into one alternation with a named group per validator, so a
+    clean input is checked in a single pass over the text; only when that
+    finds a hit are the validators run one by one to report all of them.
+    """
+
+    def __init__(self, config_path: str = DEFAULT_CONFIG_PATH):
+        self.config_path = config_path
+        self.validators = {}
+        self.flows = {}
+        self.rails_config = {}
+        self._compiled_validators: Dict[str, List[re.Pattern]] = {}
+        self._input_matcher: re.Pattern | None = None
+        self._matcher_groups: Dict[str, str] = {}
+        self._fast_path = False
+        self._output_matcher: re.Pattern | None = None
+        self._output_groups: Dict[str, str] = {}
+        self._output_standalone: Dict[str, List[re.Pattern]] = {}  # Output validators kept out of the matcher
+        self.rules_version = ""
+        self._failure_responses: Dict[str, str] = {}
+        self._config_mtimes: Dict[str, float] = {}
+        self._checked_at = 0.0
+        self._replaced_by: "GuardrailsEngine | None" = None  # Set once a reload produced a newer engine
+        self.load_configuration()
+
+    def load_configuration(self):
+        """Load all YAML configuration files"""
+        self.validators = {}
+        self.flows = {}
+        self.rails_config = {}
+        try:
+            # Load guardrails.yaml
+            guardrails_file = os.path.join(self.config_path, "guardrails.yaml")
+            if os.path.exists(guardrails_file):
+                with open(guardrails_file, 'r') as f:
+                    guardrails_config = yaml.safe_load(f)
+                    if 'validators' in guardrails_config:
+                        for validator in guardrails_config['validators']:
+                            self.validators[validator['name']] = validator
+                    logger.info(f"Loaded {len(self.validators)} validators from guardrails.yaml")
+
+            # Load flows.yaml
+            flows_file = os.path.join(self.config_path, "flows.yaml")
+            if os.path.exists(flows_file):
+                with open(flows_file, 'r') as f:
+                    flows_config = yaml.safe_load(f)
+                    if 'flows' in flows_config:
+                        for flow in flows_config['flows']:
+                            self.flows[flow['name']] = flow
+                    logger.info(f"Loaded {len(self.flows)} flows from flows.yaml")
+
+            # Load prompt.yaml (rails configuration)
+            prompt_file = os.path.join(self.config_path, "prompt.yaml")
+            if os.path.exists(prompt_file):
+                with open(prompt_file, 'r') as f:
+                    self.rails_config = yaml.safe_load(f)
+                    logger.info("Loaded rails configuration from prompt.yaml")
+
+            self._compile_validators()
+            self._failure_responses = {name: self._resolve_failure_response(name) for name in self.validators}
+            self._config_mtimes = self._read_mtimes()
+            self.rules_version = self._compute_rules_version()
+
+        except Exception as e:
+            logger.error(f"Error loading configuration: {e}")
+            raise
+
+    def _read_mtimes(self) -> Dict[str, float]:
+        mtimes = {}
+        for name in CONFIG_FILES:
+            path = os.path.join(self.config_path, name)
+            if os.path.exists(path):
+                mtimes[name] = os.path.getmtime(path)
+        return mtimes
+
+    def _compute_rules_version(self) -> str:
+        """Digest of the rails config files, changes whenever any of them does"""
+        digest = hashlib.sha256()
+        for name in CONFIG_FILES:
+            path = os.path.join(self.config_path, name)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    digest.update(name.encode() + b"\0" + f.read())
+        return digest.hexdigest()[:12]
+
+    def reload_if_changed(self, min_interval: float = 5.0) -> "GuardrailsEngine":
+        """Return the engine to use from now on (stat the rails files at most every `min_interval` s)
+
+        A changed configuration is loaded into a new engine, which replaces
+        this one for every holder: this instance is never modified, so
+        concurrent turns keep a consistent rule set. A failed load keeps
+        serving the last good configuration and is retried on the next check.
+        """
+        if self._replaced_by is not None:
+            return self._replaced_by.reload_if_changed(min_interval)
+        now = time.monotonic()
+        if now - self._checked_at < min_interval:
+            return self
+        self._checked_at = now
+        if self._read_mtimes() == self._config_mtimes:
+            return self
+        try:
+            engine = GuardrailsEngine(self.config_path)
+        except Exception:
+            return self
+        engine._checked_at = now
+        self._replaced_by = engine
+        logger.info(f"Rails configuration reloaded ({self.rules_version} -> {engine.rules_version})")
+        return engine
+
+    def _compile_validators(self):
+        """Precompile regex validators and build the combined input/output rail matchers"""
+        self._compiled_validators = {}
+        for name, validator in self.validators.items():
+            if validator.get('type', '') != 'regex':
+                continue
+            parameters = validator.get('parameters', {})
+            flags = re.IGNORECASE if parameters.get('ignore_case', False) else 0
+            self._compiled_validators[name] = [
+                re.compile(_search_pattern(pattern), flags) for pattern in parameters.get('patterns', [])
+            ]
+
+        self._input_matcher, self._matcher_groups, _ = self._build_matcher(self.input_rails)
+        self._output_matcher, self._output_groups, self._output_standalone = self._build_matcher(self.output_rails)
+
+        # The single pass is only conclusive when every input rail is a compiled regex validator
+        self._fast_path = (self._input_matcher is not None or not self.input_rails) and all(
+            name not in self.validators or name in self._matcher_groups.values()
+            for name in self.input_rails
+        )
+        logger.info(
+            f"Compiled {len(self._matcher_groups)} input and {len(self._output_groups)} output "
+            f"rail validators into single matchers"
+        )
+
+    def _build_matcher(self, rail_names: List[str]) -> tuple[re.Pattern | None, Dict[str, str], Dict[str, List[re.Pattern]]]:
+        """Combine the regex validators of a rail into one alternation, one named group each
+
+        Validators with backreferences stay out of it, as their group numbers
+        would point elsewhere once combined; they are returned separately, to
+        be run pattern by pattern.
+        """
+        alternatives = []
+        groups = {}
+        standalone = {}
+        for index, validator_name in enumerate(rail_names):
+            if validator_name not in self._compiled_validators:
+                continue
+            compiled_patterns = self._compiled_validators[validator_name]
+            if any(_has_backreference(compiled.pattern) for compiled in compiled_patterns):
+                standalone[validator_name] = compiled_patterns
+                continue
+            # Scoped inline flags keep each validator's ignore_case setting
+            patterns = "|".join(
+                f"(?{'i' if compiled.flags & re.IGNORECASE else '-i'}:{compiled.pattern})"
+                for compiled in self._compiled_validators[validator_name]
+            )
+            if patterns:
+                group = f"v{index}"
+                groups[group] = validator_name
+                alternatives.append(f"(?P<{group}>{patterns})")
+
+        if not alternatives:
+            return None, {}, standalone
+        try:
+            return re.compile("|".join(alternatives)), groups, standalone
+        except re.error as e:
+            # e.g. the same group name used by two validators
+            logger.warning(f"Could not build combined matcher, validating per pattern: {e}")
+            return None, {}, {name: self._compiled_validators[name] for name in rail_names if name in self._compiled_validators}
+
+    @property
+    def input_rails(self) -> List[str]:
+        return self.rails_config.get('rails', {}).get('input', []) or []
+
+    @property
+    def output_rails(self) -> List[str]:
+        return self.rails_config.get('rails', {}).get('output', []) or []
+
+    def output_scanner(self, window: int = OUTPUT_CARRY_WINDOW) -> OutputRailScanner | None:
+        """New per-response scanner for the output rails (None if none are configured)"""
+        if self._output_matcher is None and not self._output_standalone:
+            return None
+        return OutputRailScanner(self._output_matcher, self._output_groups, window, self._output_standalone)
+
+    def fail_message(self, validator_name: str, default: str = "Content not allowed") -> str:
+        return self.validators.get(validator_name, {}).get('on_fail', {}).get('message', default)
+
+    def validate_input(self, text: str) -> Dict[str, Any]:
+        """Validate input text using the loaded configuration"""
+        try:
+            # Fast path: one pass over the text for every regex pattern
+            if self._fast_path and (self._input_matcher is None or not self._input_matcher.search(text)):
+                return {
+                    "is_safe": True,
+                    "response": "",
+                    "violations": [],
+                    "blocked_by": [],
+                    "input_length": len(text)
+                }
+
+            # Run each validator specified in input rails
+            violations = []
+            blocked_by = []
+
+            for validator_name in self.input_rails:
+                if validator_name in self.validators:
+                    validator = self.validators[validator_name]
+                    is_valid, violation_msg = self._run_validator(validator, text)
+
+                    if not is_valid:
+                        violations.append(violation_msg)
+                        blocked_by.append(validator_name)
+
+            # Check if input failed any validators
+            is_safe = len(violations) == 0
+
+            # If not safe, check for flows that handle the failure
+            response_message = ""
+            if not is_safe:
+                response_message = self._get_failure_response(blocked_by[0] if blocked_by else None)
+
+            return {
+                "is_safe": is_safe,
+                "response": response_message,
+                "violations": violations,
+                "blocked_by": blocked_by,
+                "input_length": len(text)
+            }
+
+        except Exception as e:
+            logger.error(f"Error during validation: {e}")
+            return {
+                "is_safe": False,
+                "response": "Validation error occurred",
+                "violations": [str(e)],
+                "blocked_by": [],
+                "input_length": len(text)
+            }
+
+    def first_violation(self, text: str) -> str | None:
+        """Name of the first input-rail validator matching `text` (single pass when possible), or None"""
+        if self._fast_path:
+            match = self._input_matcher.search(text) if self._input_matcher is not None else None
+            return self._matcher_groups[match.lastgroup] if match else None
+        for validator_name in self.input_rails:
+            if validator_name in self.validators and not self._run_validator(self.validators[validator_name], text)[0]:
+                return validator_name
+        return None
+
+    def _run_validator(self, validator: Dict[str, Any], text: str) -> tuple[bool, str]:
+        """Run a specific validator against the input text"""
+        validator_type = validator.get('type', '')
+
+        if validator_type == 'regex':
+            return self._run_regex_validator(validator, text)
+        else:
+            logger.warning(f"Unknown validator type: {validator_type}")
+            return True, ""
+
+    def _run_regex_validator(self, validator: Dict[str, Any], text: str) -> tuple[bool, str]:
+        """Run regex pattern validation"""
+        for pattern in self._compiled_validators.get(validator['name'], []):
+            if pattern.search(text):
+                fail_message = validator.get('on_fail', {}).get('message',
+                                           f"Content blocked by {validator['name']}")
+                return False, fail_message
+
+        return True, ""
+
+    def validate_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """Validate several texts in one call (same result schema as validate_input)
+
+        Duplicates within the batch (common short utterances) are validated once.
+        """
+        results: Dict[str, Dict[str, Any]] = {}
+        for text in texts:
+            if text not in results:
+                results[text] = self.validate_input(text)
+        return [results[text] for text in texts]
+
+    def _get_failure_response(self, validator_name: str) -> str:
+        """Failure response for a validator, precomputed from the flows at load time"""
+        if validator_name in self._failure_responses:
+            return self._failure_responses[validator_name]
+        return self._resolve_failure_response(validator_name)
+
+    def _resolve_failure_response(self, validator_name: str) -> str:
+        """Get the appropriate failure response based on flows"""
+        # Check flows for handling this validator failure
+        for flow_name, flow_config in self.flows.items():
+            steps = flow_config.get('steps', [])
+            for step in steps:
+                condition = step.get('condition', '')
+
+                # Simple condition parsing - you can extend this
+                if validator_name and f"validate('{validator_name}')" in condition:
+                    then_actions = step.get('then', [])
+                    for action in then_actions:
+                        if 'say' in action:
+                            message = action['say']
+                            # Handle template substitution
+                            if 'fail_message(' in message:
+                                # Extract validator name and get fail message
+                                if validator_name in self.validators:
+                                    return self.validators[validator_name].get('on_fail', {}).get('message',
+                                                                                               'Content not allowed')
+                            return message
+
+        # Default failure message
+        return DEFAULT_FAILURE_RESPONSE
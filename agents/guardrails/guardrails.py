@@ -1,19 +1,76 @@
-import aiohttp
 import asyncio
+import time
+from dataclasses import dataclass, asdict
 from typing import AsyncIterator, Any
 from types import TracebackType
 
-from livekit.agents.llm import LLM, ChatContext, ChatChunk, LLMStream, ToolChoice
+from livekit.agents.llm import LLM, ChatContext, ChatChunk, ChoiceDelta, LLMStream, ToolChoice
 from livekit.agents.llm.tool_context import FunctionTool
 from livekit.agents.types import DEFAULT_API_CONNECT_OPTIONS, APIConnectOptions, NOT_GIVEN, NotGivenOr
 
+from tools.http_client import tool_http
+from tools.circuit_breaker import CircuitOpenError
+from guardrails.engine import GuardrailsEngine, OutputRailScanner
+from guardrails.verdict_cache import VerdictCache
+
+GUARDRAILS_URL = "http://sbi.vaaniresearch.com:8000/validate_input"
+BLOCKED_RESPONSE = "Sorry, I can't respond to that."
+
+# Max LLM chunks held back while speculative validation is still pending;
+# once full the LLM stream is paused until the verdict arrives
+DEFAULT_MAX_BUFFERED_CHUNKS = 64
+
+
+@dataclass
+class GuardrailsMetrics:
+    """Per-turn guardrails timing, emitted as "guardrails_metrics" by GuardrailsLLM"""
+    speculative: bool
+    blocked: bool
+    validation_ms: float  # Stream start -> verdict
+    first_chunk_ms: float | None  # Stream start -> first LLM chunk (None if none arrived)
+    ttft_recovered_ms: float  # TTFT saved versus validating before starting the LLM
+    buffered_chunks: int  # Chunks held back waiting for the verdict
+    output_chunks: int = 0  # LLM chunks scanned by the output rails
+    output_scan_ms: float = 0.0  # Total time spent scanning them
+    output_blocked_by: str | None = None  # Output validator that cut the response
+    verdict_source: str | None = None  # "engine", "l1"/"l2" (verdict cache tier), "remote" or "fail_open"
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
 
 class GuardrailsLLM(LLM):
-    def __init__(self, llm: LLM):
+    """LLM wrapper that validates the last user message against the guardrails
+
+    With `speculative=True` (default) the underlying LLM stream starts right
+    away and its chunks are held in a bounded buffer until the verdict comes
+    in, then released or replaced by BLOCKED_RESPONSE, so guardrail latency
+    overlaps with LLM TTFT instead of adding to it.
+
+    Pass an `engine` to validate in-process (microseconds); without one the
+    remote guardrails service at `remote_url` is called instead. With an
+    engine the response is also checked against the output rails chunk by
+    chunk and cut as soon as one matches. Verdicts go through the
+    process-wide `verdict_cache`, if given, keyed on the rules version they
+    were computed with.
+    """
+
+    def __init__(
+        self,
+        llm: LLM,
+        speculative: bool = True,
+        max_buffered_chunks: int = DEFAULT_MAX_BUFFERED_CHUNKS,
+        engine: GuardrailsEngine | None = None,
+        remote_url: str = GUARDRAILS_URL,
+        verdict_cache: VerdictCache | None = None,
+    ):
         super().__init__()
         self.llm = llm
-        self._validation_cache = {}  # Simple cache to avoid repeated API calls
-        self._cache_max_size = 100
+        self.engine = engine
+        self.remote_url = remote_url
+        self.verdict_cache = verdict_cache
+        self.speculative = speculative
+        self.max_buffered_chunks = max_buffered_chunks
 
     def chat(
         self,
@@ -30,6 +87,9 @@ class GuardrailsLLM(LLM):
         
         # Get the last user message for validation
         last_user_message = self._get_last_user_message(chat_ctx)
+        if self.engine is not None:
+            # Input and output rails of this turn come from the same rules version
+            self.engine = self.engine.reload_if_changed()
 
         # Create the underlying stream first
         underlying_stream = self.llm.chat(
@@ -44,9 +104,15 @@ class GuardrailsLLM(LLM):
 
         # Return our wrapped stream that will handle validation
         return GuardrailsValidationStream(
+            self,
             underlying_stream=underlying_stream,
-            validation_func=self._is_valid,
-            last_user_message=last_user_message
+            validation_func=self._validate,
+            last_user_message=last_user_message,
+            speculative=self.speculative,
+            max_buffered_chunks=self.max_buffered_chunks,
+            output_scanner=self.engine.output_scanner() if self.engine is not None else None,
+            output_fail_message=self.engine.fail_message if self.engine is not None else None,
+            on_metrics=self._emit_metrics,
         )
 
     def _get_last_user_message(self, chat_ctx: ChatContext) -> str | None:
@@ -117,60 +183,104 @@ class GuardrailsLLM(LLM):
         """Required cleanup method"""
         await self.llm.aclose()
 
-    async def _is_valid(self, user_input: str) -> bool:
-        """Validate user input against guardrails API with caching"""
-        # Simple cache key (hash of input)
-        cache_key = hash(user_input.lower().strip())
-        
-        # Check cache first
-        if cache_key in self._validation_cache:
-            print(f"[Guardrails] Using cached validation result")
-            return self._validation_cache[cache_key]
-        
+    def _emit_metrics(self, metrics: GuardrailsMetrics):
+        self.emit("guardrails_metrics", metrics)
+
+    async def _validate(self, user_input: str) -> tuple[bool, str]:
+        """Validate user input against the embedded engine or the guardrails API (cached)
+
+        Returns (is_valid, verdict_source), the source being "engine", "l1",
+        "l2", "remote" or "fail_open".
+        """
+        if self.engine is not None:
+            rules_version = self.engine.rules_version
+            if self.verdict_cache is not None:
+                cached, tier = await self.verdict_cache.get(user_input, rules_version)
+                if cached is not None:
+                    return cached, tier
+            is_valid = self.engine.validate_input(user_input)["is_safe"]
+            if self.verdict_cache is not None:
+                await self.verdict_cache.set(user_input, is_valid, rules_version)
+            return is_valid, "engine"
+
+        # Shared verdict cache (in-process LRU, then Redis)
+        if self.verdict_cache is not None:
+            cached, tier = await self.verdict_cache.get(user_input)
+            if cached is not None:
+                return cached, tier
+
+        is_valid = await self._validate_remote(user_input)
+        return (True, "fail_open") if is_valid is None else (is_valid, "remote")
+
+    async def _validate_remote(self, user_input: str) -> bool | None:
+        """Verdict of the guardrails service, None when it could not be had (fail open)"""
         try:
-            timeout = aiohttp.ClientTimeout(total=3)  # Shorter timeout
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(
-                    "http://sbi.vaaniresearch.com:8000/validate_input",
-                    json={"input": user_input},
-                ) as resp:
-                    if resp.status == 200:
-                        result = await resp.json()
-                        is_valid = result.get("valid", True)
-                        
-                        # Cache the result
-                        if len(self._validation_cache) >= self._cache_max_size:
-                            # Simple cache eviction - remove oldest entries
-                            oldest_keys = list(self._validation_cache.keys())[:10]
-                            for key in oldest_keys:
-                                del self._validation_cache[key]
-                        
-                        self._validation_cache[cache_key] = is_valid
-                        return is_valid
-                    else:
-                        print(f"[Guardrails] API returned status {resp.status}, allowing by default")
-                        return True
+            # Pooled keep-alive session, 3s timeout configured for "guardrails_validate"
+            status, result = await tool_http.post_json(
+                "guardrails_validate", self.remote_url, {"text": user_input}, use_cache=False
+            )
+            if status == 200:
+                # Same schema as GuardrailsEngine.validate_input (see app.py ValidationResponse)
+                is_valid = (result or {}).get("is_safe", True)
+
+                if self.verdict_cache is not None:
+                    # A new rules version on the service invalidates every cached verdict
+                    rules_version = ((result or {}).get("metadata") or {}).get("rules_version")
+                    await self.verdict_cache.set(user_input, is_valid, rules_version)
+                return is_valid
+            else:
+                print(f"[Guardrails] API returned status {status}, allowing by default")
+                return None
+        except CircuitOpenError:
+            print(f"[Guardrails] Guardrails service circuit open, allowing by default")
+            return None  # Skip the call outright while the service is degraded
         except asyncio.CancelledError:
             print(f"[Guardrails] Validation cancelled, allowing by default")
-            return True  # Allow if cancelled
+            return None  # Allow if cancelled
         except asyncio.TimeoutError:
+            # Also raised as LatencyBudgetExceeded when the turn's budget is used up
             print(f"[Guardrails] Validation timeout, allowing by default")
-            return True  # Allow on timeout
+            return None  # Allow on timeout
         except Exception as e:
             print(f"[Guardrails] Validation error: {e}, allowing by default")
-            return True  # Default to allowing if validation fails
+            return None  # Default to allowing if validation fails
+
+
+def _chunk_text(chunk: ChatChunk) -> str:
+    """Text content of a streamed chunk (empty for tool calls / usage-only chunks)"""
+    delta = getattr(chunk, "delta", None)
+    if delta is not None:
+        return getattr(delta, "content", None) or ""
+    choices = getattr(chunk, "choices", None) or []
+    if choices:
+        delta = choices[0].get("delta", {}) if isinstance(choices[0], dict) else getattr(choices[0], "delta", None)
+        content = delta.get("content") if isinstance(delta, dict) else getattr(delta, "content", None)
+        return content or ""
+    return ""
 
 
 class GuardrailsValidationStream(LLMStream):
-    def __init__(self, underlying_stream: LLMStream, validation_func, last_user_message: str = None):
+    def __init__(
+        self,
+        llm: LLM,
+        underlying_stream: LLMStream,
+        validation_func,
+        last_user_message: str = None,
+        speculative: bool = True,
+        max_buffered_chunks: int = DEFAULT_MAX_BUFFERED_CHUNKS,
+        output_scanner: OutputRailScanner | None = None,
+        output_fail_message=None,
+        on_metrics=None,
+    ):
         # Get required parameters from the underlying stream
         chat_ctx = underlying_stream._chat_ctx
         tools = getattr(underlying_stream, '_tools', [])
         conn_options = getattr(underlying_stream, '_conn_options', DEFAULT_API_CONNECT_OPTIONS)
         
-        # Initialize the base LLMStream properly
+        # Owned by the wrapping LLM: the session listens to it, so LLMMetrics
+        # (TTFT as the user sees it, guardrails included) are emitted there once
         super().__init__(
-            underlying_stream._llm,
+            llm,
             chat_ctx=chat_ctx,
             tools=tools,
             conn_options=conn_options
@@ -179,50 +289,152 @@ class GuardrailsValidationStream(LLMStream):
         self._underlying_stream = underlying_stream
         self._validation_func = validation_func
         self._last_user_message = last_user_message
+        self._speculative = speculative
+        self._max_buffered_chunks = max_buffered_chunks
+        self._output_scanner = output_scanner
+        self._output_fail_message = output_fail_message
+        self._on_metrics = on_metrics
         self._validation_complete = False
+        self._verdict_source = None
         self._is_blocked = False
+        self._output_chunks = 0
+        self._output_scan_s = 0.0
 
     async def _run(self):
-        """Override _run to perform validation before forwarding to underlying stream"""
-        try:
-            # Perform validation if we have a user message
-            if self._last_user_message:
-                is_valid = await self._validation_func(self._last_user_message)
-                if not is_valid:
-                    print(f"[Guardrails] Blocked message: {self._last_user_message[:50]}...")
-                    
-                    # Send blocked response as a proper chat chunk
-                    blocked_chunk = ChatChunk(
-                        request_id="guardrails_blocked",
-                        choices=[{
-                            "delta": {
-                                "role": "assistant",
-                                "content": "Sorry, I can't respond to that."
-                            }
-                        }]
-                    )
-                    self._event_ch.send_nowait(blocked_chunk)
-                    
-                    # Send a final chunk to properly close the stream
-                    final_chunk = ChatChunk(
-                        request_id="guardrails_blocked_final",
-                        choices=[{
-                            "delta": {
-                                "role": "assistant",
-                                "content": ""
-                            }
-                        }]
-                    )
-                    self._event_ch.send_nowait(final_chunk)
-                    return
-
-            # If validation passed, forward to underlying stream
+        """Validate the last user message, then forward (or block) the underlying stream"""
+        if not self._last_user_message:
             async for chunk in self._underlying_stream:
-                self._event_ch.send_nowait(chunk)
-                
+                if not self._forward(chunk):
+                    break
+            return
+
+        if self._speculative:
+            await self._run_speculative()
+        else:
+            await self._run_serial()
+
+    def _forward(self, chunk: ChatChunk) -> bool:
+        """Send a chunk downstream after the output rails; False once the response was cut"""
+        if self._output_scanner is not None:
+            text = _chunk_text(chunk)
+            if text:
+                scan_start = time.perf_counter()
+                blocked_by = self._output_scanner.feed(text)
+                self._output_scan_s += time.perf_counter() - scan_start
+                self._output_chunks += 1
+                if blocked_by:
+                    # Drop the offending chunk and end the reply with the validator's message
+                    print(f"[Guardrails] Output blocked by {blocked_by}")
+                    message = self._output_fail_message(blocked_by, BLOCKED_RESPONSE) if self._output_fail_message else BLOCKED_RESPONSE
+                    self._send_text(" " + message, "guardrails_output_blocked")
+                    return False
+        self._event_ch.send_nowait(chunk)
+        return True
+
+    async def _run_serial(self):
+        """Validate first, only then start reading the LLM stream"""
+        start = time.perf_counter()
+        is_valid, self._verdict_source = await self._validation_func(self._last_user_message)
+        validation_ms = (time.perf_counter() - start) * 1000
+        self._validation_complete = True
+
+        if not is_valid:
+            self._send_blocked()
+            self._emit_metrics(False, validation_ms, None, 0)
+            return
+
+        first_chunk_ms = None
+        async for chunk in self._underlying_stream:
+            if first_chunk_ms is None:
+                first_chunk_ms = (time.perf_counter() - start) * 1000
+            if not self._forward(chunk):
+                break
+        self._emit_metrics(False, validation_ms, first_chunk_ms, 0)
+
+    async def _run_speculative(self):
+        """Start the LLM right away and hold its chunks until the verdict arrives"""
+        start = time.perf_counter()
+        buffer: asyncio.Queue = asyncio.Queue(maxsize=self._max_buffered_chunks)
+        first_chunk_ms = None
+
+        async def pump():
+            # Ends with None, or with the exception the underlying stream raised
+            nonlocal first_chunk_ms
+            try:
+                async for chunk in self._underlying_stream:
+                    if first_chunk_ms is None:
+                        first_chunk_ms = (time.perf_counter() - start) * 1000
+                    await buffer.put(chunk)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await buffer.put(e)
+                return
+            await buffer.put(None)
+
+        pump_task = asyncio.create_task(pump())
+        try:
+            is_valid, self._verdict_source = await self._validation_func(self._last_user_message)
+            validation_ms = (time.perf_counter() - start) * 1000
+            self._validation_complete = True
+            buffered_chunks = buffer.qsize()
+            # Snapshot now: the LLM may still produce its first chunk after the verdict
+            first_chunk_at_verdict = first_chunk_ms
+
+            if not is_valid:
+                pump_task.cancel()
+                self._send_blocked()
+                self._emit_metrics(True, validation_ms, first_chunk_at_verdict, buffered_chunks)
+                return
+
+            while True:
+                item = await buffer.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                if not self._forward(item):
+                    break
+            self._emit_metrics(True, validation_ms, first_chunk_at_verdict, buffered_chunks)
+        finally:
+            if not pump_task.done():
+                pump_task.cancel()
+
+    def _send_blocked(self):
+        self._is_blocked = True
+        print(f"[Guardrails] Blocked message: {self._last_user_message[:50]}...")
+        self._send_text(BLOCKED_RESPONSE, "guardrails_blocked")
+
+    def _send_text(self, content: str, request_id: str):
+        # Send the replacement text as a proper chat chunk; the stream closes when _run returns
+        self._event_ch.send_nowait(ChatChunk(
+            id=request_id,
+            delta=ChoiceDelta(role="assistant", content=content),
+        ))
+
+    def _emit_metrics(self, speculative: bool, validation_ms: float, first_chunk_ms: float | None, buffered_chunks: int):
+        if not self._on_metrics:
+            return
+        if speculative:
+            # Serial TTFT would have been validation + LLM TTFT, speculative is max(validation, LLM TTFT)
+            recovered_ms = min(validation_ms, first_chunk_ms) if first_chunk_ms is not None else validation_ms
+        else:
+            recovered_ms = 0.0
+        try:
+            self._on_metrics(GuardrailsMetrics(
+                speculative=speculative,
+                blocked=self._is_blocked,
+                validation_ms=round(validation_ms, 1),
+                first_chunk_ms=round(first_chunk_ms, 1) if first_chunk_ms is not None else None,
+                ttft_recovered_ms=round(recovered_ms, 1),
+                buffered_chunks=buffered_chunks,
+                output_chunks=self._output_chunks,
+                output_scan_ms=round(self._output_scan_s * 1000, 3),
+                output_blocked_by=self._output_scanner.blocked_by if self._output_scanner else None,
+                verdict_source=self._verdict_source,
+            ))
         except Exception as e:
-            # Forward any errors
-            raise e
+            print(f"[Guardrails] Metrics callback error: {e}")
 
     async def aclose(self):
         """Cleanup both streams"""
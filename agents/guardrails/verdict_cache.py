@@ -0,0 +1,167 @@
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger("guardrails-cache")
+
+VERDICT_KEY_PREFIX = "guardrails:verdict:"  # + <rules version>:<text digest> -> "1" / "0"
+RULES_VERSION_KEY = "guardrails:rules_version"  # Last rules version seen by any worker
+REDIS_TIMEOUT = 0.05  # seconds; a slow shared tier must never cost more than a remote validation
+RULES_VERSION_REFRESH_SECONDS = 60
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return _WHITESPACE.sub(" ", text.lower()).strip()
+
+
+def text_digest(text: str) -> str:
+    """Stable across processes and restarts, unlike hash()"""
+    return hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class VerdictCache:
+    """Two-tier guardrails verdict cache: in-process LRU + shared Redis
+
+    Keys are a digest of the normalized text, namespaced by the rules
+    version in both tiers, so every worker shares verdicts for common
+    utterances and a rails config change invalidates everything at once:
+    a new version swaps in an empty local tier and switches the Redis
+    namespace (old entries simply expire). Callers that know the version
+    their verdict comes from (the embedded engine) pass it to get/set;
+    otherwise the version last seen by any worker is re-read from Redis
+    every RULES_VERSION_REFRESH_SECONDS. One instance per worker process,
+    created in prewarm.
+    """
+
+    def __init__(
+        self,
+        redis_client=None,
+        max_entries: int = 4096,
+        ttl_seconds: float = 3600,
+        redis_ttl_seconds: int = 24 * 3600,
+        rules_version: Optional[str] = None,
+    ):
+        self.redis_client = redis_client
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.redis_ttl_seconds = redis_ttl_seconds
+        self.rules_version = rules_version
+        self._entries: "OrderedDict[str, Tuple[float, bool]]" = OrderedDict()
+        self._version_checked_at = float("-inf")
+
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def set_rules_version(self, version: str):
+        """Switch to a new rules version, dropping every verdict of the old one"""
+        if not version or version == self.rules_version:
+            return
+        if self.rules_version is not None:
+            self.invalidations += 1
+            logger.info(f"🛡️ Guardrails rules changed ({self.rules_version} -> {version}), verdict cache invalidated")
+        self._switch_version(version)
+        if self.redis_client:
+            asyncio.create_task(self._publish_rules_version(version))
+
+    def _switch_version(self, version: str):
+        self.rules_version = version
+        self._entries = OrderedDict()
+
+    async def _publish_rules_version(self, version: str):
+        try:
+            await self.redis_client.set(RULES_VERSION_KEY, version)
+        except Exception as e:
+            logger.warning(f"Failed to publish guardrails rules version: {e}")
+
+    async def _refresh_rules_version(self):
+        """Pick up the rules version other workers have seen (e.g. right after startup)"""
+        now = time.monotonic()
+        if not self.redis_client or now - self._version_checked_at < RULES_VERSION_REFRESH_SECONDS:
+            return
+        self._version_checked_at = now
+        try:
+            version = await asyncio.wait_for(self.redis_client.get(RULES_VERSION_KEY), REDIS_TIMEOUT)
+        except Exception as e:
+            logger.debug(f"Could not read guardrails rules version: {e}")
+            return
+        if isinstance(version, bytes):
+            version = version.decode()
+        if version and version != self.rules_version:
+            self._switch_version(version)
+
+    def _key(self, digest: str) -> str:
+        return f"{self.rules_version}:{digest}"
+
+    async def get(self, text: str, rules_version: Optional[str] = None) -> Tuple[Optional[bool], Optional[str]]:
+        """Return (verdict, tier) with tier "l1" or "l2"; (None, None) on a miss"""
+        if rules_version:
+            self.set_rules_version(rules_version)
+        else:
+            await self._refresh_rules_version()
+        key = self._key(text_digest(text))
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, verdict = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.l1_hits += 1
+                return verdict, "l1"
+            del self._entries[key]
+
+        if self.redis_client and self.rules_version:
+            try:
+                value = await asyncio.wait_for(self.redis_client.get(VERDICT_KEY_PREFIX + key), REDIS_TIMEOUT)
+            except Exception as e:
+                logger.debug(f"Guardrails verdict cache read failed: {e}")
+                value = None
+            if value is not None:
+                verdict = value in ("1", b"1")
+                self._put_local(key, verdict)
+                self.l2_hits += 1
+                return verdict, "l2"
+
+        self.misses += 1
+        return None, None
+
+    async def set(self, text: str, verdict: bool, rules_version: Optional[str] = None):
+        if rules_version:
+            self.set_rules_version(rules_version)
+        key = self._key(text_digest(text))
+        self._put_local(key, verdict)
+        if self.redis_client and self.rules_version:
+            try:
+                await asyncio.wait_for(
+                    self.redis_client.set(VERDICT_KEY_PREFIX + key, "1" if verdict else "0", ex=self.redis_ttl_seconds),
+                    REDIS_TIMEOUT,
+                )
+            except Exception as e:
+                logger.debug(f"Guardrails verdict cache write failed: {e}")
+
+    def _put_local(self, key: str, verdict: bool):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, verdict)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        lookups = self.l1_hits + self.l2_hits + self.misses
+        l1_misses = self.l2_hits + self.misses
+        return {
+            "rules_version": self.rules_version,
+            "entries": len(self._entries),
+            "l1_hits": self.l1_hits,
+            "l2_hits": self.l2_hits,
+            "misses": self.misses,
+            "l1_hit_ratio": round(self.l1_hits / lookups, 3) if lookups else 0,
+            "l2_hit_ratio": round(self.l2_hits / l1_misses, 3) if l1_misses else 0,
+            "invalidations": self.invalidations,
+        }
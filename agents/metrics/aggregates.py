@@ -0,0 +1,220 @@
+import math
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+# Log-scale histogram layout: bucket i covers [MIN * GROWTH^i, MIN * GROWTH^(i+1)),
+# which keeps the relative error of any percentile under ~5%.
+HISTOGRAM_MIN_VALUE = 0.001  # 1 ms
+HISTOGRAM_GROWTH = 1.1
+HISTOGRAM_BUCKETS = 160  # Covers 1 ms .. ~1 hour, larger values land in the last bucket
+
+# Rolling aggregate buckets in Redis, one HASH per clock minute / hour / day (UTC).
+# Minute buckets cover the ragged edges of trailing windows, hour buckets the rest.
+MINUTE_BUCKET_PREFIX = "enhanced_metrics:agg:minute:"
+HOUR_BUCKET_PREFIX = "enhanced_metrics:agg:hour:"
+DAY_BUCKET_PREFIX = "enhanced_metrics:agg:day:"
+MINUTE_BUCKET_TTL = 25 * 3600  # Long enough for the oldest edge of a trailing 24h window
+HOUR_BUCKET_TTL = 48 * 3600  # 2 days
+DAY_BUCKET_TTL = 31 * 24 * 3600  # Matches the completed calls list retention
+
+TRACKED_METRICS = ("ttft", "user_latency", "duration")
+
+_LOG_GROWTH = math.log(HISTOGRAM_GROWTH)
+
+
+class LatencyHistogram:
+    """Fixed-bucket log-scale histogram, mergeable by adding bucket counts"""
+
+    __slots__ = ("counts", "count", "total")
+
+    def __init__(self):
+        self.counts = array("Q", bytes(8 * HISTOGRAM_BUCKETS))
+        self.count = 0
+        self.total = 0.0
+
+    @staticmethod
+    def bucket_index(value: float) -> int:
+        if value <= HISTOGRAM_MIN_VALUE:
+            return 0
+        index = int(math.log(value / HISTOGRAM_MIN_VALUE) / _LOG_GROWTH)
+        return min(index, HISTOGRAM_BUCKETS - 1)
+
+    @staticmethod
+    def bucket_value(index: int) -> float:
+        """Representative (geometric midpoint) value of a bucket"""
+        return HISTOGRAM_MIN_VALUE * HISTOGRAM_GROWTH ** (index + 0.5)
+
+    def add(self, value: float, count: int = 1):
+        self.counts[self.bucket_index(value)] += count
+        self.count += count
+        self.total += value * count
+
+    def merge(self, other: "LatencyHistogram"):
+        counts = self.counts
+        for index, bucket_count in enumerate(other.counts):
+            if bucket_count:
+                counts[index] += bucket_count
+        self.count += other.count
+        self.total += other.total
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0
+
+    def percentile(self, p: float) -> float:
+        if not self.count:
+            return 0
+        rank = min(int(self.count * p / 100), self.count - 1)
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative > rank:
+                return self.bucket_value(index)
+        return self.bucket_value(HISTOGRAM_BUCKETS - 1)
+
+    def percentiles(self, ps: Iterable[float] = (50, 90, 95, 99)) -> Dict[str, float]:
+        return {f"p{p}": self.percentile(p) for p in ps}
+
+    def to_dict(self) -> Dict:
+        """Sparse JSON-friendly representation"""
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "buckets": {str(i): c for i, c in enumerate(self.counts) if c},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> "LatencyHistogram":
+        histogram = cls()
+        if data:
+            for index, bucket_count in data.get("buckets", {}).items():
+                histogram.counts[int(index)] += int(bucket_count)
+            histogram.count = int(data.get("count", 0))
+            histogram.total = float(data.get("sum", 0))
+        return histogram
+
+
+def minute_bucket_key(timestamp: float) -> str:
+    return MINUTE_BUCKET_PREFIX + datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y%m%d%H%M")
+
+
+def hour_bucket_key(timestamp: float) -> str:
+    return HOUR_BUCKET_PREFIX + datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y%m%d%H")
+
+
+def day_bucket_key(timestamp: float) -> str:
+    return DAY_BUCKET_PREFIX + datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y%m%d")
+
+
+def trailing_window_keys(now: float, seconds: int) -> List[str]:
+    """Keys of the buckets covering the last `seconds` up to `now`, to the minute
+    
+    Whole clock hours inside the window (the current, partial one included)
+    come from hour buckets, the minutes before the first whole hour from
+    minute buckets, so the window slides instead of resetting every hour.
+    """
+    keys = []
+    start = math.ceil((now - seconds) / 60) * 60
+    while start <= now:
+        if start % 3600 == 0:
+            keys.append(hour_bucket_key(start))
+            start += 3600
+        else:
+            keys.append(minute_bucket_key(start))
+            start += 60
+    return keys
+
+
+def trailing_day_keys(now: float, days: int) -> List[str]:
+    """Keys of the `days` most recent day buckets, current (partial) day included"""
+    return [day_bucket_key(now - i * 86400) for i in range(days)]
+
+
+class AggregateBucket:
+    """Counts, sums and histograms for a set of completed calls"""
+
+    def __init__(self):
+        self.calls = 0
+        self.completed = 0
+        self.histograms: Dict[str, LatencyHistogram] = {m: LatencyHistogram() for m in TRACKED_METRICS}
+        self.clients: Dict[str, Dict[str, int]] = {}
+
+    @property
+    def success_rate(self) -> float:
+        return self.completed / max(1, self.calls) * 100
+
+    def merge(self, other: "AggregateBucket"):
+        self.calls += other.calls
+        self.completed += other.completed
+        for metric, histogram in other.histograms.items():
+            self.histograms[metric].merge(histogram)
+        for client, stats in other.clients.items():
+            merged = self.clients.setdefault(client, {"calls": 0, "success": 0})
+            merged["calls"] += stats["calls"]
+            merged["success"] += stats["success"]
+
+    @classmethod
+    def from_hash(cls, fields: Dict[str, str]) -> "AggregateBucket":
+        """Build from a Redis HASH written by `record_completed_call`"""
+        bucket = cls()
+        for field, value in fields.items():
+            kind, _, rest = field.partition(":")
+            if field == "calls":
+                bucket.calls = int(value)
+            elif field == "completed":
+                bucket.completed = int(value)
+            elif kind == "client":
+                client, _, stat = rest.rpartition(":")
+                stats = bucket.clients.setdefault(client, {"calls": 0, "success": 0})
+                stats[stat] = int(value)
+            elif kind in bucket.histograms:
+                histogram = bucket.histograms[kind]
+                if rest == "count":
+                    histogram.count = int(value)
+                elif rest == "sum":
+                    histogram.total = float(value)
+                elif rest.startswith("b"):
+                    histogram.counts[int(rest[1:])] += int(value)
+        return bucket
+
+
+def record_completed_call(pipe, start_time: float, status: str, client_name: str,
+                          histograms: Dict[str, LatencyHistogram]):
+    """Queue the incremental aggregate updates for one completed call on a Redis pipeline
+    
+    `histograms` maps names in TRACKED_METRICS to the call's samples for that metric.
+    """
+    success = 1 if status == "completed" else 0
+
+    for key, ttl in ((minute_bucket_key(start_time), MINUTE_BUCKET_TTL),
+                     (hour_bucket_key(start_time), HOUR_BUCKET_TTL),
+                     (day_bucket_key(start_time), DAY_BUCKET_TTL)):
+        pipe.hincrby(key, "calls", 1)
+        pipe.hincrby(key, "completed", success)
+        pipe.hincrby(key, f"client:{client_name}:calls", 1)
+        pipe.hincrby(key, f"client:{client_name}:success", success)
+
+        for metric in TRACKED_METRICS:
+            histogram = histograms.get(metric)
+            if not histogram or not histogram.count:
+                continue
+            pipe.hincrby(key, f"{metric}:count", histogram.count)
+            pipe.hincrbyfloat(key, f"{metric}:sum", histogram.total)
+            for index, bucket_count in enumerate(histogram.counts):
+                if bucket_count:
+                    pipe.hincrby(key, f"{metric}:b{index}", bucket_count)
+
+        pipe.expire(key, ttl)
+
+
+async def load_aggregates(redis_client, keys: List[str]) -> AggregateBucket:
+    """Fetch and merge the given aggregate buckets in one pipelined round trip"""
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipe.hgetall(key)
+
+    merged = AggregateBucket()
+    for fields in await pipe.execute():
+        if fields:
+            merged.merge(AggregateBucket.from_hash(fields))
+    return merged
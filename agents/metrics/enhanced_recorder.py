@@ -3,12 +3,38 @@ import json
 import time
 import logging
 import redis.asyncio as redis
-from dataclasses import dataclass, asdict
+from collections import deque
+from dataclasses import dataclass
 from typing import Dict, List, Optional
 from datetime import datetime
 
+from metrics.aggregates import LatencyHistogram, record_completed_call
+
 logger = logging.getLogger("enhanced_metrics")
 
+# Redis keys shared with the monitoring dashboard
+CALL_KEY_PREFIX = "enhanced_metrics:call:"
+ACTIVE_CALLS_KEY = "enhanced_metrics:active_calls"  # SET of call_ids currently in progress
+CALL_INDEX_KEY = "enhanced_metrics:call_index"  # ZSET of call_ids scored by start_time
+COMPLETED_CALLS_KEY = "enhanced_metrics:completed_calls"
+CALL_EVENTS_PREFIX = "enhanced_metrics:events:"  # STREAM of per-call metric events (incremental deltas)
+CALL_PROGRESS_PREFIX = "enhanced_metrics:progress:"  # HASH of per-call running counters
+CALL_EVENTS_MAXLEN = 5000
+CALL_TTL_SECONDS = 7 * 24 * 3600  # 7 days
+
+# Per-component latency histograms: name -> (raw event list attribute, value field)
+COMPONENT_HISTOGRAMS = {
+    "llm_ttft": ("llm_metrics", "ttft"),
+    "tts_ttfb": ("tts_metrics", "ttfb"),
+    "asr_duration": ("asr_metrics", "duration"),
+    "eou_delay": ("eou_metrics", "delay"),
+    "user_latency": ("user_latency_metrics", "latency"),
+}
+# Histograms where a zero/negative sample means "not measured" and is left out,
+# so compact and full records report the same averages
+POSITIVE_ONLY_HISTOGRAMS = {"llm_ttft"}
+EVENT_LISTS = [list_name for list_name, _ in COMPONENT_HISTOGRAMS.values()] + ["turn_metrics", "guardrails_metrics"]
+
 @dataclass
 class DetailedCallMetrics:
     """Enhanced call metrics with detailed tracking"""
@@ -31,11 +57,27 @@ class DetailedCallMetrics:
     asr_metrics: List[Dict] = None
     eou_metrics: List[Dict] = None
     user_latency_metrics: List[Dict] = None
+    turn_metrics: List[Dict] = None
+    guardrails_metrics: List[Dict] = None
+    setup_timings: Dict[str, float] = None
+    tool_metrics: Dict[str, Dict] = None  # Per-tool call/cache/latency counters
+    ttft_recovered_ms: float = 0.0  # Total TTFT saved by speculative guardrails
+    guardrails_verdict_sources: Dict[str, int] = None  # engine / l1 / l2 / remote / fail_open counts
+    assist_speculation: Dict[str, float] = None  # Speculative agent-assist suggestions from interim transcripts
     
     # Counters
     llm_calls: int = 0
     tts_calls: int = 0
     asr_calls: int = 0
+    eou_events: int = 0
+    user_latency_events: int = 0
+    turns: int = 0
+    
+    # Compact mode: histograms hold every sample, the lists above keep only
+    # the last `recent_events_limit` raw events
+    compact: bool = False
+    recent_events_limit: int = 50
+    histograms: Dict[str, LatencyHistogram] = None
     
     def __post_init__(self):
         if self.llm_metrics is None:
@@ -48,59 +90,192 @@ class DetailedCallMetrics:
             self.eou_metrics = []
         if self.user_latency_metrics is None:
             self.user_latency_metrics = []
+        if self.turn_metrics is None:
+            self.turn_metrics = []
+        if self.guardrails_metrics is None:
+            self.guardrails_metrics = []
+        if self.setup_timings is None:
+            self.setup_timings = {}
+        if self.tool_metrics is None:
+            self.tool_metrics = {}
+        if self.guardrails_verdict_sources is None:
+            self.guardrails_verdict_sources = {}
+        if self.assist_speculation is None:
+            self.assist_speculation = {'confirmed': 0, 'discarded': 0, 'total_lead_ms': 0.0, 'max_lead_ms': 0.0}
+        
+        if self.compact:
+            for list_name in EVENT_LISTS:
+                setattr(self, list_name, deque(getattr(self, list_name), maxlen=self.recent_events_limit))
+            if self.histograms is None:
+                self.histograms = {name: LatencyHistogram() for name in COMPONENT_HISTOGRAMS}
+    
+    def _record_sample(self, histogram_name: str, value: float):
+        if histogram_name in POSITIVE_ONLY_HISTOGRAMS and value <= 0:
+            return
+        if self.histograms is not None:
+            self.histograms[histogram_name].add(value)
     
     def add_llm_metric(self, ttft: float, tokens_in: int = 0, tokens_out: int = 0):
         """Add LLM metric with timestamp"""
         self.llm_calls += 1
-        self.llm_metrics.append({
+        event = {
             'timestamp': time.time(),
             'ttft': ttft,
             'tokens_in': tokens_in,
             'tokens_out': tokens_out,
             'sequence': self.llm_calls
-        })
+        }
+        self.llm_metrics.append(event)
+        self._record_sample("llm_ttft", ttft)
+        return event
     
     def add_tts_metric(self, ttfb: float = 0, duration: float = 0, characters: int = 0):
         """Add TTS metric with timestamp"""
         self.tts_calls += 1
-        self.tts_metrics.append({
+        event = {
             'timestamp': time.time(),
             'ttfb': ttfb,
             'duration': duration,
             'characters': characters,
             'sequence': self.tts_calls
-        })
+        }
+        self.tts_metrics.append(event)
+        self._record_sample("tts_ttfb", ttfb)
+        return event
     
     def add_asr_metric(self, duration: float = 0, words: int = 0):
         """Add ASR metric with timestamp"""
         self.asr_calls += 1
-        self.asr_metrics.append({
+        event = {
             'timestamp': time.time(),
             'duration': duration,
             'words': words,
             'sequence': self.asr_calls
-        })
+        }
+        self.asr_metrics.append(event)
+        self._record_sample("asr_duration", duration)
+        return event
     
     def add_eou_metric(self, delay: float):
         """Add End of Utterance metric"""
-        self.eou_metrics.append({
+        self.eou_events += 1
+        event = {
             'timestamp': time.time(),
             'delay': delay,
-            'sequence': len(self.eou_metrics) + 1
-        })
+            'sequence': self.eou_events
+        }
+        self.eou_metrics.append(event)
+        self._record_sample("eou_delay", delay)
+        return event
     
     def add_user_latency_metric(self, latency: float):
         """Add user-experienced latency metric"""
-        self.user_latency_metrics.append({
+        self.user_latency_events += 1
+        event = {
             'timestamp': time.time(),
             'latency': latency,
-            'sequence': len(self.user_latency_metrics) + 1
+            'sequence': self.user_latency_events
+        }
+        self.user_latency_metrics.append(event)
+        self._record_sample("user_latency", latency)
+        return event
+    
+    def add_turn_metric(self, turn: Dict):
+        """Add a correlated per-turn latency breakdown (see TurnTrace.to_dict)
+        
+        The turn's end-to-end response latency also counts as a user latency sample.
+        """
+        self.turns += 1
+        event = dict(turn, timestamp=time.time(), sequence=self.turns)
+        self.turn_metrics.append(event)
+        self.add_user_latency_metric(turn['response_latency'])
+        return event
+    
+    def add_guardrails_metric(self, guardrails: Dict):
+        """Add one turn's guardrails timing (see GuardrailsMetrics.to_dict)"""
+        event = dict(guardrails, timestamp=time.time())
+        self.guardrails_metrics.append(event)
+        self.ttft_recovered_ms += guardrails.get('ttft_recovered_ms', 0)
+        source = guardrails.get('verdict_source')
+        if source:
+            self.guardrails_verdict_sources[source] = self.guardrails_verdict_sources.get(source, 0) + 1
+        return event
+    
+    def add_tool_metric(self, tool: str, latency: float, cache_hit: bool = False, success: bool = True,
+                        skipped: Optional[str] = None, breaker_state: str = "closed", breaker_trips: int = 0):
+        """Add one HTTP-backed tool invocation (function tools, guardrails)
+        
+        `skipped` is set when the call never went out (circuit open or turn
+        latency budget used up); breaker state/trips are the latest seen.
+        """
+        stats = self.tool_metrics.setdefault(tool, {
+            'calls': 0, 'cache_hits': 0, 'errors': 0, 'total_latency': 0.0, 'max_latency': 0.0,
+            'circuit_open_skips': 0, 'budget_skips': 0, 'breaker_state': 'closed', 'breaker_trips': 0
         })
+        stats['calls'] += 1
+        stats['cache_hits'] += int(cache_hit)
+        stats['errors'] += int(not success and not skipped)
+        stats['circuit_open_skips'] += int(skipped == "circuit_open")
+        stats['budget_skips'] += int(skipped == "budget_exhausted")
+        stats['total_latency'] += latency
+        stats['max_latency'] = max(stats['max_latency'], latency)
+        stats['breaker_state'] = breaker_state
+        stats['breaker_trips'] = breaker_trips
+        event = {
+            'tool': tool,
+            'latency': latency,
+            'cache_hit': int(cache_hit),
+            'success': int(success),
+            'breaker_state': breaker_state,
+            'breaker_trips': breaker_trips,
+            'timestamp': time.time()
+        }
+        if skipped:
+            event['skipped'] = skipped
+        return event
+    
+    def add_speculation_metric(self, confirmed: bool, lead_ms: float = 0.0):
+        """Add the outcome of one agent-assist speculation (see agent_assist/speculation.py)
+        
+        `lead_ms` is how long before the final transcript agent-assist
+        requested the suggestion (its speculation_head_start_ms); 0 when discarded.
+        """
+        stats = self.assist_speculation
+        if confirmed:
+            stats['confirmed'] += 1
+            stats['total_lead_ms'] += lead_ms
+            stats['max_lead_ms'] = max(stats['max_lead_ms'], lead_ms)
+        else:
+            stats['discarded'] += 1
+        return {'confirmed': int(confirmed), 'lead_ms': round(lead_ms, 1), 'timestamp': time.time()}
     
     def get_call_duration(self) -> float:
         """Get call duration in seconds"""
         end = self.end_time or time.time()
         return end - self.start_time
+    
+    def latency_histograms(self) -> Dict[str, LatencyHistogram]:
+        """Per-component latency histograms (built from raw events when not compact)"""
+        if self.histograms is not None:
+            return self.histograms
+        
+        histograms = {}
+        for name, (list_name, field) in COMPONENT_HISTOGRAMS.items():
+            histogram = LatencyHistogram()
+            for event in getattr(self, list_name):
+                if name not in POSITIVE_ONLY_HISTOGRAMS or event[field] > 0:
+                    histogram.add(event[field])
+            histograms[name] = histogram
+        return histograms
+    
+    def to_dict(self) -> Dict:
+        """Serializable representation (rings as lists, histograms in sparse form)"""
+        data = {name: getattr(self, name) for name in self.__dataclass_fields__ if name != "histograms"}
+        for list_name in EVENT_LISTS:
+            data[list_name] = list(data[list_name])
+        if self.histograms is not None:
+            data["histograms"] = {name: h.to_dict() for name, h in self.histograms.items()}
+        return data
 
 class EnhancedMetricsRecorder:
     """Enhanced metrics recorder with detailed tracking"""
@@ -111,6 +286,9 @@ class EnhancedMetricsRecorder:
         self.active_calls: Dict[str, DetailedCallMetrics] = {}
         self.start_time = time.time()
         
+        # Events recorded since the last flush_deltas(), per call
+        self._pending_deltas: Dict[str, List[tuple]] = {}
+        
         logger.setLevel(logging.INFO)
         
         if self.config.enabled:
@@ -152,11 +330,14 @@ class EnhancedMetricsRecorder:
             client_name=client,
             start_time=time.time(),
             phone_number=phone_number,
-            caller_name=caller_name
+            caller_name=caller_name,
+            compact=self.config.compact_metrics,
+            recent_events_limit=self.config.recent_events_limit
         )
         
         self.active_calls[call_id] = call_metrics
         await self._store_call_detailed(call_id, call_metrics)
+        await self._index_call_started(call_id, call_metrics)
         
         logger.info(f"📞 Started enhanced tracking: {call_id} (client: {client})")
         return call_id
@@ -166,6 +347,8 @@ class EnhancedMetricsRecorder:
         if call_id.startswith("disabled_") or call_id not in self.active_calls:
             return
         
+        await self.flush_deltas()
+        
         call_metrics = self.active_calls[call_id]
         call_metrics.end_time = time.time()
         call_metrics.status = status
@@ -174,6 +357,7 @@ class EnhancedMetricsRecorder:
         # Store final metrics
         await self._store_call_detailed(call_id, call_metrics)
         await self._store_completed_call_detailed(call_id, call_metrics)
+        await self._index_call_ended(call_id)
         
         duration = call_metrics.get_call_duration()
         logger.info(f"📞 Enhanced call ended: {call_id} (status: {status}, duration: {duration:.1f}s)")
@@ -187,7 +371,8 @@ class EnhancedMetricsRecorder:
             return
         
         call_metrics = self.active_calls[call_id]
-        call_metrics.add_llm_metric(ttft, tokens_in, tokens_out)
+        event = call_metrics.add_llm_metric(ttft, tokens_in, tokens_out)
+        self._queue_delta(call_id, "llm", event)
         
         logger.debug(f"🧠 Enhanced LLM metric: {call_id} - TTFT: {ttft:.3f}s, Tokens: {tokens_in}/{tokens_out}")
     
@@ -197,7 +382,8 @@ class EnhancedMetricsRecorder:
             return
         
         call_metrics = self.active_calls[call_id]
-        call_metrics.add_tts_metric(ttfb, duration, characters)
+        event = call_metrics.add_tts_metric(ttfb, duration, characters)
+        self._queue_delta(call_id, "tts", event)
         
         logger.debug(f"🗣️ Enhanced TTS metric: {call_id} - TTFB: {ttfb:.3f}s, Duration: {duration:.3f}s")
     
@@ -207,7 +393,8 @@ class EnhancedMetricsRecorder:
             return
         
         call_metrics = self.active_calls[call_id]
-        call_metrics.add_asr_metric(duration, words)
+        event = call_metrics.add_asr_metric(duration, words)
+        self._queue_delta(call_id, "asr", event)
         
         logger.debug(f"🎤 Enhanced ASR metric: {call_id} - Duration: {duration:.3f}s, Words: {words}")
     
@@ -217,7 +404,8 @@ class EnhancedMetricsRecorder:
             return
         
         call_metrics = self.active_calls[call_id]
-        call_metrics.add_eou_metric(delay)
+        event = call_metrics.add_eou_metric(delay)
+        self._queue_delta(call_id, "eou", event)
         
         logger.debug(f"⏱️ Enhanced EOU metric: {call_id} - Delay: {delay:.3f}s")
     
@@ -227,10 +415,112 @@ class EnhancedMetricsRecorder:
             return
         
         call_metrics = self.active_calls[call_id]
-        call_metrics.add_user_latency_metric(latency)
+        event = call_metrics.add_user_latency_metric(latency)
+        self._queue_delta(call_id, "user_latency", event)
         
         logger.info(f"👤 Enhanced user latency: {call_id} - Latency: {latency:.3f}s")
     
+    async def record_detailed_turn(self, call_id: str, turn: Dict):
+        """Record a per-turn end-to-end latency breakdown (EOU -> LLM TTFT -> TTS TTFB)"""
+        if call_id.startswith("disabled_") or call_id not in self.active_calls:
+            return
+        
+        call_metrics = self.active_calls[call_id]
+        event = call_metrics.add_turn_metric(turn)
+        self._queue_delta(call_id, "turn", {k: v for k, v in event.items() if v is not None})
+        self._queue_delta(call_id, "user_latency", call_metrics.user_latency_metrics[-1])
+        
+        logger.info(
+            f"🔁 Turn latency: {call_id} - {turn['response_latency']:.3f}s "
+            f"(EOU {turn['eou_delay']:.3f}s + TTFT {turn['llm_ttft']:.3f}s + TTFB {turn['tts_ttfb']:.3f}s)"
+        )
+    
+    async def record_setup_timing(self, call_id: str, name: str, value_ms: float):
+        """Record a call setup timing (e.g. ring time, ring-to-first-word) in milliseconds"""
+        if call_id.startswith("disabled_") or call_id not in self.active_calls:
+            return
+        
+        self.active_calls[call_id].setup_timings[name] = round(value_ms, 1)
+        self._queue_delta(call_id, "setup", {"name": name, "value_ms": round(value_ms, 1)})
+    
+    async def record_guardrails_metric(self, call_id: str, guardrails: Dict):
+        """Record guardrails validation timing and the TTFT it did (not) cost"""
+        if call_id.startswith("disabled_") or call_id not in self.active_calls:
+            return
+        
+        event = self.active_calls[call_id].add_guardrails_metric(guardrails)
+        self._queue_delta(call_id, "guardrails", {k: int(v) if isinstance(v, bool) else v for k, v in event.items() if v is not None})
+        
+        logger.info(
+            f"🛡️ Guardrails: {call_id} - validation {guardrails['validation_ms']:.0f} ms, "
+            f"TTFT recovered {guardrails['ttft_recovered_ms']:.0f} ms, blocked: {guardrails['blocked']}"
+        )
+    
+    async def record_tool_metric(self, call_id: str, tool: str, latency: float, cache_hit: bool = False, success: bool = True,
+                                 skipped: Optional[str] = None, breaker_state: str = "closed", breaker_trips: int = 0):
+        """Record latency, cache outcome and circuit breaker state of an HTTP-backed tool call"""
+        if call_id.startswith("disabled_") or call_id not in self.active_calls:
+            return
+        
+        event = self.active_calls[call_id].add_tool_metric(
+            tool, latency, cache_hit, success, skipped, breaker_state, breaker_trips
+        )
+        self._queue_delta(call_id, "tool", event)
+        
+        if skipped:
+            logger.warning(f"⚡ Tool call skipped: {call_id} - {tool} ({skipped}, breaker {breaker_state}, {breaker_trips} trips)")
+        else:
+            logger.debug(f"🔧 Tool metric: {call_id} - {tool} {latency * 1000:.0f} ms (cache hit: {cache_hit})")
+    
+    async def record_speculation_metric(self, call_id: str, confirmed: bool, lead_ms: float = 0.0):
+        """Record whether a speculative agent-assist suggestion held and the lead time it gained"""
+        if call_id.startswith("disabled_") or call_id not in self.active_calls:
+            return
+        
+        event = self.active_calls[call_id].add_speculation_metric(confirmed, lead_ms)
+        self._queue_delta(call_id, "speculation", event)
+        logger.debug(f"🔮 Assist speculation: {call_id} - confirmed: {confirmed}, lead {lead_ms:.0f} ms")
+    
+    def _queue_delta(self, call_id: str, kind: str, event: Dict):
+        if self.redis_client:
+            self._pending_deltas.setdefault(call_id, []).append((kind, event))
+    
+    async def flush_deltas(self):
+        """Write events recorded since the last flush as one pipelined delta
+        
+        Each event is appended to the call's event stream and the running
+        counters are updated in a small hash, so a crashed worker loses at
+        most one flush interval instead of the whole call.
+        """
+        if not self._pending_deltas:
+            return
+        
+        pending, self._pending_deltas = self._pending_deltas, {}
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for call_id, events in pending.items():
+                stream_key = f"{CALL_EVENTS_PREFIX}{call_id}"
+                for kind, event in events:
+                    pipe.xadd(stream_key, {"type": kind, **event}, maxlen=CALL_EVENTS_MAXLEN, approximate=True)
+                pipe.expire(stream_key, CALL_TTL_SECONDS)
+                
+                call_metrics = self.active_calls.get(call_id)
+                if call_metrics:
+                    progress_key = f"{CALL_PROGRESS_PREFIX}{call_id}"
+                    pipe.hset(progress_key, mapping={
+                        "llm_calls": call_metrics.llm_calls,
+                        "tts_calls": call_metrics.tts_calls,
+                        "asr_calls": call_metrics.asr_calls,
+                        "eou_events": call_metrics.eou_events,
+                        "user_latency_events": call_metrics.user_latency_events,
+                        "turns": call_metrics.turns,
+                        "last_update": time.time()
+                    })
+                    pipe.expire(progress_key, CALL_TTL_SECONDS)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to flush metric deltas: {e}")
+    
     async def get_active_calls(self) -> Dict:
         """Get current active calls for monitoring"""
         return {
@@ -255,24 +545,67 @@ class EnhancedMetricsRecorder:
             return
         
         try:
-            key = f"enhanced_metrics:call:{call_id}"
-            data = json.dumps(asdict(metrics), default=str)
-            ttl = 7 * 24 * 3600  # 7 days
-            await self.redis_client.setex(key, ttl, data)
+            key = f"{CALL_KEY_PREFIX}{call_id}"
+            data = json.dumps(metrics.to_dict(), default=str)
+            await self.redis_client.setex(key, CALL_TTL_SECONDS, data)
         except Exception as e:
             logger.warning(f"Failed to store detailed call metrics: {e}")
     
+    async def _index_call_started(self, call_id: str, metrics: DetailedCallMetrics):
+        """Add call to the active set and the time-ordered call index"""
+        if not self.redis_client:
+            return
+        
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.sadd(ACTIVE_CALLS_KEY, call_id)
+            pipe.zadd(CALL_INDEX_KEY, {call_id: metrics.start_time})
+            # Drop index entries whose call records have already expired
+            pipe.zremrangebyscore(CALL_INDEX_KEY, "-inf", time.time() - CALL_TTL_SECONDS)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to index started call: {e}")
+    
+    async def _index_call_ended(self, call_id: str):
+        """Remove call from the active set (it stays in the time index)"""
+        if not self.redis_client:
+            return
+        
+        try:
+            await self.redis_client.srem(ACTIVE_CALLS_KEY, call_id)
+        except Exception as e:
+            logger.warning(f"Failed to unindex ended call: {e}")
+    
     async def _store_completed_call_detailed(self, call_id: str, metrics: DetailedCallMetrics):
         """Store completed call in enhanced completed calls list"""
         if not self.redis_client:
             return
         
         try:
-            key = "enhanced_metrics:completed_calls"
-            data = json.dumps(asdict(metrics), default=str)
-            await self.redis_client.lpush(key, data)
-            await self.redis_client.ltrim(key, 0, 9999)  # Keep last 10k calls
-            await self.redis_client.expire(key, 30 * 24 * 3600)  # 30 days
+            key = COMPLETED_CALLS_KEY
+            data = json.dumps(metrics.to_dict(), default=str)
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.lpush(key, data)
+            pipe.ltrim(key, 0, 9999)  # Keep last 10k calls
+            pipe.expire(key, 30 * 24 * 3600)  # 30 days
+            
+            # Fold this call into the rolling minute/hour/day aggregates used by analytics
+            component_histograms = metrics.latency_histograms()
+            duration_histogram = LatencyHistogram()
+            if metrics.end_time:
+                duration_histogram.add(metrics.get_call_duration())
+            record_completed_call(
+                pipe,
+                start_time=metrics.start_time,
+                status=metrics.status,
+                client_name=metrics.client_name,
+                histograms={
+                    "ttft": component_histograms["llm_ttft"],
+                    "user_latency": component_histograms["user_latency"],
+                    "duration": duration_histogram,
+                },
+            )
+            await pipe.execute()
         except Exception as e:
             logger.warning(f"Failed to store completed call: {e}")
     
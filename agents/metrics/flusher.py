@@ -0,0 +1,107 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+logger = logging.getLogger("enhanced_metrics")
+
+_STOP = object()  # queued by stop(): the run loop flushes its batch and exits
+
+
+class MetricsFlusher:
+    """Per-process batching of metrics events off the realtime audio path
+
+    Event handlers call `submit`, which never blocks: events go into a bounded
+    queue and are dropped (and counted) when it is full. A single background
+    task applies queued events to the recorder and then writes them to Redis
+    with one pipelined `flush_deltas` call every `flush_interval_ms` or every
+    `max_batch_events` events, whichever comes first.
+    """
+
+    def __init__(self, recorder, apply_fn: Callable[..., Awaitable[None]],
+                 flush_interval_ms: int = 250, max_batch_events: int = 50, max_queue_size: int = 1000):
+        self.recorder = recorder
+        self.apply_fn = apply_fn
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch_events = max_batch_events
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._task: Optional[asyncio.Task] = None
+
+        self.submitted_events = 0
+        self.dropped_events = 0
+        self.flushes = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def submit(self, call_id: str, metrics) -> bool:
+        """Queue a metrics payload for `apply_fn(metrics, call_id)`; False if dropped"""
+        try:
+            self._queue.put_nowait((call_id, metrics))
+            self.submitted_events += 1
+            return True
+        except asyncio.QueueFull:
+            self.dropped_events += 1
+            return False
+
+    async def stop(self):
+        """Flush the batch in progress and whatever is still queued, then stop"""
+        if self._task:
+            if not self._task.done():
+                await self._queue.put(_STOP)
+            try:
+                await self._task
+            except Exception as e:
+                logger.warning(f"Metrics flusher task failed: {e}")
+            self._task = None
+
+        # Events submitted after the stop marker, or everything if the task died
+        await self._flush(self._drain())
+
+        logger.info(
+            f"📦 Metrics flusher stopped: {self.submitted_events} events, "
+            f"{self.flushes} flushes, {self.dropped_events} dropped"
+        )
+
+    def _drain(self) -> List[Tuple[str, object]]:
+        batch = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                batch.append(item)
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.max_batch_events:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Tuple[str, object]]):
+        for call_id, metrics in batch:
+            try:
+                await self.apply_fn(metrics, call_id)
+            except Exception as e:
+                logger.warning(f"Failed to apply metrics event: {e}")
+
+        await self.recorder.flush_deltas()
+        self.flushes += 1
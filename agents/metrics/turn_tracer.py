@@ -0,0 +1,84 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional
+
+
+@dataclass
+class TurnTrace:
+    """Stage timings of a single user turn, correlated by speech_id"""
+    speech_id: str
+    started_at: float
+    eou_delay: Optional[float] = None  # End of user speech -> turn committed
+    transcription_delay: Optional[float] = None  # End of user speech -> final transcript
+    llm_ttft: Optional[float] = None  # LLM request -> first token
+    tts_ttfb: Optional[float] = None  # TTS request -> first audio byte
+
+    @property
+    def is_complete(self) -> bool:
+        return None not in (self.eou_delay, self.llm_ttft, self.tts_ttfb)
+
+    @property
+    def response_latency(self) -> float:
+        """User-perceived gap from end of speech to first agent audio"""
+        return (self.eou_delay or 0) + (self.llm_ttft or 0) + (self.tts_ttfb or 0)
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data["response_latency"] = self.response_latency
+        return data
+
+
+class TurnTracer:
+    """Correlates EOU, LLM and TTS metrics events of a turn into one TurnTrace
+
+    LiveKit tags every pipeline metric with the `speech_id` of the agent reply
+    it belongs to. Only the first LLM and TTS event per turn count (tool calls
+    and multi-segment replies emit several), which is what the caller hears.
+    Turns that never complete (e.g. the greeting, which has no EOU) are
+    evicted once more than `max_open_turns` are pending. Events arriving after
+    their turn completed (later LLM/TTS segments) are ignored for the last
+    `max_completed_turns` turns.
+    """
+
+    def __init__(self, max_open_turns: int = 32, max_completed_turns: int = 32):
+        self.max_open_turns = max_open_turns
+        self.max_completed_turns = max_completed_turns
+        self._open_turns: "OrderedDict[str, TurnTrace]" = OrderedDict()
+        self._completed_ids: "OrderedDict[str, None]" = OrderedDict()
+        self.completed_turns = 0
+        self.evicted_turns = 0
+
+    def observe(self, metric) -> Optional[TurnTrace]:
+        """Feed one metrics event; returns the TurnTrace once its turn is complete"""
+        speech_id = getattr(metric, "speech_id", None)
+        if not speech_id or speech_id in self._completed_ids:
+            return None
+
+        trace = self._open_turns.get(speech_id)
+        if trace is None:
+            trace = TurnTrace(speech_id=speech_id, started_at=time.time())
+            self._open_turns[speech_id] = trace
+            if len(self._open_turns) > self.max_open_turns:
+                self._open_turns.popitem(last=False)
+                self.evicted_turns += 1
+
+        if hasattr(metric, "end_of_utterance_delay"):
+            if trace.eou_delay is None:
+                trace.eou_delay = metric.end_of_utterance_delay
+                trace.transcription_delay = getattr(metric, "transcription_delay", None)
+        elif hasattr(metric, "ttft"):
+            if trace.llm_ttft is None and metric.ttft > 0:
+                trace.llm_ttft = metric.ttft
+        elif hasattr(metric, "ttfb"):
+            if trace.tts_ttfb is None and metric.ttfb > 0:
+                trace.tts_ttfb = metric.ttfb
+
+        if trace.is_complete:
+            del self._open_turns[speech_id]
+            self._completed_ids[speech_id] = None
+            if len(self._completed_ids) > self.max_completed_turns:
+                self._completed_ids.popitem(last=False)
+            self.completed_turns += 1
+            return trace
+        return None
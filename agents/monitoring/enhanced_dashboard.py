@@ -12,6 +12,8 @@ import logging
 # Add project root to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from config.enhanced_metrics_config import EnhancedMetricsConfig
+from metrics.enhanced_recorder import CALL_KEY_PREFIX, ACTIVE_CALLS_KEY, COMPLETED_CALLS_KEY, COMPONENT_HISTOGRAMS, POSITIVE_ONLY_HISTOGRAMS
+from metrics.aggregates import LatencyHistogram, load_aggregates, trailing_window_keys, trailing_day_keys
 
 logger = logging.getLogger("enhanced_dashboard")
 
@@ -33,6 +35,8 @@ app.add_middleware(
 config = EnhancedMetricsConfig.from_yaml()
 redis_client = None
 
+ANALYTICS_RETENTION_DAYS = 30  # Same window the completed calls list is kept for
+
 # Mount static files (HTML, CSS, JS)
 html_directory = os.path.join(os.path.dirname(__file__), '..', 'html')
 app.mount("/static", StaticFiles(directory=html_directory), name="static")
@@ -57,6 +61,66 @@ async def shutdown():
     if redis_client:
         await redis_client.close()
 
+async def fetch_active_calls():
+    """Fetch active call records via the recorder's active-call index.
+    
+    Reads only the members of the active set with a single MGET, so the cost
+    is O(active calls) regardless of how many call records are retained.
+    Members whose record expired or is no longer active are pruned.
+    """
+    call_ids = list(await redis_client.smembers(ACTIVE_CALLS_KEY))
+    if not call_ids:
+        return []
+    
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.mget([f"{CALL_KEY_PREFIX}{call_id}" for call_id in call_ids])
+    (values,) = await pipe.execute()
+    
+    calls = []
+    stale_ids = []
+    for call_id, call_data in zip(call_ids, values):
+        call = json.loads(call_data) if call_data else None
+        if call and call.get("status") == "active":
+            calls.append(call)
+        else:
+            stale_ids.append(call_id)
+    
+    if stale_ids:
+        await redis_client.srem(ACTIVE_CALLS_KEY, *stale_ids)
+    
+    return calls
+
+def call_histograms(call):
+    """Per-component latency histograms for a stored call record.
+    
+    Compact records carry the histograms directly (their raw event lists are
+    only a ring of recent events); full records are bucketed from the lists.
+    """
+    stored = call.get("histograms")
+    if stored:
+        return {name: LatencyHistogram.from_dict(stored.get(name)) for name in COMPONENT_HISTOGRAMS}
+    
+    histograms = {}
+    for name, (list_name, field) in COMPONENT_HISTOGRAMS.items():
+        histogram = LatencyHistogram()
+        for metric in call.get(list_name, []):
+            value = metric.get(field, 0)
+            if name not in POSITIVE_ONLY_HISTOGRAMS or value > 0:
+                histogram.add(value)
+        histograms[name] = histogram
+    return histograms
+
+def assist_speculation_summary(stats):
+    """Confirmed/discarded speculative agent-assist suggestions and the lead time they gained"""
+    stats = stats or {'confirmed': 0, 'discarded': 0, 'total_lead_ms': 0.0, 'max_lead_ms': 0.0}
+    confirmed = stats['confirmed']
+    return {
+        "confirmed": confirmed,
+        "discarded": stats['discarded'],
+        "avg_lead_ms": round(stats['total_lead_ms'] / confirmed, 1) if confirmed else 0,
+        "max_lead_ms": round(stats['max_lead_ms'], 1),
+    }
+
 # ==============================================================================
 # HTML ROUTES - Serve HTML files from /agents/html folder
 # ==============================================================================
@@ -94,54 +158,44 @@ async def get_enhanced_status():
         raise HTTPException(status_code=503, detail="Redis unavailable")
     
     try:
-        # Get all enhanced metrics
-        call_keys = await redis_client.keys("enhanced_metrics:call:*")
+        # Get active calls from the recorder's index
         active_calls = []
-        total_calls = 0
-        
-        for key in call_keys:
-            call_data = await redis_client.get(key)
-            if call_data:
-                call = json.loads(call_data)
-                total_calls += 1
-                
-                if call.get("status") == "active":
-                    current_time = datetime.now().timestamp()
-                    duration = current_time - call["start_time"]
-                    
-                    # Calculate real-time metrics
-                    llm_calls = len(call.get('llm_metrics', []))
-                    tts_calls = len(call.get('tts_metrics', []))
-                    asr_calls = len(call.get('asr_metrics', []))
-                    
-                    # Calculate average latencies
-                    llm_metrics = call.get('llm_metrics', [])
-                    avg_ttft = sum(m['ttft'] for m in llm_metrics) / max(1, len(llm_metrics))
-                    
-                    user_latencies = call.get('user_latency_metrics', [])
-                    avg_user_latency = sum(m['latency'] for m in user_latencies) / max(1, len(user_latencies))
-                    
-                    active_calls.append({
-                        "call_id": call["call_id"],
-                        "client_name": call["client_name"],
-                        "phone_number": call.get("phone_number", ""),
-                        "duration_seconds": round(duration, 1),
-                        "duration_minutes": round(duration / 60, 2),
-                        "llm_calls": llm_calls,
-                        "tts_calls": tts_calls,
-                        "asr_calls": asr_calls,
-                        "avg_ttft": round(avg_ttft, 3),
-                        "avg_user_latency": round(avg_user_latency, 3),
-                        "interactions_per_minute": round((llm_calls + tts_calls) / max(1, duration/60), 1),
-                        "status_health": "healthy" if avg_ttft < 2.0 and duration < 600 else "warning"
-                    })
+        
+        for call in await fetch_active_calls():
+            current_time = datetime.now().timestamp()
+            duration = current_time - call["start_time"]
+            
+            # Calculate real-time metrics
+            histograms = call_histograms(call)
+            llm_calls = histograms["llm_ttft"].count
+            tts_calls = histograms["tts_ttfb"].count
+            asr_calls = histograms["asr_duration"].count
+            
+            # Calculate average latencies
+            avg_ttft = histograms["llm_ttft"].mean()
+            avg_user_latency = histograms["user_latency"].mean()
+            
+            active_calls.append({
+                "call_id": call["call_id"],
+                "client_name": call["client_name"],
+                "phone_number": call.get("phone_number", ""),
+                "duration_seconds": round(duration, 1),
+                "duration_minutes": round(duration / 60, 2),
+                "llm_calls": llm_calls,
+                "tts_calls": tts_calls,
+                "asr_calls": asr_calls,
+                "avg_ttft": round(avg_ttft, 3),
+                "avg_user_latency": round(avg_user_latency, 3),
+                "interactions_per_minute": round((llm_calls + tts_calls) / max(1, duration/60), 1),
+                "status_health": "healthy" if avg_ttft < 2.0 and duration < 600 else "warning"
+            })
         
         # Get completed calls for statistics
-        completed_data = await redis_client.lrange("enhanced_metrics:completed_calls", 0, -1)
+        completed_data = await redis_client.lrange(COMPLETED_CALLS_KEY, -50, -1)  # Last 50 calls
         completed_calls = []
         
         if completed_data:
-            for call_json in completed_data[-50:]:  # Last 50 calls
+            for call_json in completed_data:
                 call = json.loads(call_json)
                 completed_calls.append(call)
         
@@ -157,21 +211,18 @@ async def get_enhanced_status():
             # Calculate averages
             avg_duration = sum((c.get('end_time', c['start_time']) - c['start_time']) for c in successful_calls) / max(1, len(successful_calls))
             
-            all_llm_metrics = []
-            all_user_latencies = []
+            all_ttft = LatencyHistogram()
+            all_user_latencies = LatencyHistogram()
             total_interactions = 0
             
             for call in completed_calls:
-                llm_metrics = call.get('llm_metrics', [])
-                all_llm_metrics.extend([m['ttft'] for m in llm_metrics])
-                
-                user_metrics = call.get('user_latency_metrics', [])
-                all_user_latencies.extend([m['latency'] for m in user_metrics])
-                
-                total_interactions += len(call.get('llm_metrics', [])) + len(call.get('tts_metrics', []))
+                histograms = call_histograms(call)
+                all_ttft.merge(histograms["llm_ttft"])
+                all_user_latencies.merge(histograms["user_latency"])
+                total_interactions += histograms["llm_ttft"].count + histograms["tts_ttfb"].count
             
-            avg_ttft = sum(all_llm_metrics) / max(1, len(all_llm_metrics))
-            avg_user_latency = sum(all_user_latencies) / max(1, len(all_user_latencies))
+            avg_ttft = all_ttft.mean()
+            avg_user_latency = all_user_latencies.mean()
             
         else:
             success_rate = 0
@@ -211,118 +262,50 @@ async def get_enhanced_status():
 
 @app.get("/api/load-test-analytics")
 async def get_load_test_analytics():
-    """Get detailed load test analytics and trends"""
+    """Get detailed load test analytics and trends
+    
+    Served from the rolling minute/hour/day aggregates maintained by the recorder,
+    so each request merges a few dozen buckets instead of re-parsing the
+    completed calls list.
+    """
     if not redis_client:
         raise HTTPException(status_code=503, detail="Redis unavailable")
     
     try:
-        # Get completed calls data
-        completed_data = await redis_client.lrange("enhanced_metrics:completed_calls", 0, -1)
+        now = datetime.now().timestamp()
+        last_hour = await load_aggregates(redis_client, trailing_window_keys(now, 3600))
+        last_24h = await load_aggregates(redis_client, trailing_window_keys(now, 24 * 3600))
+        retained = await load_aggregates(redis_client, trailing_day_keys(now, ANALYTICS_RETENTION_DAYS))
         
-        if not completed_data:
+        if not retained.calls:
             return {"message": "No load test data available"}
         
-        calls = [json.loads(call) for call in completed_data]
-        
-        # Time-based analysis
-        now = datetime.now().timestamp()
-        last_hour_calls = [c for c in calls if (now - c['start_time']) < 3600]
-        last_24h_calls = [c for c in calls if (now - c['start_time']) < 86400]
-        
         # Performance trends
-        performance_trends = {
-            "hourly": {
-                "total_calls": len(last_hour_calls),
-                "success_rate": len([c for c in last_hour_calls if c.get('status') == 'completed']) / max(1, len(last_hour_calls)) * 100,
-                "avg_ttft": 0,
-                "avg_user_latency": 0
-            },
-            "daily": {
-                "total_calls": len(last_24h_calls),
-                "success_rate": len([c for c in last_24h_calls if c.get('status') == 'completed']) / max(1, len(last_24h_calls)) * 100,
-                "avg_ttft": 0,
-                "avg_user_latency": 0
+        performance_trends = {}
+        for period, data in [("hourly", last_hour), ("daily", last_24h)]:
+            performance_trends[period] = {
+                "total_calls": data.calls,
+                "success_rate": data.success_rate,
+                "avg_ttft": round(data.histograms["ttft"].mean(), 3),
+                "avg_user_latency": round(data.histograms["user_latency"].mean(), 3)
             }
-        }
-        
-        # Calculate performance metrics for trends
-        for period, data in [("hourly", last_hour_calls), ("daily", last_24h_calls)]:
-            if data:
-                all_ttft = []
-                all_user_latencies = []
-                
-                for call in data:
-                    llm_metrics = call.get('llm_metrics', [])
-                    all_ttft.extend([m['ttft'] for m in llm_metrics])
-                    
-                    user_metrics = call.get('user_latency_metrics', [])
-                    all_user_latencies.extend([m['latency'] for m in user_metrics])
-                
-                performance_trends[period]["avg_ttft"] = round(sum(all_ttft) / max(1, len(all_ttft)), 3)
-                performance_trends[period]["avg_user_latency"] = round(sum(all_user_latencies) / max(1, len(all_user_latencies)), 3)
-        
-        # Client breakdown
-        client_stats = {}
-        for call in calls:
-            client = call.get('client_name', 'unknown')
-            if client not in client_stats:
-                client_stats[client] = {"calls": 0, "success": 0}
-            
-            client_stats[client]["calls"] += 1
-            if call.get('status') == 'completed':
-                client_stats[client]["success"] += 1
-        
-        # Performance distribution
-        all_ttft = []
-        all_user_latencies = []
-        call_durations = []
-        
-        for call in calls:
-            if call.get('end_time'):
-                call_durations.append(call['end_time'] - call['start_time'])
-            
-            llm_metrics = call.get('llm_metrics', [])
-            all_ttft.extend([m['ttft'] for m in llm_metrics])
-            
-            user_metrics = call.get('user_latency_metrics', [])
-            all_user_latencies.extend([m['latency'] for m in user_metrics])
         
-        # Performance percentiles
-        def percentile(data, p):
-            if not data:
-                return 0
-            sorted_data = sorted(data)
-            index = int(len(sorted_data) * p / 100)
-            return sorted_data[min(index, len(sorted_data) - 1)]
+        def rounded_percentiles(histogram, digits):
+            return {name: round(value, digits) for name, value in histogram.percentiles().items()}
         
         return {
             "timestamp": datetime.now(),
             "performance_trends": performance_trends,
-            "client_breakdown": client_stats,
+            "client_breakdown": retained.clients,
             "performance_distribution": {
-                "ttft_percentiles": {
-                    "p50": round(percentile(all_ttft, 50), 3),
-                    "p90": round(percentile(all_ttft, 90), 3),
-                    "p95": round(percentile(all_ttft, 95), 3),
-                    "p99": round(percentile(all_ttft, 99), 3)
-                },
-                "user_latency_percentiles": {
-                    "p50": round(percentile(all_user_latencies, 50), 3),
-                    "p90": round(percentile(all_user_latencies, 90), 3),
-                    "p95": round(percentile(all_user_latencies, 95), 3),
-                    "p99": round(percentile(all_user_latencies, 99), 3)
-                },
-                "call_duration_percentiles": {
-                    "p50": round(percentile(call_durations, 50), 1),
-                    "p90": round(percentile(call_durations, 90), 1),
-                    "p95": round(percentile(call_durations, 95), 1),
-                    "p99": round(percentile(call_durations, 99), 1)
-                }
+                "ttft_percentiles": rounded_percentiles(retained.histograms["ttft"], 3),
+                "user_latency_percentiles": rounded_percentiles(retained.histograms["user_latency"], 3),
+                "call_duration_percentiles": rounded_percentiles(retained.histograms["duration"], 1)
             },
             "load_test_progress": {
-                "total_calls_completed": len(calls),
+                "total_calls_completed": retained.calls,
                 "target_calls": config.load_test.initial_concurrent_calls,
-                "progress_percentage": min(100, (len(calls) / config.load_test.initial_concurrent_calls) * 100)
+                "progress_percentage": min(100, (retained.calls / config.load_test.initial_concurrent_calls) * 100)
             }
         }
         
@@ -338,24 +321,19 @@ async def get_all_calls():
     
     try:
         # Get active calls
-        active_keys = await redis_client.keys("enhanced_metrics:call:*")
         active_calls = []
         
-        for key in active_keys:
-            call_data = await redis_client.get(key)
-            if call_data:
-                call = json.loads(call_data)
-                if call.get("status") == "active":
-                    active_calls.append({
-                        "call_id": call["call_id"],
-                        "room_name": call["room_name"],
-                        "phone_number": call.get("phone_number", ""),
-                        "caller_name": call.get("caller_name", ""),
-                        "client_name": call["client_name"],
-                        "start_time": call["start_time"],
-                        "status": "active",
-                        "duration": datetime.now().timestamp() - call["start_time"]
-                    })
+        for call in await fetch_active_calls():
+            active_calls.append({
+                "call_id": call["call_id"],
+                "room_name": call["room_name"],
+                "phone_number": call.get("phone_number", ""),
+                "caller_name": call.get("caller_name", ""),
+                "client_name": call["client_name"],
+                "start_time": call["start_time"],
+                "status": "active",
+                "duration": datetime.now().timestamp() - call["start_time"]
+            })
         
         # Get completed calls
         completed_data = await redis_client.lrange("enhanced_metrics:completed_calls", 0, 99)  # Last 100
@@ -420,16 +398,18 @@ async def get_call_details(call_id: str):
         user_latency_metrics = call.get('user_latency_metrics', [])
         
         # Calculate averages and totals
-        avg_ttft = sum(m['ttft'] for m in llm_metrics) / max(1, len(llm_metrics))
-        avg_tts_ttfb = sum(m['ttfb'] for m in tts_metrics) / max(1, len(tts_metrics))
-        avg_asr_duration = sum(m['duration'] for m in asr_metrics) / max(1, len(asr_metrics))
-        avg_eou_delay = sum(m['delay'] for m in eou_metrics) / max(1, len(eou_metrics))
-        avg_user_latency = sum(m['latency'] for m in user_latency_metrics) / max(1, len(user_latency_metrics))
-        
+        histograms = call_histograms(call)
+        avg_ttft = histograms["llm_ttft"].mean()
+        avg_tts_ttfb = histograms["tts_ttfb"].mean()
+        avg_asr_duration = histograms["asr_duration"].mean()
+        avg_eou_delay = histograms["eou_delay"].mean()
+        avg_user_latency = histograms["user_latency"].mean()
+        
+        # Token counts are only kept on raw events (a recent-events ring in compact mode)
         total_tokens_in = sum(m.get('tokens_in', 0) for m in llm_metrics)
         total_tokens_out = sum(m.get('tokens_out', 0) for m in llm_metrics)
         total_tts_duration = sum(m.get('duration', 0) for m in tts_metrics)
-        total_asr_duration = sum(m.get('duration', 0) for m in asr_metrics)
+        total_asr_duration = histograms["asr_duration"].total
         
         return {
             "call_info": {
@@ -446,12 +426,12 @@ async def get_call_details(call_id: str):
                 "failure_reason": call.get("failure_reason")
             },
             "metrics_summary": {
-                "llm_calls": len(llm_metrics),
-                "tts_calls": len(tts_metrics),
-                "asr_calls": len(asr_metrics),
-                "eou_events": len(eou_metrics),
-                "user_latency_events": len(user_latency_metrics),
-                "total_interactions": len(llm_metrics) + len(tts_metrics),
+                "llm_calls": histograms["llm_ttft"].count,
+                "tts_calls": histograms["tts_ttfb"].count,
+                "asr_calls": histograms["asr_duration"].count,
+                "eou_events": histograms["eou_delay"].count,
+                "user_latency_events": histograms["user_latency"].count,
+                "total_interactions": histograms["llm_ttft"].count + histograms["tts_ttfb"].count,
                 "avg_ttft_seconds": round(avg_ttft, 3),
                 "avg_tts_ttfb_seconds": round(avg_tts_ttfb, 3),
                 "avg_asr_duration_seconds": round(avg_asr_duration, 3),
@@ -460,14 +440,27 @@ async def get_call_details(call_id: str):
                 "total_tokens_in": total_tokens_in,
                 "total_tokens_out": total_tokens_out,
                 "total_tts_duration_seconds": round(total_tts_duration, 3),
-                "total_asr_duration_seconds": round(total_asr_duration, 3)
+                "total_asr_duration_seconds": round(total_asr_duration, 3),
+                "guardrails_ttft_recovered_ms": round(call.get('ttft_recovered_ms', 0), 1),
+                "guardrails_verdict_sources": call.get('guardrails_verdict_sources') or {},
+                "assist_speculation": assist_speculation_summary(call.get('assist_speculation'))
+            },
+            "latency_percentiles": {
+                name: {p: round(v, 3) for p, v in histogram.percentiles().items()}
+                for name, histogram in histograms.items()
+            },
+            "tool_metrics": {
+                tool: dict(stats, avg_latency=round(stats['total_latency'] / stats['calls'], 3) if stats['calls'] else 0)
+                for tool, stats in (call.get('tool_metrics') or {}).items()
             },
             "detailed_metrics": {
                 "llm_metrics": llm_metrics,
                 "tts_metrics": tts_metrics,
                 "asr_metrics": asr_metrics,
                 "eou_metrics": eou_metrics,
-                "user_latency_metrics": user_latency_metrics
+                "user_latency_metrics": user_latency_metrics,
+                "turn_metrics": call.get('turn_metrics', []),
+                "guardrails_metrics": call.get('guardrails_metrics', [])
             }
         }
         
@@ -551,6 +544,21 @@ async def get_call_timeline(call_id: str):
                 }
             })
         
+        # Add per-turn response latency breakdowns
+        for metric in detailed_metrics["turn_metrics"]:
+            timeline.append({
+                "timestamp": metric["timestamp"],
+                "type": "TURN",
+                "event": f"Turn #{metric['sequence']}",
+                "details": {
+                    "speech_id": metric.get("speech_id"),
+                    "response_latency": metric["response_latency"],
+                    "eou_delay": metric.get("eou_delay"),
+                    "llm_ttft": metric.get("llm_ttft"),
+                    "tts_ttfb": metric.get("tts_ttfb")
+                }
+            })
+        
         # Sort by timestamp
         timeline.sort(key=lambda x: x["timestamp"])
         
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+from time import perf_counter
+
+import aiohttp
+import httpx
+import openai as openai_sdk
+from livekit.plugins import deepgram, openai
+
+logger = logging.getLogger("provider-pool")
+
+# Endpoints hit once per process to open keep-alive connections (incl. TLS) ahead of the first turn
+WARMUP_URLS = {
+    "deepgram": "https://api.deepgram.com/v1/projects",
+    "openai": "https://api.openai.com/v1/models",
+}
+
+
+class ProviderPool:
+    """Per-process warm HTTP sessions shared by the STT/LLM/TTS plugins
+
+    Built in prewarm_fnc. Sessions are created lazily on the job's event loop
+    (prewarm runs outside of it) and reused by every call in the process;
+    `stt()`, `llm()` and `tts()` hand out per-call plugin instances bound to
+    them, so AgentSession never pays connection setup on the first turn.
+    """
+
+    def __init__(self, keepalive_timeout: float = 300, connection_limit: int = 100):
+        self.keepalive_timeout = keepalive_timeout
+        self.connection_limit = connection_limit
+        self._http_session: aiohttp.ClientSession | None = None
+        self._openai_http: httpx.AsyncClient | None = None
+        self._openai_client: openai_sdk.AsyncClient | None = None
+        self._warm_task: asyncio.Task | None = None
+
+        self.hits = 0
+        self.misses = 0
+        self.warm_ms = 0.0
+
+    def _ensure_http_session(self) -> tuple[aiohttp.ClientSession, bool]:
+        if self._http_session is None or self._http_session.closed:
+            self._http_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.connection_limit,
+                    keepalive_timeout=self.keepalive_timeout,
+                )
+            )
+            return self._http_session, True
+        return self._http_session, False
+
+    def _ensure_openai_client(self) -> tuple[openai_sdk.AsyncClient, bool]:
+        if self._openai_client is None or self._openai_http.is_closed:
+            self._openai_http = httpx.AsyncClient(
+                timeout=httpx.Timeout(connect=15.0, read=5.0, write=5.0, pool=5.0),
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=self.connection_limit,
+                    max_keepalive_connections=self.connection_limit,
+                    keepalive_expiry=self.keepalive_timeout,
+                ),
+            )
+            self._openai_client = openai_sdk.AsyncClient(max_retries=0, http_client=self._openai_http)
+            return self._openai_client, True
+        return self._openai_client, False
+
+    def _count(self, created: bool):
+        if created:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+    def stt(self, **kwargs) -> deepgram.STT:
+        session, created = self._ensure_http_session()
+        self._count(created)
+        return deepgram.STT(http_session=session, **kwargs)
+
+    def tts(self, **kwargs) -> deepgram.TTS:
+        session, created = self._ensure_http_session()
+        self._count(created)
+        return deepgram.TTS(http_session=session, **kwargs)
+
+    def llm(self, **kwargs) -> openai.LLM:
+        client, created = self._ensure_openai_client()
+        self._count(created)
+        return openai.LLM(client=client, **kwargs)
+
+    def warm(self) -> asyncio.Task:
+        """Start (or return the already running) background connection warm-up"""
+        if self._warm_task is None or (self._warm_task.done() and self._needs_warm()):
+            self._warm_task = asyncio.create_task(self._warm())
+        return self._warm_task
+
+    def _needs_warm(self) -> bool:
+        return (
+            self._http_session is None or self._http_session.closed
+            or self._openai_http is None or self._openai_http.is_closed
+        )
+
+    async def _warm(self):
+        start = perf_counter()
+        session, _ = self._ensure_http_session()
+        self._ensure_openai_client()
+
+        async def touch_deepgram():
+            async with session.head(WARMUP_URLS["deepgram"]) as resp:
+                await resp.release()
+
+        async def touch_openai():
+            await self._openai_http.head(WARMUP_URLS["openai"])
+
+        # Any HTTP status (401 included) means the connection is up, which is all we need
+        results = await asyncio.gather(touch_deepgram(), touch_openai(), return_exceptions=True)
+        for name, result in zip(WARMUP_URLS, results):
+            if isinstance(result, Exception):
+                logger.warning(f"⚠️ Failed to pre-connect to {name}: {result}")
+
+        self.warm_ms = (perf_counter() - start) * 1000
+        logger.info(f"🔥 Provider connections warmed in {self.warm_ms:.0f} ms")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "reuse_rate": round(self.hits / total, 3) if total else 0,
+            "miss_rate": round(self.misses / total, 3) if total else 0,
+            "warm_ms": round(self.warm_ms, 1),
+        }
+
+    async def aclose(self):
+        if self._http_session and not self._http_session.closed:
+            await self._http_session.close()
+        if self._openai_http and not self._openai_http.is_closed:
+            await self._openai_http.aclose()
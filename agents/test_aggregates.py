@@ -0,0 +1,110 @@
+import sys
+import os
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timezone
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from metrics.aggregates import (
+    LatencyHistogram, load_aggregates, record_completed_call, trailing_window_keys,
+    minute_bucket_key, hour_bucket_key,
+)
+
+
+def utc(*args) -> float:
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+def covered_seconds(keys, now):
+    """Seconds of [.., now] covered by the bucket keys (the current bucket counts up to now)"""
+    total = 0
+    for key in keys:
+        stamp = key.rsplit(":", 1)[1]
+        if len(stamp) == 12:
+            start, length = datetime.strptime(stamp, "%Y%m%d%H%M"), 60
+        else:
+            start, length = datetime.strptime(stamp, "%Y%m%d%H"), 3600
+        start = start.replace(tzinfo=timezone.utc).timestamp()
+        total += min(start + length, now) - start
+    return total
+
+
+class FakePipeline:
+    """Just the HASH commands the aggregates use, on a dict"""
+
+    def __init__(self, store):
+        self.store = store
+        self.results = []
+
+    def hincrby(self, key, field, amount):
+        self.store[key][field] = str(int(self.store[key].get(field, 0)) + amount)
+
+    def hincrbyfloat(self, key, field, amount):
+        self.store[key][field] = str(float(self.store[key].get(field, 0)) + amount)
+
+    def expire(self, key, ttl):
+        pass
+
+    def hgetall(self, key):
+        self.results.append(dict(self.store.get(key, {})))
+
+    async def execute(self):
+        return self.results
+
+
+class FakeRedis:
+    def __init__(self):
+        self.store = defaultdict(dict)
+
+    def pipeline(self, transaction=False):
+        return FakePipeline(self.store)
+
+
+def test_trailing_hour_at_bucket_boundary():
+    now = utc(2025, 3, 1, 12, 0, 0)
+    keys = trailing_window_keys(now, 3600)
+    # The previous hour comes whole, the current hour bucket has just started
+    assert keys == [hour_bucket_key(utc(2025, 3, 1, 11)), hour_bucket_key(now)]
+
+    now = utc(2025, 3, 1, 12, 0, 30)
+    keys = trailing_window_keys(now, 3600)
+    assert keys[0] == minute_bucket_key(utc(2025, 3, 1, 11, 1))
+    assert keys[-1] == hour_bucket_key(utc(2025, 3, 1, 12))
+    assert 3600 - 60 < covered_seconds(keys, now) <= 3600
+
+
+def test_trailing_day_at_bucket_boundary():
+    for now in (utc(2025, 3, 1, 12, 0, 0), utc(2025, 3, 1, 12, 0, 1), utc(2025, 3, 1, 12, 59, 59)):
+        keys = trailing_window_keys(now, 24 * 3600)
+        assert 24 * 3600 - 60 < covered_seconds(keys, now) <= 24 * 3600
+        assert len(keys) <= 25 + 59
+
+
+def test_last_hour_does_not_reset_at_the_hour():
+    redis_client = FakeRedis()
+    ttft = LatencyHistogram()
+    ttft.add(0.5)
+    pipe = redis_client.pipeline()
+    record_completed_call(pipe, utc(2025, 3, 1, 11, 45), "completed", "client", {"ttft": ttft})
+    record_completed_call(pipe, utc(2025, 3, 1, 10, 30), "failed", "client", {"ttft": ttft})
+
+    async def last_hour(now):
+        return await load_aggregates(redis_client, trailing_window_keys(now, 3600))
+
+    # Just after the hour turns, the 11:45 call is still within the last hour
+    bucket = asyncio.run(last_hour(utc(2025, 3, 1, 12, 0, 5)))
+    assert bucket.calls == 1 and bucket.completed == 1
+    assert bucket.histograms["ttft"].count == 1
+
+    # ... and it slides out of the window an hour after it started
+    assert asyncio.run(last_hour(utc(2025, 3, 1, 12, 46))).calls == 0
+
+    bucket = asyncio.run(load_aggregates(redis_client, trailing_window_keys(utc(2025, 3, 2, 10, 40), 24 * 3600)))
+    assert bucket.calls == 1 and bucket.completed == 1
+
+
+if __name__ == "__main__":
+    test_trailing_hour_at_bucket_boundary()
+    test_trailing_day_at_bucket_boundary()
+    test_last_hour_does_not_reset_at_the_hour()
+    print("✅ Aggregate window tests passed")
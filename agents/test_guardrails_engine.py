@@ -0,0 +1,81 @@
+import sys
+import os
+import re
+import tempfile
+import textwrap
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from guardrails.engine import GuardrailsEngine, _search_pattern
+
+
+def make_engine(validators: str, input_rails, output_rails) -> GuardrailsEngine:
+    config_path = tempfile.mkdtemp()
+    with open(os.path.join(config_path, "guardrails.yaml"), "w") as f:
+        f.write(textwrap.dedent(validators))
+    with open(os.path.join(config_path, "prompt.yaml"), "w") as f:
+        f.write("rails:\n  input: [%s]\n  output: [%s]\n" % (", ".join(input_rails), ", ".join(output_rails)))
+    return GuardrailsEngine(config_path=config_path)
+
+
+def test_search_pattern_strips_only_greedy_wildcards():
+    assert _search_pattern(".*kill.*") == "kill"
+    assert _search_pattern(".*.*kill") == "kill"
+    # Lazy / possessive / counted wildcards are not just a prefix: stripping ".*" would leave "?foo"
+    for pattern in (".*?foo", ".*+foo", ".*{2}foo", ".**foo"):
+        assert _search_pattern(pattern) == pattern
+    # An escaped dot is a literal, "\\\\" is an escaped backslash in front of a wildcard
+    assert _search_pattern(r"end\.*") == r"end\.*"
+    assert _search_pattern(r"end\\.*") == r"end\\"
+    # Backreferences are left as written
+    assert _search_pattern(r".*(\w)\1.*") == r".*(\w)\1.*"
+    assert _search_pattern(r".*(?P<c>\w)(?P=c).*") == r".*(?P<c>\w)(?P=c).*"
+
+
+def test_stripped_patterns_compile_and_match_the_same():
+    texts = ["", "foo", "xx foo yy", "bar", "aab", "end.", "end\\"]
+    for pattern in (".*?foo", ".*+foo", ".*foo.*", r".*(\w)\1.*", r"end\.*", r"end\\.*"):
+        stripped = re.compile(_search_pattern(pattern))
+        original = re.compile(pattern)
+        for text in texts:
+            assert bool(stripped.search(text)) == bool(original.search(text)), (pattern, text)
+
+
+def test_engine_loads_lazy_possessive_and_backreference_patterns():
+    engine = make_engine("""
+        validators:
+          - name: lazy
+            type: regex
+            parameters:
+              patterns: [".*?forbidden", ".*+secret"]
+          - name: repeated
+            type: regex
+            parameters:
+              patterns: ['.*(\\w)\\1\\1.*']
+          - name: plain
+            type: regex
+            parameters:
+              patterns: [".*badword.*"]
+              ignore_case: true
+    """, ["lazy", "repeated", "plain"], ["plain", "repeated"])
+
+    assert engine.validate_input("hello there")["is_safe"]
+    assert engine.validate_input("this is forbidden")["blocked_by"] == ["lazy"]
+    assert engine.validate_input("BadWord")["blocked_by"] == ["plain"]
+    # A combined matcher would have renumbered \\1 to another validator's group
+    assert engine.validate_input("zzz")["blocked_by"] == ["repeated"]
+    assert engine.validate_input("abc")["is_safe"]
+    assert engine.first_violation("zzz") == "repeated"
+
+    scanner = engine.output_scanner()
+    assert scanner.feed("all good so far, ") is None
+    assert scanner.feed("then aaa") == "repeated"
+    scanner = engine.output_scanner()
+    assert scanner.feed("a BAD") is None
+    assert scanner.feed("WORD") == "plain"
+
+
+if __name__ == "__main__":
+    test_search_pattern_strips_only_greedy_wildcards()
+    test_stripped_patterns_compile_and_match_the_same()
+    test_engine_loads_lazy_possessive_and_backreference_patterns()
+    print("✅ Guardrails engine tests passed")
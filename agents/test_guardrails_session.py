@@ -0,0 +1,88 @@
+import sys
+import os
+import asyncio
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from livekit.agents import Agent
+from livekit.agents.metrics import LLMMetrics
+from livekit.plugins import silero
+
+import agent as agent_module
+from guardrails.engine import GuardrailsEngine
+from guardrails.guardrails import GuardrailsMetrics
+from test_guardrails_stream import FakeLLM
+
+
+class FakeProviders:
+    def llm(self):
+        return FakeLLM()
+
+    def stt(self, **kwargs):
+        return None
+
+    def tts(self, **kwargs):
+        return None
+
+
+class RecordingFlusher:
+    def __init__(self):
+        self.events = []
+
+    def submit(self, call_id, metrics):
+        self.events.append((call_id, metrics))
+        return True
+
+
+def test_session_turn_records_guardrails_metrics():
+    proc = SimpleNamespace(userdata={"vad": silero.VAD.load(), "guardrails_engine": GuardrailsEngine()})
+    flusher = RecordingFlusher()
+    agent_module.metrics_flusher = flusher
+    agent_module.current_call_id = "test-call"
+
+    async def run_turn():
+        session, guardrails_llm = agent_module.create_session(proc, FakeProviders())
+        assert session.llm is guardrails_llm
+        await session.start(agent=Agent(instructions="You are a helpful assistant."))
+        try:
+            await session.generate_reply(user_input="What are your opening hours?")
+        finally:
+            await session.aclose()
+
+    try:
+        asyncio.run(run_turn())
+    finally:
+        agent_module.metrics_flusher = None
+        agent_module.current_call_id = None
+
+    recorded = [metrics for call_id, metrics in flusher.events if isinstance(metrics, GuardrailsMetrics)]
+    assert len(recorded) == 1
+    assert recorded[0].speculative and not recorded[0].blocked
+    assert recorded[0].verdict_source == "engine"
+    assert all(call_id == "test-call" for call_id, _ in flusher.events)
+
+
+def test_session_receives_llm_metrics_once_per_turn():
+    proc = SimpleNamespace(userdata={"vad": silero.VAD.load(), "guardrails_engine": GuardrailsEngine()})
+    collected = []
+
+    async def run_turn():
+        session, _ = agent_module.create_session(proc, FakeProviders())
+        session.on("metrics_collected", lambda event: collected.append(event.metrics))
+        await session.start(agent=Agent(instructions="You are a helpful assistant."))
+        try:
+            await session.generate_reply(user_input="What are your opening hours?")
+        finally:
+            await session.aclose()
+
+    asyncio.run(run_turn())
+
+    llm_metrics = [metrics for metrics in collected if isinstance(metrics, LLMMetrics)]
+    assert len(llm_metrics) == 1
+    assert llm_metrics[0].ttft > 0
+
+
+if __name__ == "__main__":
+    test_session_turn_records_guardrails_metrics()
+    test_session_receives_llm_metrics_once_per_turn()
+    print("✅ Guardrails session test passed")
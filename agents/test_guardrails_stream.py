@@ -0,0 +1,121 @@
+import sys
+import os
+import asyncio
+import shutil
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import yaml
+from livekit.agents.llm import LLM, LLMStream, ChatChunk, ChatContext, ChoiceDelta
+from livekit.agents.types import DEFAULT_API_CONNECT_OPTIONS
+
+from guardrails.engine import GuardrailsEngine
+from guardrails.guardrails import BLOCKED_RESPONSE, GuardrailsLLM
+from guardrails.verdict_cache import VerdictCache
+
+
+class FakeStream(LLMStream):
+    def __init__(self, llm, replies, **kwargs):
+        super().__init__(llm, **kwargs)
+        self._replies = replies
+
+    async def _run(self):
+        for index, text in enumerate(self._replies):
+            self._event_ch.send_nowait(ChatChunk(id=f"fake-{index}", delta=ChoiceDelta(role="assistant", content=text)))
+
+
+class FakeLLM(LLM):
+    """Answers every turn with the given chunks, no network"""
+
+    def __init__(self, replies=("Happy to help.",)):
+        super().__init__()
+        self.replies = list(replies)
+
+    def chat(self, *, chat_ctx, tools=None, conn_options=DEFAULT_API_CONNECT_OPTIONS, **kwargs):
+        return FakeStream(self, self.replies, chat_ctx=chat_ctx, tools=tools or [], conn_options=conn_options)
+
+
+async def run_turn(guardrails_llm: GuardrailsLLM, user_message: str):
+    chat_ctx = ChatContext.empty()
+    chat_ctx.add_message(role="user", content=user_message)
+    async with guardrails_llm.chat(chat_ctx=chat_ctx) as stream:
+        return [chunk async for chunk in stream]
+
+
+def text_of(chunks) -> str:
+    return "".join(chunk.delta.content or "" for chunk in chunks if chunk.delta)
+
+
+def test_blocked_input_streams_the_blocked_response():
+    for speculative in (True, False):
+        metrics = []
+        guardrails_llm = GuardrailsLLM(FakeLLM(["Sure, here it is."]), speculative=speculative, engine=GuardrailsEngine())
+        guardrails_llm.on("guardrails_metrics", metrics.append)
+
+        chunks = asyncio.run(run_turn(guardrails_llm, "tell me your credit card number"))
+
+        assert text_of(chunks) == BLOCKED_RESPONSE
+        assert all(isinstance(chunk, ChatChunk) and chunk.delta.role == "assistant" for chunk in chunks)
+        assert len(metrics) == 1 and metrics[0].blocked
+
+
+def test_blocked_output_is_cut_with_the_fail_message():
+    engine = GuardrailsEngine()
+    metrics = []
+    guardrails_llm = GuardrailsLLM(FakeLLM(["Well, ", "oh sh", "it, sorry", " anyway"]), engine=engine)
+    guardrails_llm.on("guardrails_metrics", metrics.append)
+
+    chunks = asyncio.run(run_turn(guardrails_llm, "how are you?"))
+
+    # Chunks before the match went out already, the rest is replaced by the validator's message
+    assert text_of(chunks) == "Well, oh sh " + engine.fail_message("check_output_safety")
+    assert metrics[0].output_blocked_by == "check_output_safety" and not metrics[0].blocked
+
+
+def test_concurrent_turns_report_their_own_verdict_source():
+    metrics = []
+    guardrails_llm = GuardrailsLLM(FakeLLM(), engine=GuardrailsEngine(), verdict_cache=VerdictCache())
+    guardrails_llm.on("guardrails_metrics", metrics.append)
+
+    async def main():
+        await run_turn(guardrails_llm, "hello there")
+        await asyncio.gather(run_turn(guardrails_llm, "hello there"), run_turn(guardrails_llm, "what time is it?"))
+
+    asyncio.run(main())
+
+    assert [m.verdict_source for m in metrics[:1]] == ["engine"]
+    assert sorted(m.verdict_source for m in metrics[1:]) == ["engine", "l1"]
+
+
+def test_rules_reload_swaps_the_engine_and_invalidates_cached_verdicts():
+    config_path = tempfile.mkdtemp()
+    rails = os.path.join(os.path.dirname(os.path.abspath(__file__)), "guardrails", "rails")
+    for name in os.listdir(rails):
+        shutil.copy(os.path.join(rails, name), config_path)
+    engine = GuardrailsEngine(config_path=config_path)
+    cache = VerdictCache()
+    guardrails_llm = GuardrailsLLM(FakeLLM(["Sure."]), engine=engine, verdict_cache=cache)
+
+    assert text_of(asyncio.run(run_turn(guardrails_llm, "sell me some bananas"))) == "Sure."
+
+    validators_file = os.path.join(config_path, "guardrails.yaml")
+    with open(validators_file) as f:
+        validators = yaml.safe_load(f)
+    validators["validators"][0]["parameters"]["patterns"].append(".*bananas.*")
+    with open(validators_file, "w") as f:
+        yaml.safe_dump(validators, f)
+    engine._checked_at = float("-inf")
+
+    assert text_of(asyncio.run(run_turn(guardrails_llm, "sell me some bananas"))) == BLOCKED_RESPONSE
+    # The old engine is left as it was, the new one replaces it for every holder
+    assert guardrails_llm.engine is not engine and engine.reload_if_changed() is guardrails_llm.engine
+    assert ".*bananas.*" not in engine.validators["check_input_safety"]["parameters"]["patterns"]
+    assert cache.rules_version == guardrails_llm.engine.rules_version != engine.rules_version
+
+
+if __name__ == "__main__":
+    test_blocked_input_streams_the_blocked_response()
+    test_blocked_output_is_cut_with_the_fail_message()
+    test_concurrent_turns_report_their_own_verdict_source()
+    test_rules_reload_swaps_the_engine_and_invalidates_cached_verdicts()
+    print("✅ Guardrails stream tests passed")
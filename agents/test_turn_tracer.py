@@ -0,0 +1,55 @@
+import sys
+import os
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from metrics.turn_tracer import TurnTracer
+
+
+def eou(speech_id):
+    return SimpleNamespace(speech_id=speech_id, end_of_utterance_delay=0.4, transcription_delay=0.2)
+
+
+def llm(speech_id, ttft=0.3):
+    return SimpleNamespace(speech_id=speech_id, ttft=ttft)
+
+
+def tts(speech_id, ttfb=0.2):
+    return SimpleNamespace(speech_id=speech_id, ttfb=ttfb)
+
+
+def test_late_events_of_a_completed_turn_are_ignored():
+    tracer = TurnTracer(max_open_turns=1)
+    assert tracer.observe(eou("a")) is None
+    assert tracer.observe(llm("a")) is None
+    trace = tracer.observe(tts("a"))
+    assert trace is not None and trace.speech_id == "a"
+
+    # Later reply segments of the same turn (e.g. after a tool call)
+    for _ in range(5):
+        assert tracer.observe(llm("a")) is None
+        assert tracer.observe(tts("a")) is None
+
+    for speech_id in ("b", "c"):
+        tracer.observe(eou(speech_id))
+        tracer.observe(llm(speech_id))
+        assert tracer.observe(tts(speech_id)) is not None
+
+    assert tracer.completed_turns == 3
+    assert tracer.evicted_turns == 0
+
+
+def test_completed_turns_are_remembered_within_bounds():
+    tracer = TurnTracer(max_completed_turns=2)
+    for speech_id in ("a", "b", "c"):
+        tracer.observe(eou(speech_id))
+        tracer.observe(llm(speech_id))
+        tracer.observe(tts(speech_id))
+
+    assert list(tracer._completed_ids) == ["b", "c"]
+
+
+if __name__ == "__main__":
+    test_late_events_of_a_completed_turn_are_ignored()
+    test_completed_turns_are_remembered_within_bounds()
+    print("✅ Turn tracer tests passed")
@@ -0,0 +1,114 @@
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, Tuple
+
+logger = logging.getLogger("circuit-breaker")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open"""
+
+
+class CircuitBreaker:
+    """Rolling-window circuit breaker for one HTTP dependency
+
+    Calls inside the last `window_seconds` are kept; once at least
+    `min_calls` are in the window and either the error rate or the rate of
+    calls slower than `slow_call_seconds` reaches its threshold, the circuit
+    opens and calls are rejected without touching the network for
+    `cooldown_seconds`. After that a single probe is let through (half-open):
+    success closes the circuit, failure opens it for another cooldown.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window_seconds: float = 30.0,
+        min_calls: int = 5,
+        error_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 1.0,
+        slow_rate_threshold: float = 0.5,
+        cooldown_seconds: float = 10.0,
+    ):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate_threshold = slow_rate_threshold
+        self.cooldown_seconds = cooldown_seconds
+
+        self.state = CLOSED
+        self.trips = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._calls: Deque[Tuple[float, bool, bool]] = deque()  # (timestamp, failed, slow)
+
+    def allow(self) -> bool:
+        """Whether a call may go out now (claims the half-open probe slot if so)"""
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.cooldown_seconds:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+            logger.info(f"🔌 Circuit {self.name} half-open, probing")
+
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected += 1
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record(self, success: bool, latency: float):
+        """Record the outcome of a call that `allow()` let through"""
+        now = time.monotonic()
+        slow = latency >= self.slow_call_seconds
+
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+            if success and not slow:
+                self.state = CLOSED
+                self._calls.clear()
+                logger.info(f"✅ Circuit {self.name} closed")
+            else:
+                self._trip(now)
+            return
+
+        self._calls.append((now, not success, slow))
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
+
+        if self.state == CLOSED and len(self._calls) >= self.min_calls:
+            failed = sum(1 for _, is_failed, _ in self._calls if is_failed)
+            slow_calls = sum(1 for _, _, is_slow in self._calls if is_slow)
+            if (failed / len(self._calls) >= self.error_rate_threshold
+                    or slow_calls / len(self._calls) >= self.slow_rate_threshold):
+                self._trip(now)
+
+    def cancel(self):
+        """The call `allow()` let through was abandoned before it had an outcome"""
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+
+    def _trip(self, now: float):
+        self.state = OPEN
+        self._opened_at = now
+        self.trips += 1
+        self._calls.clear()
+        logger.warning(f"⚡ Circuit {self.name} opened for {self.cooldown_seconds:.0f}s (trip #{self.trips})")
+
+    def stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "trips": self.trips,
+            "rejected": self.rejected,
+            "window_calls": len(self._calls),
+        }
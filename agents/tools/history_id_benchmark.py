@@ -0,0 +1,116 @@
+# tools/history_id_benchmark.py - Transcript publish throughput with global vs local history ids
+#
+# Publishes transcript messages from many concurrent rooms against the Redis at
+# REDIS_HOST and reports messages per second for:
+#   - legacy:        INCR global:history_id, then PUBLISH, then LPUSH (three round trips)
+#   - stream+INCR:   one script call that still INCRs the shared global:history_id key
+#   - stream+local:  publish_transcript with locally generated ids (current code)
+# It also checks that the local ids came out unique and increasing per room.
+# All keys are written under bench-* rooms and deleted afterwards.
+#
+# Usage (from agents/): python tools/history_id_benchmark.py [--rooms 50] [--messages 200]
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from agent_assist.history_ids import history_ids
+from agent_assist import redis_functions
+from agent_assist.redis_functions import (
+    ROOM_STREAM_LIVE_TTL_SECONDS, ROOM_STREAM_MAXLEN, publish_transcript, r, room_last_id_key, room_stream,
+)
+
+BENCH_ID_KEY = "bench:global:history_id"
+
+# The stream script as it was before local ids: the id comes from one shared counter
+GLOBAL_INCR_SCRIPT = r.register_script("""
+local history_id = redis.call('INCR', KEYS[1])
+local payload = '{"history_id": ' .. history_id .. ', ' .. ARGV[1]
+local stream_id = redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[2], '*', 'data', payload)
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+redis.call('PUBLISH', ARGV[4], '{"stream_id": "' .. stream_id .. '", ' .. string.sub(payload, 2))
+return {history_id, stream_id}
+""")
+
+
+def message_data(room_id: str, index: int) -> dict:
+    return {"timestamp": int(time.time() * 1000), "room_id": room_id, "speaker": "user", "message": f"benchmark message {index}"}
+
+
+async def publish_legacy(room_id: str, index: int):
+    data = dict(message_data(room_id, index), history_id=await r.incr(BENCH_ID_KEY))
+    await r.publish(room_id, json.dumps(data))
+    await r.lpush(f"bench_history:{room_id}", json.dumps(data))
+
+
+async def publish_global_incr(room_id: str, index: int):
+    await GLOBAL_INCR_SCRIPT(
+        keys=[BENCH_ID_KEY, room_stream(room_id)],
+        args=[json.dumps(message_data(room_id, index))[1:], ROOM_STREAM_MAXLEN, ROOM_STREAM_LIVE_TTL_SECONDS, room_id],
+    )
+
+
+async def publish_local(room_id: str, index: int):
+    await publish_transcript(room_id, "user", f"benchmark message {index}")
+
+
+async def run(publish, rooms, messages: int) -> float:
+    async def room_loop(room_id):
+        for index in range(messages):
+            await publish(room_id, index)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(room_loop(room_id) for room_id in rooms))
+    return len(rooms) * messages / (time.perf_counter() - start)
+
+
+async def check_room_ids(rooms) -> bool:
+    for room_id in rooms:
+        ids = [json.loads(fields["data"])["history_id"] for _, fields in await r.xrange(room_stream(room_id))]
+        if any(later <= earlier for earlier, later in zip(ids, ids[1:])):
+            return False
+    return True
+
+
+async def cleanup(rooms):
+    keys = [BENCH_ID_KEY]
+    for room_id in rooms:
+        keys += [room_stream(room_id), room_last_id_key(room_id), f"bench_history:{room_id}"]
+    await r.delete(*keys)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Measure transcript publish throughput with global vs local history ids")
+    parser.add_argument("--rooms", type=int, default=50, help="concurrent rooms")
+    parser.add_argument("--messages", type=int, default=200, help="messages per room")
+    args = parser.parse_args()
+
+    rooms = [f"bench-{index}" for index in range(args.rooms)]
+    print("🎯 History id benchmark")
+    print("=" * 40)
+    print(f"Redis: {redis_functions.redis_host}, {args.rooms} rooms x {args.messages} messages")
+
+    start = time.perf_counter()
+    for _ in range(100_000):
+        history_ids.next_id()
+    print(f"{'local id generation':<22} {100_000 / (time.perf_counter() - start):>12,.0f} ids/s")
+
+    try:
+        for name, publish in [("legacy (3 round trips)", publish_legacy),
+                              ("stream + global INCR", publish_global_incr),
+                              ("stream + local ids", publish_local)]:
+            await cleanup(rooms)
+            rate = await run(publish, rooms, args.messages)
+            print(f"{name:<22} {rate:>12,.0f} msgs/s")
+        print(f"Local ids unique and increasing per room: {'✅' if await check_room_ids(rooms) else '❌'}")
+    finally:
+        await cleanup(rooms)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,253 @@
+import asyncio
+import contextvars
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from tools.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+logger = logging.getLogger("tool-http")
+
+# Total timeout per tool/endpoint in seconds, anything else gets DEFAULT_TIMEOUT
+DEFAULT_TIMEOUT = 5.0
+ENDPOINT_TIMEOUTS = {
+    "customer_exists": 5.0,
+    "guardrails_validate": 3.0,
+}
+
+# Response cache TTL per tool in seconds (tools not listed are never cached)
+CACHE_TTLS = {
+    "customer_exists": 300.0,
+}
+CACHE_MAX_ENTRIES = 1000  # per call
+
+# Circuit breaker settings per tool (see CircuitBreaker), anything else gets the defaults
+BREAKER_SETTINGS = {
+    "guardrails_validate": {"slow_call_seconds": 0.5, "cooldown_seconds": 15.0},
+}
+
+# Total time a single user turn may spend waiting on guardrails + tool HTTP calls
+TURN_LATENCY_BUDGET = 2.0
+
+
+class LatencyBudgetExceeded(asyncio.TimeoutError):
+    """The current turn has no latency budget left for another dependency call"""
+
+
+class TurnLatencyBudget:
+    """Time a user turn may spend on external dependencies, reset on every user turn
+
+    Calls made while the budget is active get at most the remaining budget as
+    timeout, and are skipped once it is used up.
+    """
+
+    def __init__(self, limit: float = TURN_LATENCY_BUDGET):
+        self.limit = limit
+        self.spent = 0.0
+        self.exhausted_turns = 0
+        self._exhausted = False
+
+    def reset(self):
+        self.spent = 0.0
+        self._exhausted = False
+
+    def remaining(self) -> float:
+        return max(0.0, self.limit - self.spent)
+
+    def consume(self, seconds: float):
+        self.spent += seconds
+        if not self._exhausted and self.spent >= self.limit:
+            self._exhausted = True
+            self.exhausted_turns += 1
+
+
+# Set per call in the job entrypoint; tasks spawned by the session inherit it
+current_turn_budget: contextvars.ContextVar[Optional[TurnLatencyBudget]] = contextvars.ContextVar(
+    "current_turn_budget", default=None
+)
+
+# The call (room) the response cache is scoped to, set like current_turn_budget;
+# responses are never cached outside of a call
+current_call_scope: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "current_call_scope", default=None
+)
+
+
+@dataclass
+class ToolCallMetric:
+    """One HTTP-backed tool invocation, reported to listeners"""
+    tool: str
+    latency: float
+    cache_hit: bool
+    success: bool
+    skipped: Optional[str] = None  # "circuit_open" or "budget_exhausted" when never sent
+    breaker_state: str = "closed"
+    breaker_trips: int = 0
+
+
+class ToolHttpClient:
+    """Process-wide pooled HTTP client for agent function tools
+
+    One keep-alive aiohttp session is shared by every tool call in the
+    process, with per-endpoint timeouts and an optional TTL response cache
+    per call (current_call_scope), keyed on tool name + arguments. Each tool has its own CircuitBreaker and
+    every call is charged to the current TurnLatencyBudget, if any. Every
+    call is reported to the registered listeners as a ToolCallMetric.
+    """
+
+    def __init__(self, connection_limit: int = 100, keepalive_timeout: float = 60):
+        self.connection_limit = connection_limit
+        self.keepalive_timeout = keepalive_timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._caches: Dict[str, Dict[str, Tuple[float, Tuple[int, Any]]]] = {}
+        self._listeners: List[Callable[[ToolCallMetric], None]] = []
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    def add_listener(self, listener: Callable[[ToolCallMetric], None]):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[ToolCallMetric], None]):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def breaker(self, tool: str) -> CircuitBreaker:
+        if tool not in self.breakers:
+            self.breakers[tool] = CircuitBreaker(tool, **BREAKER_SETTINGS.get(tool, {}))
+        return self.breakers[tool]
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._session_loop = loop
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.connection_limit,
+                    keepalive_timeout=self.keepalive_timeout,
+                )
+            )
+        return self._session
+
+    async def post_json(self, tool: str, url: str, payload: Dict, use_cache: bool = True) -> Tuple[int, Any]:
+        """POST a JSON payload, returning (status, decoded JSON body or None)
+
+        Successful (200) responses are cached for CACHE_TTLS[tool] seconds.
+        Network errors and timeouts are raised to the caller, as are
+        CircuitOpenError and LatencyBudgetExceeded when the call is skipped.
+        """
+        start = time.perf_counter()
+        call_scope = current_call_scope.get()
+        ttl = CACHE_TTLS.get(tool) if use_cache and call_scope else None
+        cache_key = f"{tool}:{json.dumps(payload, sort_keys=True)}" if ttl else None
+        cache = self._caches.setdefault(call_scope, {}) if cache_key else None
+
+        if cache_key:
+            cached = cache.get(cache_key)
+            if cached and cached[0] > time.monotonic():
+                self._report(tool, start, cache_hit=True, success=True)
+                return cached[1]
+
+        breaker = self.breaker(tool)
+        budget = current_turn_budget.get()
+        timeout_seconds = ENDPOINT_TIMEOUTS.get(tool, DEFAULT_TIMEOUT)
+        if budget is not None:
+            if budget.remaining() <= 0:
+                self._report(tool, start, cache_hit=False, success=False, skipped="budget_exhausted")
+                raise LatencyBudgetExceeded(f"Turn latency budget of {budget.limit}s used up, skipping {tool}")
+            timeout_seconds = min(timeout_seconds, budget.remaining())
+        if not breaker.allow():
+            self._report(tool, start, cache_hit=False, success=False, skipped="circuit_open")
+            raise CircuitOpenError(f"Circuit for {tool} is open, skipping call")
+
+        timeout = aiohttp.ClientTimeout(total=timeout_seconds)
+        try:
+            async with self._get_session().post(url, json=payload, timeout=timeout) as response:
+                try:
+                    data = await response.json(content_type=None)
+                except (json.JSONDecodeError, aiohttp.ContentTypeError):
+                    data = None
+                result = (response.status, data)
+        except asyncio.CancelledError:
+            # Interrupted by the caller (e.g. the user barged in), says nothing about the dependency
+            breaker.cancel()
+            self._settle(tool, start, None, budget, success=False)
+            raise
+        except BaseException:
+            self._settle(tool, start, breaker, budget, success=False)
+            raise
+
+        # 4xx is the caller's problem, only server errors count against the dependency
+        self._settle(tool, start, breaker, budget, success=result[0] == 200, healthy=result[0] < 500)
+        if cache_key and result[0] == 200:
+            if len(cache) >= CACHE_MAX_ENTRIES:
+                self._evict_expired(cache)
+            cache[cache_key] = (time.monotonic() + ttl, result)
+        return result
+
+    def end_call(self, call_scope: str):
+        """Drop the response cache of a call that has ended"""
+        self._caches.pop(call_scope, None)
+
+    @staticmethod
+    def _evict_expired(cache: Dict[str, Tuple[float, Tuple[int, Any]]]):
+        now = time.monotonic()
+        for key in [k for k, (expires, _) in cache.items() if expires <= now]:
+            del cache[key]
+        # Still full: drop the oldest inserted entries
+        while len(cache) >= CACHE_MAX_ENTRIES:
+            del cache[next(iter(cache))]
+
+    def _settle(
+        self,
+        tool: str,
+        start: float,
+        breaker: Optional[CircuitBreaker],
+        budget: Optional[TurnLatencyBudget],
+        success: bool,
+        healthy: Optional[bool] = None,
+    ):
+        latency = time.perf_counter() - start
+        if breaker is not None:
+            breaker.record(success if healthy is None else healthy, latency)
+        if budget is not None:
+            budget.consume(latency)
+        self._report(tool, start, cache_hit=False, success=success)
+
+    def _report(self, tool: str, start: float, cache_hit: bool, success: bool, skipped: Optional[str] = None):
+        breaker = self.breaker(tool)
+        metric = ToolCallMetric(
+            tool=tool,
+            latency=time.perf_counter() - start,
+            cache_hit=cache_hit,
+            success=success,
+            skipped=skipped,
+            breaker_state=breaker.state,
+            breaker_trips=breaker.trips,
+        )
+
+        stats = self.stats.setdefault(tool, {"calls": 0, "cache_hits": 0, "errors": 0, "skipped": 0, "total_latency": 0.0})
+        stats["calls"] += 1
+        stats["cache_hits"] += int(cache_hit)
+        stats["errors"] += int(not success and not skipped)
+        stats["skipped"] += int(bool(skipped))
+        stats["total_latency"] += metric.latency
+
+        for listener in self._listeners:
+            try:
+                listener(metric)
+            except Exception as e:
+                logger.warning(f"Tool metrics listener failed: {e}")
+
+    async def aclose(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session_loop = None
+
+
+# Shared by every tool and guardrails call in the worker process
+tool_http = ToolHttpClient()
@@ -427,11 +427,12 @@ import logging
 from typing import Annotated
 from livekit import api, rtc
 from livekit.agents import Agent, function_tool, RunContext, JobContext
-import aiohttp
 import os
 from dotenv import load_dotenv
-import subprocess
 from agent_assist.identify_free_agent import *
+from tools.sip_utils import wait_for_agent_speech_done
+from tools.http_client import tool_http, LatencyBudgetExceeded
+from tools.circuit_breaker import CircuitOpenError
 
 load_dotenv(dotenv_path=".env.local")
 event_id = os.getenv("EVENT_TYPE_ID")
@@ -447,6 +448,10 @@ lk_sip_outbound_trunk_id = os.getenv("SIP_OUTBOUND_TRUNK_ID")
 
 logger = logging.getLogger("outbound-caller")
 
+HUMAN_AGENT_IDENTITY = "human-agent"
+HUMAN_AGENT_JOIN_TIMEOUT = 5  # seconds
+TRANSFER_MESSAGE_TIMEOUT = 15  # seconds to wait for the transfer message to be spoken
+
 class CallAgent(Agent):
 
     # def __init__(self, ctx: JobContext):
@@ -457,8 +462,15 @@ class CallAgent(Agent):
     def __init__(self, instructions: str, ctx: JobContext):
         super().__init__(instructions=instructions)
         self.ctx = ctx
+        self._background_tasks = set()  # referenced until done, so they are not garbage-collected mid-flight
         # self.register_tools()
 
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
 
     @function_tool()
     async def end_call(self, context: RunContext):
@@ -481,125 +493,118 @@ class CallAgent(Agent):
         """Checks if a customer exists in the database."""
         logger.info(f"Checking existence of customer ID: {customer_id}")
         url = f"{base_url}/customer_exists/"
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(url, json={"customer_id": customer_id}) as response:
-                    logger.info(f"Response from API: {response.status}")
-                    if response.status == 200:
-                        data = await response.json()
-                        return data
-                    else:
-                        logger.error(f"Error from API: {response.status}")
-                        return {"error": "Failed to fetch customer details."}
-            except Exception as e:
-                logger.error(f"Exception in customer_exists: {e}")
-                return {"error": "Internal error occurred."}
+        try:
+            status, data = await tool_http.post_json("customer_exists", url, {"customer_id": customer_id})
+            logger.info(f"Response from API: {status}")
+            if status == 200:
+                return data
+            else:
+                logger.error(f"Error from API: {status}")
+                return {"error": "Failed to fetch customer details."}
+        except (CircuitOpenError, LatencyBudgetExceeded) as e:
+            logger.warning(f"Skipped customer_exists: {e}")
+            return {"error": "Customer lookup is temporarily unavailable."}
+        except Exception as e:
+            logger.error(f"Exception in customer_exists: {e}")
+            return {"error": "Internal error occurred."}
             
     
 
     @function_tool()
     async def transfer_to_human_agent(
         self, 
+        context: RunContext,
         # agent_phone: Annotated[str, "The phone number of the human agent to call"]
     ):
         """
         Transfers the call to a human agent by calling their phone number and connecting them to the same room.
         Use this when the customer needs to speak to a human agent.
         """
-        logger.info(f"Transferring to human agent in room {self.room.name}")
-        room_name = self.room.name
-        CMD = [
-                "lk", "room", "participants", "list", room_name,
-                "--api-key", lk_api_key,
-                "--api-secret", lk_api_secret,
-                "--url", lk_url,
-            ]
-
-        cmd_result = subprocess.run(CMD, check=True, capture_output=True, text=True)
-        participants = cmd_result.stdout.splitlines()
-        agent_participant = [p for p in participants if p.strip().startswith("agent-")]
-        correct_identity = agent_participant[0].split()[0] if agent_participant else None
-        logger.info(f"Participants in room {self.room.name}: {participants}")
-
-        #Get the free agent.
-        agent_phone = free_human_agent()
-
+        room = self.ctx.room
+        logger.info(f"Transferring to human agent in room {room.name}")
 
-        
         try:
-            # Create a SIP participant for the human agent
-            async with api.LiveKitAPI(
-                url=lk_url,
-                api_key=lk_api_key,
-                api_secret=lk_api_secret,
-            ) as lkapi:
-                # Add the human agent to the room via SIP
+            # Shared LiveKitAPI client of the job, no CLI round trips on the event loop
+            lkapi = self.ctx.api
+
+            # Lease a free agent from the shared registry, nobody else can get them until released
+            free_agent = await free_human_agent(holder=room.name)
+            if not free_agent["status"]:
+                logger.warning(f"No free human agent for room {room.name}")
+                return "I'm sorry, all of our agents are busy right now. Let's continue our conversation and I'll do my best to help."
+            lease = free_agent["lease"]
+            agent_phone = free_agent["payload"]["phone"]
+
+            # Add the human agent to the room via SIP
+            try:
                 await lkapi.sip.create_sip_participant(
                     api.CreateSIPParticipantRequest(
-                        room_name=self.room.name,
+                        room_name=room.name,
                         sip_trunk_id=lk_sip_outbound_trunk_id,  # Use your SIP trunk ID
                         sip_call_to=agent_phone,  # The phone number to dial
-                        participant_identity="human-agent",  # Fixed identity for the human agent
+                        participant_identity=HUMAN_AGENT_IDENTITY,  # Fixed identity for the human agent
                     )
                 )
-                logger.info(f"Created SIP participant for human agent with phone {agent_phone}")
-                
-                # Wait for human agent to connect
-                await asyncio.sleep(3)
-                
-                # Inform the customer about the transfer
-                transfer_message = "I'm transferring you to a human agent who can better assist you. Please hold while I connect you."
-                
-                # After transfer message is delivered, set AI agent to inactive 
-                # (you can also remove the AI agent if preferred)
-                async def after_transfer():
-                    await asyncio.sleep(5)  # Wait for message to be delivered
-                    
-                    # Either mute the AI agent or remove it altogether
-                    # Option 1: Mark AI agent as inactive but keep it in the room
+            except Exception:
+                await lease.release()
+                raise
+            logger.info(f"Created SIP participant for human agent with phone {agent_phone}")
+
+            # Hold the agent for as long as the call runs, release on hangup
+            lease.keep_alive()
+            self.ctx.add_shutdown_callback(lease.release)
+
+            def on_participant_disconnected(participant: rtc.RemoteParticipant):
+                if participant.identity == HUMAN_AGENT_IDENTITY:
+                    room.off("participant_disconnected", on_participant_disconnected)
+                    self._spawn(lease.release())
+
+            room.on("participant_disconnected", on_participant_disconnected)
+
+            # Wait for the human agent's SIP participant to join (dialing has started)
+            try:
+                await asyncio.wait_for(
+                    self.ctx.wait_for_participant(identity=HUMAN_AGENT_IDENTITY),
+                    timeout=HUMAN_AGENT_JOIN_TIMEOUT,
+                )
+            except asyncio.TimeoutError:
+                logger.warning(f"Human agent did not join within {HUMAN_AGENT_JOIN_TIMEOUT}s, continuing transfer")
+
+            # Inform the customer about the transfer
+            transfer_message = "I'm transferring you to a human agent who can better assist you. Please hold while I connect you."
+
+            # After transfer message is delivered, set AI agent to inactive 
+            # (you can also remove the AI agent if preferred)
+            async def after_transfer():
+                try:
+                    await wait_for_agent_speech_done(context.session, timeout=TRANSFER_MESSAGE_TIMEOUT)
+
+                    # Mark AI agent as inactive but keep it in the room
                     await lkapi.room.update_participant(
                         api.UpdateParticipantRequest(
-                            room=self.room.name,
-                            identity=self.room.local_participant.identity,
+                            room=room.name,
+                            identity=room.local_participant.identity,
                             metadata=json.dumps({"status": "inactive"}),
                         )
                     )
                     logger.info("AI agent marked as inactive")
+                except Exception as e:
+                    logger.error(f"Error marking AI agent inactive after transfer: {e}")
 
+                # Option 2: Remove AI agent completely (uncomment if preferred)
+                # await lkapi.room.remove_participant(
+                #     api.RoomParticipantIdentity(
+                #         room=room.name,
+                #         identity=room.local_participant.identity,
+                #     )
+                # )
+                # logger.info("AI agent removed from room")
+
+            # Start the after-transfer process
+            self._spawn(after_transfer())
+
+            return transfer_message
 
-    #Use this below option to remove the AI agent completely
-                #     async with api.LiveKitAPI(
-                #         url=lk_url,
-                #         api_key=lk_api_key,
-                #         api_secret=lk_api_secret
-                #     ) as lkapi:
-                #         # 2. Remove the current participant from the room
-                #         logger.info(f"Removing participant {correct_identity} from room {room_name}")
-                #         await lkapi.room.update_participant(UpdateParticipantRequest(
-                #             room=room_name,
-                #             identity=correct_identity,
-                #             permission=ParticipantPermission(
-                #                 can_subscribe=False,
-                #                 can_publish=False,
-                #                 can_publish_data=False,
-                #             ),
-                #             ))
-                # logger.info("Main agent's metadata updated to set 'muted' flag.")
-                    
-                    # Option 2: Remove AI agent completely (uncomment if preferred)
-                    # await lkapi.room.remove_participant(
-                    #     api.RoomParticipantIdentity(
-                    #         room=self.room.name,
-                    #         identity=self.room.local_participant.identity,
-                    #     )
-                    # )
-                    # logger.info("AI agent removed from room")
-                
-                # Start the after-transfer process
-                asyncio.create_task(after_transfer())
-                
-                return transfer_message
-                
         except Exception as e:
             logger.error(f"Error transferring to human agent: {e}")
             return "I apologize, but I'm unable to transfer you to a human agent at this time. Let's continue our conversation."
@@ -0,0 +1,105 @@
+# tools/output_rail_benchmark.py - Per-chunk overhead of streaming output guardrails
+#
+# Feeds a realistic agent reply, split into LLM-sized chunks, through the
+# output-rail scanner of GuardrailsEngine and reports the scan cost per chunk
+# next to the inter-token interval at the given token rate. For comparison it
+# also times rescanning the whole accumulated response on every chunk and shows
+# the TTS time-to-first-byte a wait-for-full-response check would add.
+#
+# Usage (from agents/): python tools/output_rail_benchmark.py [--token-rate 50] [--runs 200]
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from guardrails.engine import GuardrailsEngine
+
+REPLY = (
+    "Thank you for calling. I can see that your savings account ending in 4821 has an available "
+    "balance of twenty four thousand rupees. Your last transaction was a transfer of two thousand "
+    "rupees on the fifth of this month. If you would like, I can also help you block a lost card, "
+    "update your registered mobile number, or explain the interest rates on fixed deposits. "
+    "Please let me know how else I can assist you today, and remember never to share your PIN "
+    "or one time password with anyone, including bank staff. "
+) * 2
+CHARS_PER_TOKEN = 4
+
+
+def chunk_text(text: str, chars_per_chunk: int = CHARS_PER_TOKEN):
+    return [text[i:i + chars_per_chunk] for i in range(0, len(text), chars_per_chunk)]
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def time_incremental(engine: GuardrailsEngine, chunks, runs: int):
+    samples = []
+    for _ in range(runs):
+        scanner = engine.output_scanner()
+        for chunk in chunks:
+            start = time.perf_counter()
+            scanner.feed(chunk)
+            samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def time_full_rescan(engine: GuardrailsEngine, chunks, runs: int):
+    samples = []
+    for _ in range(runs):
+        seen = ""
+        for chunk in chunks:
+            seen += chunk
+            start = time.perf_counter()
+            engine._output_matcher.search(seen)
+            samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def check_boundary_detection(engine: GuardrailsEngine) -> bool:
+    """A violation split across two chunks must stop the stream at the second one"""
+    chunks = ["Let me be honest, this is ", "sh", "it and ", "more text"]
+    scanner = engine.output_scanner()
+    for index, chunk in enumerate(chunks):
+        if scanner.feed(chunk):
+            return index == 2
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure per-chunk overhead of streaming output rails")
+    parser.add_argument("--token-rate", type=float, default=50, help="LLM tokens per second")
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    engine = GuardrailsEngine()
+    if engine.output_scanner() is None:
+        print("❌ No output rails configured (rails.output in prompt.yaml)")
+        return
+
+    chunks = chunk_text(REPLY)
+    token_interval_us = 1e6 / args.token_rate
+
+    print("🎯 Output rail streaming benchmark")
+    print("=" * 40)
+    print(f"Reply: {len(REPLY)} chars in {len(chunks)} chunks, {args.token_rate:.0f} tok/s "
+          f"({token_interval_us / 1000:.1f} ms between chunks)")
+
+    for name, runner in [("incremental (carry-over)", time_incremental), ("full rescan per chunk", time_full_rescan)]:
+        samples = runner(engine, chunks, args.runs)
+        mean = statistics.mean(samples)
+        print(f"{name:<26} mean {mean:6.2f} us  p50 {percentile(samples, 50):6.2f} us  "
+              f"p99 {percentile(samples, 99):6.2f} us  ({mean / token_interval_us * 100:.3f}% of token interval)")
+
+    full_response_ms = len(chunks) / args.token_rate * 1000
+    print(f"{'wait for full response':<26} +{full_response_ms:.0f} ms TTS time-to-first-byte")
+    print(f"Boundary-spanning violation cut within one chunk: {'✅' if check_boundary_detection(engine) else '❌'}")
+
+
+if __name__ == "__main__":
+    main()
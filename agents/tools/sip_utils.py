@@ -0,0 +1,69 @@
+import asyncio
+import logging
+
+from livekit import rtc
+
+logger = logging.getLogger("outbound-caller")
+
+
+async def wait_for_call_answer(room: rtc.Room, participant: rtc.RemoteParticipant, timeout: float) -> str:
+    """Wait for sip.callStatus to turn active, driven by room events instead of polling.
+
+    Returns "active", "rejected", "unavailable" or "timeout".
+    """
+    def current_status():
+        if participant.attributes.get("sip.callStatus") == "active":
+            return "active"
+        if participant.disconnect_reason == rtc.DisconnectReason.USER_REJECTED:
+            return "rejected"
+        if participant.disconnect_reason == rtc.DisconnectReason.USER_UNAVAILABLE:
+            return "unavailable"
+        return None
+
+    changed = asyncio.Event()
+
+    def on_participant_event(*args):
+        changed.set()
+
+    room.on("participant_attributes_changed", on_participant_event)
+    room.on("participant_disconnected", on_participant_event)
+    try:
+        deadline = asyncio.get_running_loop().time() + timeout
+        while True:
+            changed.clear()
+            status = current_status()
+            if status:
+                return status
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                return "timeout"
+            try:
+                await asyncio.wait_for(changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return "timeout"
+    finally:
+        room.off("participant_attributes_changed", on_participant_event)
+        room.off("participant_disconnected", on_participant_event)
+
+
+async def wait_for_agent_speech_done(session, timeout: float) -> bool:
+    """Wait until the agent has started speaking and then stopped (False on timeout)"""
+    done = asyncio.Event()
+    spoke = False
+
+    def on_agent_state_changed(event):
+        nonlocal spoke
+        if event.new_state == "speaking":
+            spoke = True
+        elif spoke:
+            done.set()
+
+    session.on("agent_state_changed", on_agent_state_changed)
+    try:
+        await asyncio.wait_for(done.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        logger.warning(f"Agent did not finish speaking within {timeout}s")
+        return False
+    finally:
+        session.off("agent_state_changed", on_agent_state_changed)
@@ -0,0 +1,172 @@
+# tools/transfer_stall_benchmark.py - Event-loop stall regression benchmark for call transfer
+#
+# Runs CallAgent.transfer_to_human_agent against an in-process fake LiveKit API
+# while a ticker task measures how late the event loop wakes it up. Any blocking
+# call inside the transfer (e.g. shelling out to the lk CLI) shows up as a stall
+# for every other call handled by the same worker.
+#
+# Usage (from agents/): python tools/transfer_stall_benchmark.py [--api-latency 0.15] [--runs 5]
+
+import argparse
+import asyncio
+import logging
+import subprocess
+import sys
+import os
+import time
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger("transfer_benchmark")
+
+TICK_INTERVAL = 0.005  # 5 ms, roughly one audio frame batch
+
+
+class LoopStallMonitor:
+    """Measures event-loop lag by scheduling a periodic ticker"""
+
+    def __init__(self, interval: float = TICK_INTERVAL):
+        self.interval = interval
+        self.max_stall = 0.0
+        self.total_stall = 0.0
+        self._task = None
+
+    async def _tick(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            self.max_stall = max(self.max_stall, lag)
+            self.total_stall += lag
+
+    def __enter__(self):
+        self._task = asyncio.create_task(self._tick())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+
+class FakeLiveKitAPI:
+    """Async stand-in for LiveKitAPI with a fixed per-request latency"""
+
+    def __init__(self, latency: float):
+        async def request(*args, **kwargs):
+            await asyncio.sleep(latency)
+            return SimpleNamespace(participants=[SimpleNamespace(identity="agent-benchmark")])
+
+        self.room = SimpleNamespace(list_participants=request, update_participant=request)
+        self.sip = SimpleNamespace(create_sip_participant=request)
+
+
+class FakeSession:
+    """Emits speaking -> listening shortly after a listener subscribes"""
+
+    def __init__(self, speech_duration: float):
+        self.speech_duration = speech_duration
+
+    def on(self, event, callback):
+        async def speak():
+            callback(SimpleNamespace(new_state="speaking"))
+            await asyncio.sleep(self.speech_duration)
+            callback(SimpleNamespace(new_state="listening"))
+        asyncio.get_running_loop().create_task(speak())
+
+    def off(self, event, callback):
+        pass
+
+
+class InMemoryLease:
+    """Stand-in for AgentLease, the benchmark needs no Redis registry"""
+
+    def __init__(self, holder: str):
+        self.holder = holder
+        self.released = False
+
+    def keep_alive(self):
+        pass
+
+    async def release(self) -> bool:
+        self.released = True
+        return True
+
+
+async def fake_free_human_agent(use_case=None, holder="", lease_seconds=None):
+    return {
+        "status": True,
+        "payload": {"name": "benchmark", "phone": "+10000000000", "agent_id": "agent-benchmark-human"},
+        "msg": "Success",
+        "lease": InMemoryLease(holder),
+    }
+
+
+def make_ctx(api_latency: float):
+    async def wait_for_participant(identity=None):
+        await asyncio.sleep(api_latency)
+        return SimpleNamespace(identity=identity)
+
+    shutdown_callbacks = []
+    room = SimpleNamespace(
+        name="benchmark-room",
+        local_participant=SimpleNamespace(identity="agent-benchmark"),
+        on=lambda event, callback=None: callback,
+    )
+    return SimpleNamespace(
+        api=FakeLiveKitAPI(api_latency),
+        room=room,
+        wait_for_participant=wait_for_participant,
+        add_shutdown_callback=shutdown_callbacks.append,
+        shutdown_callbacks=shutdown_callbacks,
+    )
+
+
+async def run_cli_baseline(cli_latency: float) -> LoopStallMonitor:
+    """Previous behaviour: a synchronous CLI round trip inside the async tool"""
+    with LoopStallMonitor() as monitor:
+        await asyncio.sleep(0.05)
+        subprocess.run(["sleep", str(cli_latency)], check=True)
+        await asyncio.sleep(0.05)
+    return monitor
+
+
+async def run_async_transfer(api_latency: float) -> LoopStallMonitor:
+    from tools import llm_functions
+
+    # Lease from memory instead of the Redis registry
+    llm_functions.free_human_agent = fake_free_human_agent
+    ctx = make_ctx(api_latency)
+    agent = llm_functions.CallAgent(instructions="benchmark", ctx=ctx)
+    context = SimpleNamespace(session=FakeSession(speech_duration=api_latency))
+
+    with LoopStallMonitor() as monitor:
+        reply = await agent.transfer_to_human_agent(context)
+        await asyncio.sleep(api_latency * 3)  # let after_transfer finish
+    for callback in ctx.shutdown_callbacks:
+        await callback()
+    # The tool answers every failure with an apology, which would make the run measure nothing
+    if "transferring you" not in reply:
+        raise RuntimeError(f"Transfer did not go through: {reply}")
+    return monitor
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Measure event-loop stall during call transfer")
+    parser.add_argument("--api-latency", type=float, default=0.15, help="Simulated LiveKit API latency (s)")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print("🎯 Transfer event-loop stall benchmark")
+    print("=" * 40)
+
+    for name, runner in [("lk CLI (blocking)", run_cli_baseline), ("LiveKitAPI (async)", run_async_transfer)]:
+        stalls = []
+        for _ in range(args.runs):
+            monitor = await runner(args.api_latency)
+            stalls.append(monitor.max_stall * 1000)
+        print(f"{name:<22} max stall: {max(stalls):7.1f} ms   mean of max: {sum(stalls) / len(stalls):7.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
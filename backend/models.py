@@ -1,10 +1,10 @@
 import os
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Float, JSON, Boolean, ForeignKey
+from sqlalchemy import create_engine, Column, BigInteger, Integer, String, DateTime, Text, Float, JSON, Boolean, ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy import Index, UniqueConstraint
+from sqlalchemy import Index, UniqueConstraint, inspect, text
 import uuid
 
 # Database configuration - supports both PostgreSQL and SQLite
@@ -100,6 +100,7 @@ class Call(Base):
     synced_from_redis = Column(Boolean, default=False)
     last_sync_time = Column(DateTime)
     sync_source = Column(String(50))  # 'auto_sync', 'manual_sync', 'webhook'
+    last_stream_id = Column(String(64))  # Offset in room_stream:{call_id} synced up to (Redis' clock)
     
     
     # Relationships
@@ -230,7 +231,7 @@ class TranscriptSegment(Base):
     call_id = Column(Integer, ForeignKey("calls.id"), nullable=False)
     
     # Segment details
-    history_id = Column(Integer, index=True)  # From Redis data
+    history_id = Column(BigInteger, index=True)  # From Redis data (time-ordered 53-bit ids)
     timestamp = Column(DateTime, index=True)
     speaker = Column(String(50), index=True)  # 'user', 'agent', 'llm', etc.
     message = Column(Text)
@@ -327,8 +328,23 @@ class CallMetricsDetail(Base):
 
 # Database initialization functions
 def create_database():
-    """Create all tables"""
+    """Create all tables, then bring existing ones up to the current models"""
     Base.metadata.create_all(bind=engine)
+    upgrade_database()
+
+def upgrade_database():
+    """Idempotent schema changes create_all does not make to existing tables"""
+    inspector = inspect(engine)
+    columns = {column["name"] for column in inspector.get_columns("calls")}
+    segment_columns = {column["name"]: column["type"] for column in inspector.get_columns("transcript_segments")}
+    with engine.begin() as connection:
+        if "last_stream_id" not in columns:
+            connection.execute(text("ALTER TABLE calls ADD COLUMN last_stream_id VARCHAR(64)"))
+        # 53-bit history ids overflow int4 (SQLite integers are 64-bit already)
+        history_id_type = segment_columns.get("history_id")
+        if (engine.dialect.name == "postgresql" and isinstance(history_id_type, Integer)
+                and not isinstance(history_id_type, BigInteger)):
+            connection.execute(text("ALTER TABLE transcript_segments ALTER COLUMN history_id TYPE BIGINT"))
 
 def get_db():
     """Get database session"""
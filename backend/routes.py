@@ -15,7 +15,7 @@ from models import (
 )
 from auth import get_current_user
 from services import RedisService, CallAnalyticsService
-from services import enhanced_sync_service, enhanced_redis_service
+from services import enhanced_sync_service, enhanced_redis_service, history_range_start
 
 router = APIRouter(prefix="/api/v1", tags=["Call Center API"])
 
@@ -128,14 +128,14 @@ async def get_sync_candidates(
         # Get additional details for each candidate
         candidate_details = []
         for room_id in candidates[:20]:  # Limit to first 20 for performance
-            transcript_data = await enhanced_redis_service.get_room_history(room_id)
+            transcript_messages = await enhanced_redis_service.get_room_history_length(room_id)
             metrics_data = await enhanced_redis_service.get_enhanced_metrics(room_id)
             
             candidate_details.append({
                 "room_id": room_id,
-                "has_transcript": len(transcript_data) > 0,
+                "has_transcript": transcript_messages > 0,
                 "has_metrics": len(metrics_data) > 0,
-                "transcript_messages": len(transcript_data),
+                "transcript_messages": transcript_messages,
                 "metrics_events": {
                     "llm_calls": len(metrics_data.get('llm_metrics', [])),
                     "tts_calls": len(metrics_data.get('tts_metrics', [])),
@@ -153,6 +153,30 @@ async def get_sync_candidates(
         logger.error(f"❌ Error getting sync candidates: {e}")
         raise HTTPException(status_code=500, detail=f"Candidates check failed: {str(e)}")
 
+@router.get("/rooms/{room_id}/history")
+async def get_room_history_delta(
+    room_id: str,
+    since: Optional[str] = Query(None, description="stream_id or history_id of the last message already seen"),
+    limit: int = Query(500, ge=1, le=2000),
+    current_user: dict = Depends(get_current_user)
+):
+    """Transcript messages of a room published after the `since` cursor"""
+    if not enhanced_redis_service or not enhanced_redis_service.is_connected:
+        raise HTTPException(status_code=503, detail="Enhanced Redis service not available")
+    try:
+        history_range_start(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="since must be a stream_id or a history_id")
+    
+    messages = await enhanced_redis_service.get_room_history(room_id, since=since, count=limit)
+    
+    return {
+        "room_id": room_id,
+        "messages": messages,
+        "count": len(messages),
+        "next_cursor": messages[-1]["stream_id"] if messages else since
+    }
+
 @router.post("/sync/room/{room_id}")
 async def sync_specific_room(
     room_id: str,
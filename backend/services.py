@@ -2,6 +2,8 @@
 
 import redis
 import json
+import os
+import sys
 import asyncio
 import aioredis
 from datetime import datetime, timedelta
@@ -16,6 +18,45 @@ from models import (
     SessionLocal, Agent, Client
 )
 
+try:
+    # Mounted next to this module in the container (docker-compose.yml)
+    from history_ids import history_range_start
+except ImportError:  # running from a checkout
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agents", "agent_assist"))
+    from history_ids import history_range_start
+
+# Transcript streams written by agents/agent_assist/redis_functions.py
+ROOM_STREAM_PREFIX = "room_stream:"
+
+def parse_stream_entries(entries) -> List[Dict]:
+    """Decode (stream_id, {"data": json}) entries into messages carrying their stream_id"""
+    messages = []
+    for stream_id, fields in entries:
+        try:
+            message = json.loads(fields["data"])
+        except (KeyError, TypeError, json.JSONDecodeError):
+            continue
+        message["stream_id"] = stream_id
+        messages.append(message)
+    return messages
+
+async def read_room_stream(redis_client, room_id: str, since=None, count: Optional[int] = None) -> List[Dict]:
+    """Messages of a room's transcript stream after the `since` cursor, oldest first
+    
+    Reads from the cursor on, so a repeat read costs O(new messages).
+    """
+    start, after_history_id = history_range_start(since)
+    stream_key = f"{ROOM_STREAM_PREFIX}{room_id}"
+    while True:
+        entries = await redis_client.xrange(stream_key, min=start, max="+", count=count)
+        messages = parse_stream_entries(entries)
+        if after_history_id is not None:
+            messages = [m for m in messages if (m.get('history_id') or 0) > after_history_id]
+        # Only entries inside the clock skew margin were read, keep going
+        if messages or not count or len(entries) < count:
+            return messages
+        start = f"({entries[-1][0]}"
+
 class RedisService:
     """Service for interacting with Redis data from agents"""
     
@@ -38,26 +79,13 @@ class RedisService:
             print(f"Redis connection failed: {e}")
             return False
     
-    async def get_room_history(self, room_id: str) -> List[Dict]:
-        """Get transcript history for a room from Redis"""
+    async def get_room_history(self, room_id: str, since=None) -> List[Dict]:
+        """Get transcript history for a room from Redis (only after `since` if given)"""
         if not self.redis_client:
             await self.connect()
         
         try:
-            history_key = f"room_history:{room_id}"
-            messages = await self.redis_client.lrange(history_key, 0, -1)
-            
-            parsed_messages = []
-            for msg in messages:
-                try:
-                    parsed = json.loads(msg)
-                    parsed_messages.append(parsed)
-                except json.JSONDecodeError:
-                    continue
-            
-            # Sort by timestamp
-            parsed_messages.sort(key=lambda x: x.get('timestamp', 0))
-            return parsed_messages
+            return await read_room_stream(self.redis_client, room_id, since)
             
         except Exception as e:
             print(f"Error getting room history: {e}")
@@ -83,16 +111,19 @@ class RedisService:
     async def sync_call_from_redis(self, room_id: str, db: Session) -> Optional[Call]:
         """Sync call data from Redis to database"""
         
-        # Get transcript history
-        history = await self.get_room_history(room_id)
-        if not history:
-            return None
-        
         # Check if call already exists
         call = db.query(Call).filter(
             (Call.call_id == room_id) | (Call.room_name == room_id)
         ).first()
         
+        # Only the transcript entries after the ones already synced
+        since = call.last_stream_id if call else None
+        if not self.redis_client:
+            await self.connect()
+        history = await read_room_stream(self.redis_client, room_id, since, count=500)
+        if not history:
+            return None
+        
         if not call:
             # Create new call
             call = Call(
@@ -145,6 +176,7 @@ class RedisService:
                 )
                 db.add(metrics)
         
+        call.last_stream_id = history[-1]['stream_id']
         db.commit()
         return call
     
@@ -320,14 +352,14 @@ class DataSyncService:
             return
         
         try:
-            # Get all room history keys
-            keys = await self.redis_service.redis_client.keys("room_history:*")
+            # Get all room transcript streams
+            keys = [key async for key in self.redis_service.redis_client.scan_iter(match=f"{ROOM_STREAM_PREFIX}*")]
             
             db = SessionLocal()
             synced_count = 0
             
             for key in keys:
-                room_id = key.replace("room_history:", "")
+                room_id = key[len(ROOM_STREAM_PREFIX):]
                 
                 try:
                     call = await self.redis_service.sync_call_from_redis(room_id, db)
@@ -461,27 +493,23 @@ class EnhancedRedisService:
     def is_connected(self) -> bool:
         return self._connected
     
-    async def get_room_history(self, room_id: str) -> List[Dict[str, Any]]:
-        """Get transcript history for a room"""
+    async def get_room_history(self, room_id: str, since=None, count: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Get transcript history for a room, only the entries after the `since`
+        cursor (a stream_id or history_id) if given"""
         try:
-            history_key = f"room_history:{room_id}"
-            messages = await self.transcript_redis.lrange(history_key, 0, -1)
-            
-            parsed_messages = []
-            for msg in messages:
-                try:
-                    parsed = json.loads(msg)
-                    parsed_messages.append(parsed)
-                except json.JSONDecodeError:
-                    continue
-            
-            parsed_messages.sort(key=lambda x: x.get('timestamp', 0))
-            return parsed_messages
+            return await read_room_stream(self.transcript_redis, room_id, since, count)
             
         except Exception as e:
             logger.error(f"❌ Error getting room history: {e}")
             return []
     
+    async def get_room_history_length(self, room_id: str) -> int:
+        try:
+            return await self.transcript_redis.xlen(f"{ROOM_STREAM_PREFIX}{room_id}")
+        except Exception as e:
+            logger.error(f"❌ Error getting room history length: {e}")
+            return 0
+    
     async def get_enhanced_metrics(self, call_id: str) -> Dict[str, Any]:
         """Get enhanced metrics for a call"""
         try:
@@ -500,8 +528,10 @@ class EnhancedRedisService:
         """Get all room IDs that need syncing"""
         try:
             # Get transcript room IDs
-            transcript_keys = await self.transcript_redis.keys("room_history:*")
-            transcript_rooms = {key.replace("room_history:", "") for key in transcript_keys}
+            transcript_rooms = {
+                key[len(ROOM_STREAM_PREFIX):]
+                async for key in self.transcript_redis.scan_iter(match=f"{ROOM_STREAM_PREFIX}*")
+            }
             
             # Get metrics call IDs
             metrics_keys = await self.metrics_redis.keys("enhanced_metrics:call:*")
@@ -634,11 +664,20 @@ class EnhancedSyncService:
             logger.error(f"❌ Sync failed: {e}")
             return {"status": "error", "error": str(e)}
     
+    def synced_stream_cursor(self, room_id: str) -> Optional[str]:
+        """Stream offset of the last transcript entry synced for the room's call"""
+        db = SessionLocal()
+        try:
+            return db.query(Call.last_stream_id).filter(Call.call_id == room_id).scalar()
+        finally:
+            db.close()
+    
     async def sync_room_data(self, room_id: str) -> SyncResult:
         """Sync data for a specific room"""
         try:
-            # Get data from Redis
-            transcript_data = await self.enhanced_redis.get_room_history(room_id)
+            # Get data from Redis: only transcript entries newer than the call's synced ones
+            since = self.synced_stream_cursor(room_id)
+            transcript_data = await self.enhanced_redis.get_room_history(room_id, since=since)
             metrics_data = await self.enhanced_redis.get_enhanced_metrics(room_id)
             
             if not transcript_data and not metrics_data:
@@ -697,6 +736,7 @@ class EnhancedSyncService:
                             )
                             db.add(segment)
                             records_created += 1
+                    call.last_stream_id = transcript_data[-1]['stream_id']
                 
                 # Sync metrics data
                 if metrics_data:
@@ -708,16 +748,22 @@ class EnhancedSyncService:
                         tts_metrics = metrics_data.get('tts_metrics', [])
                         
                         avg_ttft = 0
-                        if llm_metrics:
+                        llm_calls = metrics_data.get('llm_calls', len(llm_metrics))
+                        tts_calls = metrics_data.get('tts_calls', len(tts_metrics))
+                        ttft_histogram = (metrics_data.get('histograms') or {}).get('llm_ttft')
+                        if ttft_histogram:
+                            # Compact records: llm_metrics is only a ring of recent events
+                            avg_ttft = ttft_histogram['sum'] / ttft_histogram['count'] if ttft_histogram['count'] else 0
+                        elif llm_metrics:
                             ttfts = [m.get('ttft', 0) for m in llm_metrics if m.get('ttft', 0) > 0]
                             avg_ttft = sum(ttfts) / len(ttfts) if ttfts else 0
                         
                         metrics = CallMetrics(
                             call_id=call.id,
-                            llm_calls=len(llm_metrics),
+                            llm_calls=llm_calls,
                             avg_ttft=avg_ttft,
-                            tts_calls=len(tts_metrics),
-                            total_interactions=len(llm_metrics) + len(tts_metrics),
+                            tts_calls=tts_calls,
+                            total_interactions=llm_calls + tts_calls,
                             additional_metrics=metrics_data
                         )
                         db.add(metrics)